@@ -13,6 +13,10 @@ python3 manage.py update_index --remove --settings=soundcloud.settings.prod
 python3 manage.py check --deploy --settings=soundcloud.settings.prod
 
 pkill -f gunicorn
+pkill -f run_tasks
+pkill -f flush_plays
+nohup python3 manage.py run_tasks --settings=soundcloud.settings.prod > run_tasks.log 2>&1 &
+nohup python3 manage.py flush_plays --settings=soundcloud.settings.prod > flush_plays.log 2>&1 &
 gunicorn soundcloud.wsgi --bind 127.0.0.1:8000 --daemon
 sudo nginx -t
 sudo service nginx restart
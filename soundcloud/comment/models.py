@@ -1,7 +1,11 @@
 from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth import get_user_model
 from soundcloud.utils import assign_object_perms
+from track import charts
 from track.models import Track
+from user.models import UserStats
+import time
 
 
 class CustomCommentManager(models.Manager):
@@ -11,6 +15,10 @@ class CustomCommentManager(models.Manager):
         kwargs['group'] = kwargs.get('group') or Group.objects.create(track=kwargs.get('track'))
         instance = super().create(**kwargs)
         assign_object_perms(instance.writer, instance)
+        Track._base_manager.filter(id=instance.track_id).update(comment_count=F('comment_count') + 1)
+        UserStats.update_counts(instance.writer_id, comment_count=1)
+        event = (instance.track_id, instance.track.genre_id, 'comment', 1, time.time())
+        transaction.on_commit(lambda: charts.record_events([event]))
 
         return instance
 
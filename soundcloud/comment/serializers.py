@@ -1,12 +1,18 @@
 from django.db import transaction
+from django.db.models import F
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
 from comment.models import Comment, Group
+from soundcloud.utils import PresignedUrlListSerializer, PresignedUrlMixin
+from track import charts
+from track.models import Track
 from track.serializers import CommentTrackSerializer
+from user.models import UserStats
 from user.serializers import SimpleUserSerializer
+import time
 
 
-class TrackCommentSerializer(serializers.ModelSerializer):
+class TrackCommentSerializer(PresignedUrlMixin, serializers.ModelSerializer):
 
     writer = SimpleUserSerializer(read_only=True)
     group = serializers.PrimaryKeyRelatedField(queryset=Group.objects.all(), required=False)
@@ -21,6 +27,7 @@ class TrackCommentSerializer(serializers.ModelSerializer):
             'created_at',
             'commented_at',
         )
+        list_serializer_class = PresignedUrlListSerializer
         read_only_fields = (
             'created_at',
             'commented_at',
@@ -42,7 +49,12 @@ class TrackCommentSerializer(serializers.ModelSerializer):
     def delete(self):
         comment = self.instance
         group = comment.group
-        comment.delete()
+        deleted, _ = comment.delete()
+        if deleted:
+            Track._base_manager.filter(id=comment.track_id).update(comment_count=F('comment_count') - 1)
+            UserStats.update_counts(comment.writer_id, comment_count=-1)
+            event = (comment.track_id, self.context['track'].genre_id, 'comment', -1, time.time())
+            transaction.on_commit(lambda: charts.record_events([event]))
 
         if not group.comments.exists():
             group.delete()
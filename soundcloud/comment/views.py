@@ -24,16 +24,15 @@ class CommentViewSet(mixins.CreateModelMixin,
 
     def get_queryset(self):
         
-        # hide private tracks in the queryset
+        # hide private tracks and unfinished uploads in the queryset
         user = self.request.user if self.request.user.is_authenticated else None
-        track_queryset = Track.objects.exclude(~Q(artist=user) & Q(is_private=True))
+        track_queryset = Track.objects.exclude(~Q(artist=user) & (Q(is_private=True) | Q(status=Track.PENDING)))
 
         self.track = getattr(self, 'track', None) or get_object_or_404(track_queryset, id=self.kwargs['track_id'])
 
         if self.action in ['list']:
             return Comment.objects\
-                .select_related('writer')\
-                .prefetch_related('writer__followers', 'writer__owned_tracks')\
+                .select_related('writer__stats')\
                 .filter(track=self.track)
 
         return Comment.objects.filter(track=self.track)
@@ -42,9 +41,9 @@ class CommentViewSet(mixins.CreateModelMixin,
     def get_serializer_context(self):
         context = super().get_serializer_context()
 
-        # hide private tracks in the queryset
+        # hide private tracks and unfinished uploads in the queryset
         user = self.request.user if self.request.user.is_authenticated else None
-        track_queryset = Track.objects.exclude(~Q(artist=user) & Q(is_private=True))
+        track_queryset = Track.objects.exclude(~Q(artist=user) & (Q(is_private=True) | Q(status=Track.PENDING)))
         context['track'] = getattr(self, 'track', None) or get_object_or_404(track_queryset, id=self.kwargs['track_id'])
 
         return context
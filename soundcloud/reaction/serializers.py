@@ -1,14 +1,29 @@
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
 from rest_framework import serializers, status
 from rest_framework.exceptions import NotFound
 from reaction.models import Like, Repost
 from soundcloud.utils import ConflictError
+from track import charts
+from track.models import Track
+from user.models import UserStats
+import time
 
 
 class BaseReactionService(serializers.Serializer):
 
     reaction_type = None
+    count_field = None
+    chart_event = None
 
+    def update_count(self, target, delta):
+        type(target)._base_manager.filter(id=target.id).update(**{self.count_field: F(self.count_field) + delta})
+        if isinstance(target, Track):
+            event = (target.id, target.genre_id, self.chart_event, delta, time.time())
+            transaction.on_commit(lambda: charts.record_events([event]))
+
+    @transaction.atomic
     def create(self):
         user = self.context.get('request').user
         target = self.context.get('target')
@@ -17,18 +32,21 @@ class BaseReactionService(serializers.Serializer):
         if self.reaction_type.objects.filter(user=user, object_id=target.id, content_type=content_type).exists():
             raise ConflictError(f"User <{user}>'s reaction <{self.reaction_type.__name__}> to <{target}> already exists.")
         self.reaction_type.objects.create(user=user, content_object=target)
+        self.update_count(target, 1)
 
         return status.HTTP_201_CREATED, f"Reaction <{self.reaction_type.__name__}> created."
 
+    @transaction.atomic
     def delete(self):
         user = self.context.get('request').user
         target = self.context.get('target')
         content_type = ContentType.objects.get_for_model(target)
 
-        try:
-            self.reaction_type.objects.get(user=user, object_id=target.id, content_type=content_type).delete()
-        except self.reaction_type.DoesNotExist:
+        # only the request that actually deleted the row updates the counter
+        deleted, _ = self.reaction_type.objects.filter(user=user, object_id=target.id, content_type=content_type).delete()
+        if not deleted:
             raise NotFound(f"User <{user}>'s reaction <{self.reaction_type.__name__}> to <{target}> does not exist.")
+        self.update_count(target, -1)
 
         return status.HTTP_200_OK, f"Reaction <{self.reaction_type.__name__}> deleted."
 
@@ -36,8 +54,17 @@ class BaseReactionService(serializers.Serializer):
 class LikeService(BaseReactionService):
 
     reaction_type = Like
+    count_field = 'like_count'
+    chart_event = 'like'
+
+    def update_count(self, target, delta):
+        super().update_count(target, delta)
+        if isinstance(target, Track):
+            UserStats.update_counts(self.context.get('request').user.id, like_track_count=delta)
 
 
 class RepostService(BaseReactionService):
 
     reaction_type = Repost
+    count_field = 'repost_count'
+    chart_event = 'repost'
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('set', '0012_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='set',
+            name='duration',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:07
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def total(queryset, group_by, aggregate):
+    # a correlated subquery per counter, so that every set is filled by a single UPDATE
+    return Coalesce(Subquery(queryset.order_by().values(group_by).annotate(total=aggregate).values('total')), 0)
+
+
+def fill_counts(apps, schema_editor):
+    Set = apps.get_model('set', 'Set')
+    SetTrack = apps.get_model('set', 'SetTrack')
+    Like = apps.get_model('reaction', 'Like')
+    Repost = apps.get_model('reaction', 'Repost')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    counts = {
+        'track_count': total(SetTrack.objects.filter(set=OuterRef('pk')), 'set', Count('id')),
+    }
+    # reactions can only exist once the content type does
+    content_type = ContentType.objects.filter(app_label='set', model='set').first()
+    if content_type is not None:
+        reactions = {'like_count': Like, 'repost_count': Repost}
+        for name, model in reactions.items():
+            queryset = model.objects.filter(content_type=content_type, object_id=OuterRef('pk'))
+            counts[name] = total(queryset, 'object_id', Count('id'))
+
+    Set.objects.update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('reaction', '0003_auto_20211226_1111'),
+        ('set', '0013_set_duration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='set',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='set',
+            name='repost_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='set',
+            name='track_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
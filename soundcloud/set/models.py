@@ -17,11 +17,17 @@ class CustomSetManager(models.Manager):
 
     def get_queryset(self):
 
-        return super().get_queryset().annotate(
-            track_count=Count('tracks', distinct=True),
-            like_count=Count('likes', distinct=True),
-            repost_count=Count('reposts', distinct=True),
-        ).prefetch_related('creator__followers', 'creator__owned_tracks').select_related('creator')
+        return super().get_queryset().select_related('creator__stats')
+
+    def with_counts(self):
+        """
+        Annotates the counts computed from the related rows, to check the stored counters against.
+        """
+        return self.get_queryset().annotate(
+            live_track_count=Count('tracks', distinct=True),
+            live_like_count=Count('likes', distinct=True),
+            live_repost_count=Count('reposts', distinct=True),
+        )
 
 
 class Set(models.Model):
@@ -54,10 +60,18 @@ class Set(models.Model):
     reposts = GenericRelation(Repost, related_query_name="set") 
     players = models.ManyToManyField(get_user_model(), related_name="played_sets", through='SetHit')
     image = models.URLField(null=True, unique=True)
+    image_derivatives = models.BooleanField(default=False)     # whether the resized copies of the image exist
     tracks = models.ManyToManyField(Track, through='SetTrack', related_name='sets')
+    duration = models.BigIntegerField(default=0)    # total of the tracks in milliseconds, kept up to date by every change
+    track_count = models.IntegerField(default=0)
+    like_count = models.IntegerField(default=0)
+    repost_count = models.IntegerField(default=0)
 
     objects = CustomSetManager()
 
+    # maintained with F() updates by the write paths, see 'save'
+    COUNT_FIELDS = ('duration', 'track_count', 'like_count', 'repost_count')
+
     class Meta:
         constraints=[
             models.UniqueConstraint(
@@ -66,6 +80,15 @@ class Set(models.Model):
             ),
         ]
 
+    def save(self, *args, **kwargs):
+        # saving an instance loaded before a concurrent increment must not write the stale counters back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNT_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 class SetTrack(models.Model):
     set = models.ForeignKey(Set, related_name='set_tracks', on_delete=models.CASCADE)
     track = models.ForeignKey(Track, related_name='set_tracks', on_delete=models.CASCADE)
@@ -75,7 +98,7 @@ class SetTrack(models.Model):
 class SetHit(models.Model):
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, null=True)
     set = models.ForeignKey(Set, on_delete=models.CASCADE)
-    last_hit = models.DateTimeField(auto_now=True)
+    last_hit = models.DateTimeField()
 
     class Meta:
         ordering = ('-last_hit', )
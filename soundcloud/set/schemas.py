@@ -4,6 +4,9 @@ from set.serializers import *
 sets_viewset_schema = extend_schema_view( 
     list=extend_schema(
         summary="List of Sets",
+        parameters=[
+            OpenApiParameter("size", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Image size: 'small', 'medium', 'large' or 'original'."),
+        ],
         responses={
             200: OpenApiResponse(response=SimpleSetSerializer, description='OK'),
         }
@@ -38,6 +41,9 @@ sets_viewset_schema = extend_schema_view(
     ),
     retrieve=extend_schema(
         summary="Retrieve Set",
+        parameters=[
+            OpenApiParameter("size", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Image size: 'small', 'medium', 'large' or 'original'."),
+        ],
         responses={
             '200': OpenApiResponse(response=SetSerializer, description='OK'),
             '404': OpenApiResponse(description='Not Found')
@@ -73,7 +79,18 @@ sets_viewset_schema = extend_schema_view(
             '200': OpenApiResponse(response=SimpleUserSerializer(many=True), description='OK'),
             '404': OpenApiResponse(description='Not Found'),
         }
-    )
+    ),
+    finalize=extend_schema(
+        summary="Finalize Set Image Upload",
+        description="Call after uploading the image to the presigned URL. The image is removed if it was not uploaded.",
+        request=None,
+        responses={
+            '200': OpenApiResponse(response=SetSerializer, description='OK'),
+            '401': OpenApiResponse(description='Unauthorized'),
+            '403': OpenApiResponse(description='Permission Denied'),
+            '404': OpenApiResponse(description='Not Found'),
+        }
+    ),
 )
 
 sets_track_schema=extend_schema( 
@@ -1,23 +1,25 @@
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema_field
 from drf_haystack.serializers import HaystackSerializerMixin
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import F, Q
 from rest_framework import serializers, status
 from rest_framework.serializers import ValidationError
 from rest_framework.validators import UniqueTogetherValidator
 from track.models import Track
 from set.models import Set
 from user.models import Follow
-from soundcloud.utils import get_presigned_url, MediaUploadMixin
+from soundcloud.utils import MediaUploadMixin, PresignedUrlListSerializer, PresignedUrlMixin, clear_missing_media
 from tag.models import Tag
 from tag.serializers import TagSerializer
 from track.serializers import TrackInSetSerializer
 from user.serializers import SimpleUserSerializer
 from reaction.models import Like, Repost
 from set.search_indexes import SetIndex
+from utility.tasks import queue_image_derivatives
 
 
-class SetSerializer(serializers.ModelSerializer):
+class SetSerializer(PresignedUrlMixin, serializers.ModelSerializer):
     creator = SimpleUserSerializer(default=serializers.CurrentUserDefault(), read_only=True)
     image = serializers.SerializerMethodField()
     genre = TagSerializer(read_only=True)
@@ -47,6 +49,7 @@ class SetSerializer(serializers.ModelSerializer):
             'tags_input',
             'is_private',
             'track_count',
+            'duration',
             'like_count',
             'repost_count',
             'image',
@@ -56,6 +59,8 @@ class SetSerializer(serializers.ModelSerializer):
             'is_reposted',
             'is_followed', #for creator
         )        
+        presigned_fields = ('image', )
+        list_serializer_class = PresignedUrlListSerializer
         extra_kwargs = {
             'permalink': {
                 'max_length': 255,
@@ -64,6 +69,7 @@ class SetSerializer(serializers.ModelSerializer):
         }
         read_only_fields = (
             'created_at',
+            'duration',
         )
 
         # Since 'creator' is read-only field, ModelSerializer wouldn't generate UniqueTogetherValidator automatically.
@@ -76,13 +82,13 @@ class SetSerializer(serializers.ModelSerializer):
         ]
 
     def get_image(self, set):
-        return get_presigned_url(set.image, 'get_object')
+        return self.get_presigned_image_url(set, 'image')
 
     def get_tracks(self, set):
 
-        # hide private tracks in the queryset
+        # hide private tracks and unfinished uploads in the queryset
         user = self.context['request'].user if self.context['request'].user.is_authenticated else None
-        tracks = set.tracks.exclude(~Q(artist=user) & Q(is_private=True)).order_by('set_tracks__created_at')
+        tracks = set.tracks.exclude(~Q(artist=user) & (Q(is_private=True) | Q(status=Track.PENDING))).order_by('set_tracks__created_at')
 
         return TrackInSetSerializer(tracks, many=True, context=self.context).data
 
@@ -164,7 +170,7 @@ class SetMediaUploadSerializer(MediaUploadMixin, SetSerializer):
         return data
 
 
-class SimpleSetSerializer(serializers.ModelSerializer):
+class SimpleSetSerializer(PresignedUrlMixin, serializers.ModelSerializer):
     '''returns only first 5 tracks in the set'''
     creator = SimpleUserSerializer()
     image = serializers.SerializerMethodField()
@@ -188,6 +194,7 @@ class SimpleSetSerializer(serializers.ModelSerializer):
             'genre',
             'is_private',
             'track_count',
+            'duration',
             'like_count',
             'repost_count',
             'image',
@@ -196,16 +203,19 @@ class SimpleSetSerializer(serializers.ModelSerializer):
             'is_reposted',
             'created_at'
         )
+        presigned_fields = ('image', )
+        image_sizes = {'image': 'medium'}
+        list_serializer_class = PresignedUrlListSerializer
 
     def get_image(self, set):
-        return get_presigned_url(set.image, 'get_object')
+        return self.get_presigned_image_url(set, 'image')
 
     @extend_schema_field(TrackInSetSerializer(many=True))
     def get_tracks(self, set):
 
-        # hide private tracks in the queryset
+        # hide private tracks and unfinished uploads in the queryset
         user = self.context['request'].user if self.context['request'].user.is_authenticated else None
-        tracks = set.tracks.exclude(~Q(artist=user) & Q(is_private=True)).order_by('set_tracks__created_at')[:5]
+        tracks = set.tracks.exclude(~Q(artist=user) & (Q(is_private=True) | Q(status=Track.PENDING))).order_by('set_tracks__created_at')[:5]
 
         return TrackInSetSerializer(tracks, many=True, context=self.context).data
     
@@ -232,8 +242,24 @@ class SimpleSetSerializer(serializers.ModelSerializer):
             return False
 
 
+class SetFinalizeService(serializers.Serializer):
+    '''
+    Called after the image is uploaded to its presigned URL: drops the image if it never arrived.
+    '''
+
+    def execute(self):
+        set = self.instance
+        cleared = clear_missing_media(set, ['image'])
+        if cleared:
+            set.save(update_fields=cleared)
+        queue_image_derivatives(set, ['image'])
+
+        return status.HTTP_200_OK, SetSerializer(set, context=self.context).data
+
+
 class SetTrackService(serializers.Serializer):
 
+    @transaction.atomic
     def create(self):
         set = self.context['set']
         track_ids = self.context['track_ids']
@@ -254,10 +280,14 @@ class SetTrackService(serializers.Serializer):
             return status.HTTP_400_BAD_REQUEST, {"error": "이미 셋에 추가된 트랙이 있습니다."}
 
         set.tracks.add(*tracks)
-        set.save()
+        Set._base_manager.filter(id=set.id).update(
+            track_count=F('track_count') + len(tracks),
+            duration=F('duration') + sum(track.duration or 0 for track in tracks),
+        )
 
         return status.HTTP_200_OK, {"all added to playlist."}
     
+    @transaction.atomic
     def delete(self):
         set = self.context['set']
         track_ids = self.context['track_ids']
@@ -278,7 +308,10 @@ class SetTrackService(serializers.Serializer):
             return status.HTTP_400_BAD_REQUEST, {"error": "셋에 없는 트랙이 포함되어 있습니다."}
 
         set.tracks.remove(*tracks)
-        set.save()
+        Set._base_manager.filter(id=set.id).update(
+            track_count=F('track_count') - len(tracks),
+            duration=F('duration') - sum(track.duration or 0 for track in tracks),
+        )
         
         return status.HTTP_204_NO_CONTENT, None
       
@@ -287,3 +320,6 @@ class SetSearchSerializer(HaystackSerializerMixin, SetSerializer):
     class Meta(SetSerializer.Meta):
         index_classes = [SetIndex]
         search_fields = ('text', )
+
+    def prepare_presigned_urls(self, instances):
+        super().prepare_presigned_urls([getattr(result, 'object', result) for result in instances])
@@ -10,7 +10,7 @@ from rest_framework.mixins import ListModelMixin
 from set.models import Set
 from set.schemas import *
 from set.serializers import *
-from soundcloud.utils import CustomObjectPermissions
+from soundcloud.utils import CustomObjectPermissions, delete_media
 from user.models import User
 
 
@@ -30,6 +30,8 @@ class SetViewSet(viewsets.ModelViewSet):
             return SimpleUserSerializer
         if self.action in ['list']:
             return SimpleSetSerializer
+        if self.action in ['finalize']:
+            return SetFinalizeService
 
         return SetSerializer
 
@@ -49,6 +51,10 @@ class SetViewSet(viewsets.ModelViewSet):
             return querysets.get(self.action)
 
         return queryset
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        delete_media([instance.image])
       
     # 1. POST /sets/ - 빈 playlist 생성 - mixin 이용
     # 2. PUT /sets/{set_id} - mixin 이용
@@ -65,6 +71,14 @@ class SetViewSet(viewsets.ModelViewSet):
     def reposters(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    # 7. POST /sets/{set_id}/finalize
+    @action(detail=True, methods=['POST'])
+    def finalize(self, request, *args, **kwargs):
+        service = self.get_serializer(self.get_object())
+        status, data = service.execute()
+
+        return Response(status=status, data=data)
+
 
 @sets_track_schema
 class SetTrackViewSet(viewsets.GenericViewSet): 
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'soundcloud.settings')
 
 application = get_asgi_application()
+
+# parse the IP range database before the first request instead of during it
+from soundcloud.geoip import get_ip_table
+get_ip_table()
@@ -0,0 +1,104 @@
+"""
+Country of an IP address, from a local database of IP ranges at 'GEOIP_RANGES_PATH'.
+
+The database is a CSV (optionally gzipped) of 'first address,last address,country code' rows, e.g. the free
+"IP to Country Lite" of db-ip.com; addresses may also be given as integers, as in IP2Location LITE DB1. It is loaded
+once per process into sorted NumPy arrays, so that a lookup is a binary search of a few microseconds. The
+WSGI and ASGI applications load it at startup; other processes load it on their first lookup.
+IPv6 ranges are matched on the first 64 bits of the addresses, the finest prefix country databases allocate.
+"""
+from django.conf import settings
+import csv, functools, gzip, ipaddress, logging, os, socket
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = 'ZZ'      # private, reserved or unlisted addresses
+
+
+class IpRangeTable:
+
+    def __init__(self, rows):
+        """
+        Takes [(first address, last address, country code)].
+        """
+        ranges = {4: [], 6: []}
+        for first, last, country in rows:
+            first, last = parse_address(first), parse_address(last)
+            if first is None or last is None or len(country) != 2:
+                continue
+            version = 4 if last[0] == 4 else 6
+            ranges[version].append((first[1], last[1], country.upper()))
+
+        self.countries = np.array(sorted({country for version in ranges.values() for _, _, country in version}) or [UNKNOWN])
+        self.tables = {version: self.build(ranges[version], dtype) for version, dtype in ((4, np.uint32), (6, np.uint64))}
+
+    def build(self, ranges, dtype):
+        """
+        Returns the (firsts, lasts, country indexes) arrays of the ranges, sorted by first address.
+        """
+        ranges.sort()
+        firsts = np.array([first for first, _, _ in ranges], dtype)
+        lasts = np.array([last for _, last, _ in ranges], dtype)
+        countries = np.searchsorted(self.countries, [country for _, _, country in ranges]).astype(np.uint16)
+
+        return firsts, lasts, countries
+
+    def lookup(self, ip):
+        address = parse_address(ip)
+        if address is None:
+            return UNKNOWN
+        version, value = address
+        firsts, lasts, countries = self.tables[version]
+        value = firsts.dtype.type(value)
+
+        # the last range starting at or before the address, if it ends after it
+        index = int(np.searchsorted(firsts, value, side='right')) - 1
+        if index < 0 or lasts[index] < value:
+            return UNKNOWN
+
+        return str(self.countries[countries[index]])
+
+
+def parse_address(value):
+    """
+    Returns the (version, integer) of an address, with the IPv6 ones truncated to 64 bits, or None.
+    """
+    value = value.strip()
+    try:
+        # most addresses are IPv4, parsed ten times faster this way
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), 'big')
+    except OSError:
+        pass
+    try:
+        address = ipaddress.ip_address(int(value) if value.isdigit() else value)
+    except ValueError:
+        return None
+
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+
+    return (4, int(address)) if address.version == 4 else (6, int(address) >> 64)
+
+
+@functools.lru_cache(maxsize=None)
+def get_ip_table():
+    """
+    Returns the table of 'GEOIP_RANGES_PATH', loading it on the first call.
+    """
+    path = settings.GEOIP_RANGES_PATH
+    if not path or not os.path.exists(path):
+        logger.warning("No IP range database at %s: the countries of the plays are unknown.", path)
+        return None
+
+    with (gzip.open if str(path).endswith('.gz') else open)(path, 'rt', newline='') as f:
+        return IpRangeTable(row[:3] for row in csv.reader(f) if len(row) >= 3)
+
+
+def get_country(ip):
+    """
+    Returns the ISO 3166 code of the country of an IP address, or 'UNKNOWN'.
+    """
+    table = get_ip_table()
+
+    return table.lookup(ip) if table is not None and ip else UNKNOWN
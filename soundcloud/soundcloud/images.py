@@ -0,0 +1,53 @@
+"""
+Resized copies ('derivatives') of uploaded images, stored next to the original as '<original url>.<size>.jpg'
+for every size in 'IMAGE_DERIVATIVE_SIZES'.
+"""
+from contextlib import closing
+from django.conf import settings
+from PIL import Image, ImageOps
+from soundcloud.storage import get_storage
+import io, re
+
+DERIVATIVE_PATTERN = re.compile(r'^(?P<url>.+)\.(?P<size>[a-z]+)\.jpg$')
+
+
+def get_derivative_url(url, size):
+    return f'{url}.{size}.jpg'
+
+
+def get_original_url(url):
+    """
+    Returns the url of the original image if 'url' is a derivative, otherwise 'url' itself.
+    """
+    match = DERIVATIVE_PATTERN.match(url)
+    if match is None or match.group('size') not in settings.IMAGE_DERIVATIVE_SIZES:
+        return url
+
+    return match.group('url')
+
+
+def generate_derivatives(url):
+    storage = get_storage()
+    sizes = sorted(settings.IMAGE_DERIVATIVE_SIZES.items(), key=lambda item: item[1], reverse=True)
+
+    with closing(storage.open(url)) as f:
+        image = Image.open(io.BytesIO(f.read()))
+
+    # let JPEG decode at a reduced scale, then honour the camera orientation
+    image.draft('RGB', (sizes[0][1], sizes[0][1]))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    # from the largest to the smallest, so that each one is resized from the previous one
+    for name, size in sizes:
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+        buffer.seek(0)
+        storage.save(get_derivative_url(url, name), buffer)
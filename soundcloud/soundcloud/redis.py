@@ -0,0 +1,426 @@
+"""
+Access to the Redis server which already backs the cache, for the counters kept outside the database and the task queue.
+
+When the cache is not Redis (e.g. a local setup with LocMemCache), 'get_redis' returns a process-local 'LocalRedis'
+instead. It implements only the commands used in this project, with the same arguments and return types as redis-py.
+"""
+from django.conf import settings
+from redis.exceptions import ResponseError
+import collections, fnmatch, re, threading, time
+
+_local_redis = None
+
+
+def get_redis():
+    global _local_redis
+
+    if settings.CACHES['default']['BACKEND'].startswith('django_redis.'):
+        from django_redis import get_redis_connection
+        return get_redis_connection()
+
+    if _local_redis is None:
+        _local_redis = LocalRedis()
+
+    return _local_redis
+
+
+def encode(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode()
+
+    return repr(value).encode()
+
+
+class LocalRedis:
+    """
+    A thread-safe in-memory stand-in for a Redis connection.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.RLock()
+        self.pushed = threading.Condition(self.lock)
+
+    def _get(self, name, default=None):
+        name = encode(name)
+        expires = self.expires.get(name)
+        if expires is not None and expires <= time.time():
+            self.data.pop(name, None)
+            self.expires.pop(name, None)
+
+        return self.data.get(name, default)
+
+    def _set(self, name, value):
+        self.data[encode(name)] = value
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+    def flushall(self):
+        with self.lock:
+            self.data.clear()
+            self.expires.clear()
+
+        return True
+
+    def exists(self, *names):
+        with self.lock:
+            return sum(self._get(name) is not None for name in names)
+
+    def delete(self, *names):
+        with self.lock:
+            deleted = self.exists(*names)
+            for name in names:
+                self.data.pop(encode(name), None)
+                self.expires.pop(encode(name), None)
+
+        return deleted
+
+    def expire(self, name, time_seconds):
+        with self.lock:
+            if self._get(name) is None:
+                return False
+            self.expires[encode(name)] = time.time() + time_seconds
+
+        return True
+
+    def expireat(self, name, when):
+        with self.lock:
+            if self._get(name) is None:
+                return False
+            self.expires[encode(name)] = when
+
+        return True
+
+    def set(self, name, value, ex=None, nx=False):
+        with self.lock:
+            if nx and self._get(name) is not None:
+                return None
+            self.delete(name)
+            self._set(name, encode(value))
+            if ex is not None:
+                self.expire(name, ex)
+
+        return True
+
+    def get(self, name):
+        with self.lock:
+            value = self._get(name)
+
+        return bytes(value) if isinstance(value, bytearray) else value
+
+    def strlen(self, name):
+        with self.lock:
+            return len(self._get(name, b''))
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            value = int(self._get(name, b'0')) + amount
+            self.data[encode(name)] = encode(value)
+
+        return value
+
+    def getbit(self, name, offset):
+        with self.lock:
+            value = self._get(name, b'')
+            if offset // 8 >= len(value):
+                return 0
+
+            return value[offset // 8] >> (7 - offset % 8) & 1
+
+    def setbit(self, name, offset, value):
+        with self.lock:
+            # bitmaps are kept as bytearrays, so that setting a bit doesn't copy them
+            bitmap = self._get(name)
+            if not isinstance(bitmap, bytearray):
+                bitmap = bytearray(bitmap or b'')
+                self.data[encode(name)] = bitmap
+            if offset // 8 >= len(bitmap):
+                bitmap.extend(bytes(offset // 8 + 1 - len(bitmap)))
+            old = bitmap[offset // 8] >> (7 - offset % 8) & 1
+            if value:
+                bitmap[offset // 8] |= 1 << (7 - offset % 8)
+            else:
+                bitmap[offset // 8] &= ~(1 << (7 - offset % 8)) & 0xff
+
+        return old
+
+    def bitfield(self, key, default_overflow=None):
+        return LocalBitFieldOperation(self, key)
+
+    def bitfield_operations(self, key, operations):
+        """
+        Runs the GET and SET of unsigned fields of a BITFIELD command.
+        """
+        results = []
+        with self.lock:
+            for operation, fmt, offset, *value in operations:
+                width = int(fmt[1:])
+                offset = int(offset[1:]) * width if str(offset).startswith('#') else int(offset)
+                old = 0
+                for i in range(width):
+                    old = old << 1 | self.getbit(key, offset + i)
+                if operation == 'SET':
+                    for i in range(width):
+                        self.setbit(key, offset + i, value[0] >> (width - 1 - i) & 1)
+                results.append(old)
+
+        return results
+
+    def rename(self, src, dst):
+        with self.lock:
+            value = self._get(src)
+            if value is None:
+                raise ResponseError("no such key")
+            expires = self.expires.pop(encode(src), None)
+            self.delete(dst)
+            self.data[encode(dst)] = self.data.pop(encode(src))
+            if expires is not None:
+                self.expires[encode(dst)] = expires
+
+        return True
+
+    def rpush(self, name, *values):
+        with self.lock:
+            items = self._get(name)
+            if items is None:
+                items = collections.deque()
+                self._set(name, items)
+            items.extend(encode(value) for value in values)
+            length = len(items)
+            self.pushed.notify_all()
+
+        return length
+
+    def blpop(self, keys, timeout=0):
+        keys = [keys] if isinstance(keys, (str, bytes)) else keys
+        deadline = time.time() + timeout if timeout else None
+        with self.lock:
+            while True:
+                for key in keys:
+                    items = self._get(key)
+                    if items:
+                        value = items.popleft()
+                        if not items:
+                            self.delete(key)
+                        return encode(key), value
+                if deadline is not None and deadline <= time.time():
+                    return None
+                self.pushed.wait(None if deadline is None else deadline - time.time())
+
+    def sadd(self, name, *values):
+        with self.lock:
+            members = self._get(name)
+            if members is None:
+                members = set()
+                self._set(name, members)
+            added = len({encode(value) for value in values} - members)
+            members.update(encode(value) for value in values)
+
+        return added
+
+    def srem(self, name, *values):
+        with self.lock:
+            members = self._get(name, set())
+            removed = len(members & {encode(value) for value in values})
+            members.difference_update(encode(value) for value in values)
+            if not members:
+                self.delete(name)
+
+        return removed
+
+    def smembers(self, name):
+        with self.lock:
+            return set(self._get(name, set()))
+
+    def scan_iter(self, match=None):
+        with self.lock:
+            names = [name for name in self.data if self._get(name) is not None]
+        pattern = re.compile(fnmatch.translate(match)) if match else None
+
+        return iter([name for name in names if pattern is None or pattern.match(name.decode())])
+
+    def _get_sorted_set(self, name):
+        members = self._get(name)
+        if members is None:
+            members = {}
+            self._set(name, members)
+
+        return members
+
+    def zadd(self, name, mapping):
+        with self.lock:
+            members = self._get_sorted_set(name)
+            added = sum(encode(member) not in members for member in mapping)
+            members.update({encode(member): float(score) for member, score in mapping.items()})
+
+        return added
+
+    def zincrby(self, name, amount, value):
+        with self.lock:
+            members = self._get_sorted_set(name)
+            score = members.get(encode(value), 0.0) + amount
+            members[encode(value)] = score
+
+        return score
+
+    def zscore(self, name, value):
+        with self.lock:
+            return self._get(name, {}).get(encode(value))
+
+    def zrem(self, name, *values):
+        with self.lock:
+            members = self._get(name, {})
+            removed = sum(members.pop(encode(value), None) is not None for value in values)
+            if not members:
+                self.delete(name)
+
+        return removed
+
+    def zcard(self, name):
+        with self.lock:
+            return len(self._get(name, {}))
+
+    def zrevrange(self, name, start, end, withscores=False):
+        with self.lock:
+            # ties are ordered by member, descending like Redis
+            members = sorted(self._get(name, {}).items(), key=lambda item: (item[1], item[0]), reverse=True)
+        members = members[start:None if end == -1 else end + 1]
+
+        return members if withscores else [member for member, _ in members]
+
+    def zremrangebyscore(self, name, min, max):
+        min, max = float(min), float(max)
+        with self.lock:
+            members = self._get(name, {})
+            removed = [member for member, score in members.items() if min <= score <= max]
+            for member in removed:
+                del members[member]
+            if not members:
+                self.delete(name)
+
+        return len(removed)
+
+    def zremrangebyrank(self, name, min, max):
+        with self.lock:
+            members = self._get(name, {})
+            ranked = sorted(members.items(), key=lambda item: (item[1], item[0]))
+            removed = ranked[min:None if max == -1 else (max + 1 or None)]
+            for member, _ in removed:
+                del members[member]
+            if not members:
+                self.delete(name)
+
+        return len(removed)
+
+    def zunionstore(self, dest, keys, aggregate=None):
+        weights = keys if isinstance(keys, dict) else dict.fromkeys(keys, 1)
+        with self.lock:
+            union = {}
+            for key, weight in weights.items():
+                for member, score in self._get(key, {}).items():
+                    union[member] = union.get(member, 0.0) + score * weight
+            self.delete(dest)
+            if union:
+                self._set(dest, union)
+
+        return len(union)
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        with self.lock:
+            hash = self._get(name)
+            if hash is None:
+                hash = {}
+                self._set(name, hash)
+            added = sum(encode(key) not in hash for key in items)
+            hash.update({encode(key): encode(value) for key, value in items.items()})
+
+        return added
+
+    def hget(self, name, key):
+        with self.lock:
+            return self._get(name, {}).get(encode(key))
+
+    def hgetall(self, name):
+        with self.lock:
+            return dict(self._get(name, {}))
+
+    def hincrby(self, name, key, amount=1):
+        with self.lock:
+            hash = self._get(name)
+            if hash is None:
+                hash = {}
+                self._set(name, hash)
+            value = int(hash.get(encode(key), b'0')) + amount
+            hash[encode(key)] = encode(value)
+
+        return value
+
+
+class LocalPipeline:
+    """
+    Queues the commands and runs them at once in 'execute', atomically like MULTI/EXEC.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    def bitfield(self, key, default_overflow=None):
+        return LocalBitFieldOperation(self, key)
+
+    def execute(self, raise_on_error=True):
+        results = []
+        with self.redis.lock:
+            for command, args, kwargs in self.commands:
+                try:
+                    results.append(command(*args, **kwargs))
+                except ResponseError as e:
+                    results.append(e)
+        self.commands = []
+
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, ResponseError):
+                    raise result
+
+        return results
+
+
+class LocalBitFieldOperation:
+    """
+    Builds a BITFIELD command like redis-py's 'BitFieldOperation': 'execute' runs it, or queues it on a pipeline.
+    """
+
+    def __init__(self, client, key):
+        self.client = client
+        self.key = key
+        self.operations = []
+
+    def get(self, fmt, offset):
+        self.operations.append(('GET', fmt, offset))
+        return self
+
+    def set(self, fmt, offset, value):
+        self.operations.append(('SET', fmt, offset, value))
+        return self
+
+    def execute(self):
+        operations, self.operations = self.operations, []
+
+        return self.client.bitfield_operations(self.key, operations)
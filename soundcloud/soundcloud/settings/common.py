@@ -48,12 +48,94 @@ AWS_SECRET_ACCESS_KEY = get_secret("AWS_SECRET_ACCESS_KEY")
 S3_REGION_NAME = "ap-northeast-2"
 S3_BUCKET_NAME = "django-team-10-media"
 S3_BASE_URL = "https://" + S3_BUCKET_NAME + ".s3." + S3_REGION_NAME + ".amazonaws.com/"
+# To use a local S3-compatible server (e.g. MinIO), set S3_ENDPOINT_URL = "http://127.0.0.1:9000"
+# and S3_BASE_URL = S3_ENDPOINT_URL + "/" + S3_BUCKET_NAME + "/"
+S3_ENDPOINT_URL = None
 S3_MUSIC_TRACK_DIR = "media/music/track/"
 S3_IMAGES_SET_DIR = "media/images/set/"
 S3_IMAGES_TRACK_DIR = "media/images/track/"
 S3_IMAGES_USER_PROFILE_DIR = "media/images/user/profile/"
 S3_IMAGES_USER_HEADER_DIR = "media/images/user/header/"
 
+# Settings for media storage
+# 'soundcloud.storage.S3Storage' or 'soundcloud.storage.LocalStorage' (serves MEDIA_ROOT under MEDIA_URL,
+# which should then be an absolute URL like BASE_BACKEND_URL + '/media/')
+
+MEDIA_STORAGE_BACKEND = 'soundcloud.storage.S3Storage'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_URL = '/media/'
+MEDIA_SIGNING_KEY = SECRET_KEY
+# e.g. '/protected-media/', an nginx 'internal' location aliased to MEDIA_ROOT, to let nginx serve local media
+MEDIA_ACCEL_REDIRECT_PREFIX = None
+
+# Resized JPEG copies generated for every uploaded image: size name -> longest side in pixels
+IMAGE_DERIVATIVE_SIZES = {
+    'small': 100,
+    'medium': 300,
+    'large': 1000,
+}
+
+# Audio processing (see track/audio.py)
+
+FFMPEG_BINARY = 'ffmpeg'
+FFPROBE_BINARY = 'ffprobe'
+WAVEFORM_BUCKET_COUNT = 1800
+WAVEFORM_PREVIEW_BUCKET_COUNT = 100
+# loudness normalization, in LUFS and dBFS
+LOUDNESS_TARGET = -14.0
+LOUDNESS_MAX_PEAK = -1.0
+# HLS packaging: AAC in MPEG-TS segments
+HLS_SEGMENT_SECONDS = 10
+HLS_AUDIO_BITRATE = '128k'
+# duplicate detection: hashes around the middle of a new track are looked up, and a track sharing at least
+# 'FINGERPRINT_MIN_MATCHES' of them at the same relative offset is flagged as its original
+FINGERPRINT_SAMPLE_RATE = 8000
+FINGERPRINT_QUERY_SECONDS = 20
+FINGERPRINT_MIN_MATCHES = 20
+
+# Download URLs are valid for 12 hours and reused for 11 of them: each one has at least an hour left.
+PRESIGNED_URL_MIN_VALIDITY = 3600
+PRESIGNED_URL_CACHE_SIZE = 50000
+
+# Settings for background tasks (see soundcloud/tasks.py)
+
+TASK_QUEUE_KEY = 'soundcloud:tasks'
+TASK_QUEUE_EAGER = False
+
+# Plays are buffered in Redis and written to the database every 'PLAY_FLUSH_INTERVAL' seconds (see track/plays.py)
+
+PLAY_BUFFER_KEY = 'soundcloud:plays'
+PLAY_FLUSH_INTERVAL = 5
+PLAY_COUNTER_SHARDS = 16     # rows per track holding its anonymous plays, see 'TrackPlayShard'
+# a listener's plays of a track are counted once per 'PLAY_DEDUPE_SECONDS' to twice that (see track/dedupe.py)
+PLAY_DEDUPE_KEY = 'soundcloud:play-dedupe'
+PLAY_DEDUPE_SECONDS = 300
+PLAY_DEDUPE_ERROR_RATE = 0.001      # share of first plays wrongly taken for repeats
+PLAY_DEDUPE_INITIAL_CAPACITY = 32      # listeners per track and bucket before its filter grows
+# plays sent in bulk to /plays count once listened for 'PLAY_MIN_DURATION' milliseconds
+PLAY_BATCH_SIZE = 100
+PLAY_BATCH_MAX_AGE = 60 * 60 * 24 * 7      # in seconds, for the plays sent after playing offline
+PLAY_MIN_DURATION = 30 * 1000
+
+# Charts of tracks per genre, from the weighted plays, likes, reposts and comments (see track/charts.py)
+
+CHART_KEY = 'soundcloud:charts'
+CHART_WEIGHTS = {'play': 1, 'like': 5, 'repost': 10, 'comment': 3}
+CHART_HALF_LIFE = 60 * 60 * 24 * 2      # in seconds, for the weights in 'trending'
+CHART_REBASE_INTERVAL = 60 * 60 * 24 * 7
+CHART_MIN_AGE = 60 * 60 * 24 * 60       # tracks below the weight of a play this old drop out of 'trending'
+CHART_SIZE = 100
+
+# Leaderboards of the users who played each track and artist most (see track/leaderboards.py)
+
+LEADERBOARD_KEY = 'soundcloud:leaderboards'
+LEADERBOARD_MAX_MEMBERS = 1000      # listeners kept per board
+LEADERBOARD_SIZE = 100      # listeners returned at most
+
+# CSV of IP ranges and their countries, loaded into memory to count the plays per country (see soundcloud/geoip.py)
+
+GEOIP_RANGES_PATH = os.path.join(BASE_DIR, 'geoip', 'dbip-country-lite.csv.gz')
+
 # Application definition
 
 INSTALLED_APPS = [
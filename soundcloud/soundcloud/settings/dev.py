@@ -28,3 +28,5 @@ DATABASES = {
 BASE_BACKEND_URL = 'http://localhost:8000'
 BASE_FRONTEND_URL = 'http://localhost:3000' 
 
+# run background tasks in the server process, without 'python manage.py run_tasks'
+TASK_QUEUE_EAGER = True
@@ -0,0 +1,608 @@
+"""
+Media storage backends.
+
+Every media URL stored on the models ('Track.audio', 'Set.image', ...) is the backend's 'base_url' followed by
+the object key. 'get_storage()' returns the process-wide backend configured by 'MEDIA_STORAGE_BACKEND'.
+"""
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+from urllib.parse import quote, urlencode, urlparse
+import boto3, functools, hashlib, hmac, mimetypes, os, shutil, tempfile, threading, uuid
+
+PRESIGNED_METHODS = {
+    'get_object': 'GET',
+    'put_object': 'PUT',
+    'upload_part': 'PUT',
+}
+EXPIRATION_TIMES = {
+    'get_object': 43200,
+    'put_object': 500,
+    'upload_part': 21600,
+}
+
+# the segments of HLS packages (see track/packaging.py), which some systems map to TypeScript or Qt translations
+mimetypes.add_type('video/mp2t', '.ts')
+
+
+class S3Signer:
+    """
+    Computes SigV4 query-string signatures for S3 objects locally, without building a boto3 client per URL.
+    A single instance is shared by the whole process; the per-day signing key is derived once and cached.
+    """
+
+    algorithm = 'AWS4-HMAC-SHA256'
+    service = 's3'
+
+    def __init__(self, bucket_name, region_name, base_url, credentials):
+        self.bucket_name = bucket_name
+        self.region_name = region_name
+        self.base_url = base_url
+        self.host = urlparse(base_url).netloc
+        self.base_path = urlparse(base_url).path    # '/bucket/' for path-style endpoints, '/' otherwise
+        self.credentials = credentials
+        self._signing_keys = {}
+        self._lock = threading.Lock()
+
+    def presign(self, key, method, expires_in, signed_at=None, params=None):
+        return self.presign_many([key], method, expires_in, signed_at, params)[0]
+
+    def presign_many(self, keys, method, expires_in, signed_at=None, params=None):
+        """
+        Signs every key with the same timestamp, credential scope and signing key.
+        """
+        return self._presign([(key, params) for key in keys], method, expires_in, signed_at)
+
+    def presign_parts(self, key, upload_id, part_numbers, expires_in, signed_at=None):
+        """
+        Signs 'upload_part' URLs of a multipart upload in one pass.
+        """
+        items = [(key, {'partNumber': part_number, 'uploadId': upload_id}) for part_number in part_numbers]
+
+        return self._presign(items, 'upload_part', expires_in, signed_at)
+
+    def _presign(self, items, method, expires_in, signed_at=None):
+        try:
+            http_method = PRESIGNED_METHODS[method]
+        except KeyError:
+            raise ValueError(f"method choices: {tuple(PRESIGNED_METHODS)}")
+
+        signed_at = signed_at or timezone.now()
+        amz_date = signed_at.strftime('%Y%m%dT%H%M%SZ')
+        datestamp = amz_date[:8]
+        credentials = self.credentials.get_frozen_credentials()
+        scope = f"{datestamp}/{self.region_name}/{self.service}/aws4_request"
+        signing_key = self._get_signing_key(credentials.secret_key, datestamp)
+
+        query = {
+            'X-Amz-Algorithm': self.algorithm,
+            'X-Amz-Credential': f"{credentials.access_key}/{scope}",
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(expires_in),
+            'X-Amz-SignedHeaders': 'host',
+        }
+        if credentials.token:
+            query['X-Amz-Security-Token'] = credentials.token
+        string_to_sign_prefix = f"{self.algorithm}\n{amz_date}\n{scope}\n"
+        base_query = self._canonical_query(query)
+
+        presigned_urls = []
+        for key, params in items:
+            if params:
+                canonical_query = self._canonical_query({**query, **{k: str(v) for k, v in params.items()}})
+            else:
+                canonical_query = base_query
+            path = self.base_path + quote(key, safe='/-_.~')
+            canonical_request = f"{http_method}\n{path}\n{canonical_query}\nhost:{self.host}\n\nhost\nUNSIGNED-PAYLOAD"
+            string_to_sign = string_to_sign_prefix + hashlib.sha256(canonical_request.encode()).hexdigest()
+            signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+            presigned_urls.append(f"{self.base_url}{path[len(self.base_path):]}?{canonical_query}&X-Amz-Signature={signature}")
+
+        return presigned_urls
+
+    @staticmethod
+    def _canonical_query(query):
+        return '&'.join(f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}" for name, value in sorted(query.items()))
+
+    def _get_signing_key(self, secret_key, datestamp):
+        cache_key = (secret_key, datestamp)
+        signing_key = self._signing_keys.get(cache_key)
+        if signing_key is not None:
+            return signing_key
+
+        signing_key = ('AWS4' + secret_key).encode()
+        for message in (datestamp, self.region_name, self.service, 'aws4_request'):
+            signing_key = hmac.new(signing_key, message.encode(), hashlib.sha256).digest()
+
+        with self._lock:
+            # Only the last few days are ever signed against.
+            signing_keys = dict(sorted(self._signing_keys.items(), key=lambda item: item[0][1])[-3:])
+            signing_keys[cache_key] = signing_key
+            self._signing_keys = signing_keys
+
+        return signing_key
+
+
+class LRUCache:
+    """
+    Thread-safe dict with a bounded number of entries, evicting the least recently used ones.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def get_signing_window_start(now=None):
+    """
+    Returns the start of the signing window containing 'now'.
+    Windows are shorter than the URL lifetime by 'PRESIGNED_URL_MIN_VALIDITY', so any URL handed out
+    has at least that many seconds of validity left.
+    """
+    window = EXPIRATION_TIMES['get_object'] - settings.PRESIGNED_URL_MIN_VALIDITY
+    if window <= 0:
+        raise ImproperlyConfigured("PRESIGNED_URL_MIN_VALIDITY must be shorter than the get_object expiration time.")
+
+    timestamp = int((now or timezone.now()).timestamp())
+
+    return datetime.fromtimestamp(timestamp - timestamp % window, tz=dt_timezone.utc)
+
+
+class BaseStorage:
+    """
+    Interface of the media storage backends.
+    """
+
+    base_url = None
+
+    def get_key(self, url):
+        return url[len(self.base_url):] if url.startswith(self.base_url) else url
+
+    def get_url(self, key):
+        return self.base_url + key
+
+    def get_local_path(self, url):
+        """
+        Returns the path of the object on the local disk, or None if the backend is remote.
+        """
+        return None
+
+    def presign(self, urls, method):
+        """
+        Returns a dict mapping each url to a url signed for 'method' ('get_object' or 'put_object').
+        """
+        raise NotImplementedError
+
+    def head(self, url):
+        """
+        Returns the 'size', 'etag' and 'content_type' of the object, or None if it does not exist.
+        """
+        raise NotImplementedError
+
+    def open(self, url):
+        """
+        Returns a binary file object for reading the object, which may not be seekable.
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def local_copy(self, url):
+        """
+        Yields the path of the object on the local disk, downloading it to a temporary file if needed.
+        """
+        path = self.get_local_path(url)
+        if path is not None:
+            yield path
+            return
+
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(self.get_key(url))[1]) as f:
+            with closing(self.open(url)) as body:
+                shutil.copyfileobj(body, f, 1024 * 1024)
+            f.flush()
+            yield f.name
+
+    def list(self, prefix):
+        """
+        Yields {'key', 'size', 'last_modified'} for every object whose key starts with 'prefix', page by page.
+        """
+        raise NotImplementedError
+
+    def delete(self, urls):
+        raise NotImplementedError
+
+    def save(self, url, stream):
+        """
+        Writes the object from a file-like 'stream' and returns its ETag.
+        """
+        raise NotImplementedError
+
+    def create_multipart_upload(self, url):
+        raise NotImplementedError
+
+    def presign_parts(self, url, upload_id, part_numbers):
+        """
+        Returns a dict mapping each part number to its signed 'upload_part' url.
+        """
+        raise NotImplementedError
+
+    def list_parts(self, url, upload_id):
+        raise NotImplementedError
+
+    def complete_multipart_upload(self, url, upload_id, parts):
+        raise NotImplementedError
+
+    def abort_multipart_upload(self, url, upload_id):
+        raise NotImplementedError
+
+
+class MultipartUploadError(Exception):
+
+    def __init__(self, code, message=''):
+        super().__init__(message or code)
+        self.code = code
+
+
+class S3Storage(BaseStorage):
+
+    def __init__(self):
+        self.base_url = settings.S3_BASE_URL
+        self.bucket_name = settings.S3_BUCKET_NAME
+        self.cache = LRUCache(settings.PRESIGNED_URL_CACHE_SIZE)
+
+    @cached_property
+    def client(self):
+        # boto3 clients are thread-safe, so one client serves the whole process.
+        return boto3.client(
+            's3',
+            region_name=settings.S3_REGION_NAME,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            aws_access_key_id=settings.AWS_ACCESS_KEY,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+        )
+
+    @cached_property
+    def signer(self):
+        credentials = boto3.session.Session(
+            aws_access_key_id=settings.AWS_ACCESS_KEY,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.S3_REGION_NAME,
+        ).get_credentials()
+
+        return S3Signer(self.bucket_name, settings.S3_REGION_NAME, self.base_url, credentials)
+
+    def presign(self, urls, method):
+        urls = list(dict.fromkeys(urls))
+        keys = [self.get_key(url) for url in urls]
+
+        if method != 'get_object':
+            return dict(zip(urls, self.signer.presign_many(keys, method, EXPIRATION_TIMES[method])))
+
+        # Download URLs are signed at the start of a fixed window, so that a key keeps the same URL
+        # (and stays cacheable by browsers and CDNs) for the whole window.
+        signed_at = get_signing_window_start()
+        presigned_urls = {url: self.cache.get((key, signed_at)) for url, key in zip(urls, keys)}
+        missing = [(url, key) for url, key in zip(urls, keys) if presigned_urls[url] is None]
+
+        if missing:
+            signed = self.signer.presign_many([key for _, key in missing], method, EXPIRATION_TIMES[method], signed_at)
+            for (url, key), presigned_url in zip(missing, signed):
+                self.cache.set((key, signed_at), presigned_url)
+                presigned_urls[url] = presigned_url
+
+        return presigned_urls
+
+    def head(self, url):
+        try:
+            response = self.client.head_object(Bucket=self.bucket_name, Key=self.get_key(url))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ['404', 'NoSuchKey', 'NotFound']:
+                return None
+            raise
+
+        return {
+            'size': response['ContentLength'],
+            'etag': response['ETag'],
+            'content_type': response.get('ContentType', ''),
+        }
+
+    def open(self, url):
+        return self.client.get_object(Bucket=self.bucket_name, Key=self.get_key(url))['Body']
+
+    def list(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for item in page.get('Contents', []):
+                yield {'key': item['Key'], 'size': item['Size'], 'last_modified': item['LastModified']}
+
+    def delete(self, urls):
+        keys = [self.get_key(url) for url in urls if url is not None]
+
+        # at most 1000 keys per request
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in keys[i:i+1000]], 'Quiet': True},
+            )
+
+    def save(self, url, stream):
+        key = self.get_key(url)
+        content_type = mimetypes.guess_type(key)[0] or 'binary/octet-stream'
+        response = self.client.put_object(Bucket=self.bucket_name, Key=key, Body=stream, ContentType=content_type)
+
+        return response['ETag']
+
+    def create_multipart_upload(self, url):
+        response = self.client.create_multipart_upload(Bucket=self.bucket_name, Key=self.get_key(url))
+
+        return response['UploadId']
+
+    def presign_parts(self, url, upload_id, part_numbers):
+        part_numbers = list(part_numbers)
+        presigned_urls = self.signer.presign_parts(self.get_key(url), upload_id, part_numbers, EXPIRATION_TIMES['upload_part'])
+
+        return dict(zip(part_numbers, presigned_urls))
+
+    def list_parts(self, url, upload_id):
+        parts = []
+        paginator = self.client.get_paginator('list_parts')
+        try:
+            for page in paginator.paginate(Bucket=self.bucket_name, Key=self.get_key(url), UploadId=upload_id):
+                parts += [
+                    {'part_number': part['PartNumber'], 'etag': part['ETag'], 'size': part['Size']}
+                    for part in page.get('Parts', [])
+                ]
+        except ClientError as e:
+            raise MultipartUploadError(e.response.get('Error', {}).get('Code'), str(e))
+
+        return parts
+
+    def complete_multipart_upload(self, url, upload_id, parts):
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.get_key(url),
+                UploadId=upload_id,
+                MultipartUpload={
+                    'Parts': [
+                        {'PartNumber': part['part_number'], 'ETag': part['etag']}
+                        for part in sorted(parts, key=lambda part: part['part_number'])
+                    ],
+                },
+            )
+        except ClientError as e:
+            raise MultipartUploadError(e.response.get('Error', {}).get('Code'), str(e))
+
+    def abort_multipart_upload(self, url, upload_id):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.get_key(url), UploadId=upload_id)
+        except ClientError as e:
+            raise MultipartUploadError(e.response.get('Error', {}).get('Code'), str(e))
+
+
+class LocalStorage(BaseStorage):
+    """
+    Stores media under 'MEDIA_ROOT' and hands out URLs under 'MEDIA_URL'. The signature is an HMAC-SHA256,
+    keyed with 'MEDIA_SIGNING_KEY', of the newline-joined HTTP method, key, expiry timestamp and, for parts,
+    the part number and upload id. Anything holding the key ('utility.views.LocalMediaView', or nginx with njs)
+    can check a URL without touching the database.
+    """
+
+    multipart_dir = '.multipart'
+
+    def __init__(self):
+        self.base_url = settings.MEDIA_URL
+        self.root = os.path.abspath(settings.MEDIA_ROOT)
+        self.signing_key = settings.MEDIA_SIGNING_KEY.encode()
+
+    def get_path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Invalid media key: {key}")
+
+        return path
+
+    def get_local_path(self, url):
+        return self.get_path(self.get_key(url))
+
+    def sign(self, http_method, key, expires, params=None):
+        message = '\n'.join([http_method, key, str(expires)] + [str(params[name]) for name in sorted(params or {})])
+
+        return hmac.new(self.signing_key, message.encode(), hashlib.sha256).hexdigest()
+
+    def verify(self, http_method, key, expires, signature, params=None):
+        try:
+            expired = int(expires) < timezone.now().timestamp()
+        except (TypeError, ValueError):
+            return False
+
+        # HEAD is allowed wherever GET is
+        http_method = 'GET' if http_method == 'HEAD' else http_method
+
+        return not expired and hmac.compare_digest(self.sign(http_method, key, expires, params), signature or '')
+
+    def _signed_url(self, key, method, signed_at, params=None):
+        expires = int(signed_at.timestamp()) + EXPIRATION_TIMES[method]
+        signature = self.sign(PRESIGNED_METHODS[method], key, expires, params)
+        query = urlencode({**(params or {}), 'expires': expires, 'signature': signature})
+
+        return f"{self.base_url}{quote(key)}?{query}"
+
+    def presign(self, urls, method):
+        signed_at = get_signing_window_start() if method == 'get_object' else timezone.now()
+
+        return {url: self._signed_url(self.get_key(url), method, signed_at) for url in urls}
+
+    def head(self, url):
+        path = self.get_path(self.get_key(url))
+        if not os.path.isfile(path):
+            return None
+
+        # like nginx, derive the ETag from the modification time and size rather than hashing the file
+        stat = os.stat(path)
+
+        return {
+            'size': stat.st_size,
+            'etag': f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            'content_type': mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        }
+
+    def open(self, url):
+        return open(self.get_path(self.get_key(url)), 'rb')
+
+    def list(self, prefix):
+        directory, _ = os.path.split(prefix)
+        for dirpath, dirnames, filenames in os.walk(self.get_path(directory)):
+            dirnames[:] = sorted(name for name in dirnames if name != self.multipart_dir)
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if not key.startswith(prefix):
+                    continue
+                stat = os.stat(path)
+                yield {
+                    'key': key,
+                    'size': stat.st_size,
+                    'last_modified': datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc),
+                }
+
+    def delete(self, urls):
+        for url in urls:
+            if url is None:
+                continue
+            try:
+                os.remove(self.get_path(self.get_key(url)))
+            except FileNotFoundError:
+                pass
+
+    def _write(self, path, stream):
+        md5 = hashlib.md5()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                md5.update(chunk)
+                f.write(chunk)
+
+        return f'"{md5.hexdigest()}"'
+
+    def save(self, url, stream):
+        return self._write(self.get_path(self.get_key(url)), stream)
+
+    def _get_upload_dir(self, upload_id):
+        return self.get_path(os.path.join(self.multipart_dir, upload_id))
+
+    def _check_upload(self, url, upload_id):
+        try:
+            with open(os.path.join(self._get_upload_dir(upload_id), '.key')) as f:
+                key = f.read()
+        except (FileNotFoundError, ValueError):
+            raise MultipartUploadError('NoSuchUpload')
+        if key != self.get_key(url):
+            raise MultipartUploadError('NoSuchUpload')
+
+    def create_multipart_upload(self, url):
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._get_upload_dir(upload_id)
+        os.makedirs(upload_dir)
+        with open(os.path.join(upload_dir, '.key'), 'w') as f:
+            f.write(self.get_key(url))
+
+        return upload_id
+
+    def presign_parts(self, url, upload_id, part_numbers):
+        key = self.get_key(url)
+        signed_at = timezone.now()
+
+        return {
+            part_number: self._signed_url(key, 'upload_part', signed_at, {'partNumber': part_number, 'uploadId': upload_id})
+            for part_number in part_numbers
+        }
+
+    def save_part(self, url, upload_id, part_number, stream):
+        """
+        Called by the media view for a signed 'upload_part' request. Returns the ETag of the part.
+        """
+        self._check_upload(url, upload_id)
+        path = os.path.join(self._get_upload_dir(upload_id), str(int(part_number)))
+        etag = self._write(path, stream)
+        # kept next to the part, so that listing the parts doesn't read them again
+        with open(f'{path}.etag', 'w') as f:
+            f.write(etag)
+
+        return etag
+
+    def _get_part_etag(self, path):
+        try:
+            with open(f'{path}.etag') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(chunk)
+
+        return f'"{md5.hexdigest()}"'
+
+    def list_parts(self, url, upload_id):
+        self._check_upload(url, upload_id)
+        upload_dir = self._get_upload_dir(upload_id)
+        parts = []
+        for name in sorted(filter(str.isdigit, os.listdir(upload_dir)), key=int):
+            path = os.path.join(upload_dir, name)
+            parts.append({'part_number': int(name), 'etag': self._get_part_etag(path), 'size': os.path.getsize(path)})
+
+        return parts
+
+    def complete_multipart_upload(self, url, upload_id, parts):
+        uploaded = {part['part_number']: part['etag'] for part in self.list_parts(url, upload_id)}
+        parts = sorted(parts, key=lambda part: part['part_number'])
+        if any(uploaded.get(part['part_number']) != part['etag'] for part in parts):
+            raise MultipartUploadError('InvalidPart')
+
+        upload_dir = self._get_upload_dir(upload_id)
+        path = self.get_path(self.get_key(url))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for part in parts:
+                with open(os.path.join(upload_dir, str(part['part_number'])), 'rb') as part_file:
+                    shutil.copyfileobj(part_file, f)
+        shutil.rmtree(upload_dir)
+
+    def abort_multipart_upload(self, url, upload_id):
+        self._check_upload(url, upload_id)
+        shutil.rmtree(self._get_upload_dir(upload_id))
+
+
+@functools.lru_cache(maxsize=None)
+def get_storage():
+    return import_string(settings.MEDIA_STORAGE_BACKEND)()
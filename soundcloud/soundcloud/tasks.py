@@ -0,0 +1,52 @@
+"""
+A minimal background task queue on the Redis server which already backs the cache (see soundcloud/redis.py).
+
+Tasks are registered with '@task' in each app's 'tasks.py' and queued with 'func.delay(*args)' (JSON-serializable
+arguments) once the current transaction commits. 'python manage.py run_tasks' runs them; with 'TASK_QUEUE_EAGER'
+they run in the same process right after the commit instead.
+"""
+from django.conf import settings
+from django.db import transaction
+from soundcloud.redis import get_redis
+import functools, json, logging
+
+logger = logging.getLogger(__name__)
+registry = {}
+
+
+def task(func):
+    name = f'{func.__module__}.{func.__name__}'
+    registry[name] = func
+    func.delay = functools.partial(enqueue, name)
+
+    return func
+
+
+def enqueue(name, *args):
+    if settings.TASK_QUEUE_EAGER:
+        transaction.on_commit(lambda: run(name, args))
+    else:
+        message = json.dumps([name, args])
+        transaction.on_commit(lambda: get_redis().rpush(settings.TASK_QUEUE_KEY, message))
+
+
+def run(name, args):
+    try:
+        registry[name](*args)
+    except Exception:
+        logger.exception("Task %s%r failed.", name, tuple(args))
+
+
+def work(burst=False, timeout=5):
+    """
+    Runs the queued tasks in order. If 'burst', returns once the queue is empty.
+    """
+    redis = get_redis()
+    while True:
+        item = redis.blpop(settings.TASK_QUEUE_KEY, timeout=timeout)
+        if item is None:
+            if burst:
+                return
+            continue
+        name, args = json.loads(item[1])
+        run(name, args)
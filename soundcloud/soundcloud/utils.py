@@ -1,23 +1,30 @@
 from rest_framework.exceptions import APIException, ValidationError
-from rest_framework import permissions, status
+from rest_framework import permissions, renderers, serializers, status
 from rest_framework.pagination import CursorPagination, PageNumberPagination
 from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.http import FileResponse, HttpResponse
 from guardian.shortcuts import assign_perm
-import boto3, os, re
+from soundcloud.images import get_derivative_url
+from soundcloud.storage import get_storage
+import functools, json, logging, mimetypes, os, re
 
+logger = logging.getLogger(__name__)
+
+MEDIA_BASE_URL = get_storage().base_url
 MODEL_NAMES = ('track', 'set', 'user',)
 FIELD_NAMES = ('audio', 'image', 'image_profile', 'image_header',)
 MEDIA_PATHS = {
     'track': {
-        'audio': settings.S3_BASE_URL + settings.S3_MUSIC_TRACK_DIR,
-        'image': settings.S3_BASE_URL + settings.S3_IMAGES_TRACK_DIR,
+        'audio': MEDIA_BASE_URL + settings.S3_MUSIC_TRACK_DIR,
+        'image': MEDIA_BASE_URL + settings.S3_IMAGES_TRACK_DIR,
     },
     'set': {
-        'image': settings.S3_BASE_URL + settings.S3_IMAGES_SET_DIR,
+        'image': MEDIA_BASE_URL + settings.S3_IMAGES_SET_DIR,
     },
     'user': {
-        'image_profile': settings.S3_BASE_URL + settings.S3_IMAGES_USER_PROFILE_DIR,
-        'image_header': settings.S3_BASE_URL + settings.S3_IMAGES_USER_HEADER_DIR,
+        'image_profile': MEDIA_BASE_URL + settings.S3_IMAGES_USER_PROFILE_DIR,
+        'image_header': MEDIA_BASE_URL + settings.S3_IMAGES_USER_HEADER_DIR,
     },
 }
 MEDIA_TYPES = ('audio', 'image',)
@@ -32,29 +39,54 @@ def get_presigned_url(url, method, full_url=True):
     if url is None:
         return None
 
-    if method not in [ 'get_object', 'put_object' ]:
+    return get_presigned_urls([url], method, full_url)[url]
+
+
+def get_presigned_urls(urls, method, full_url=True):
+    """
+    Batch version of 'get_presigned_url'. Returns a dict mapping each given url to its presigned url.
+    """
+    if method not in ['get_object', 'put_object']:
         raise ValueError("method choices: ('get_object', 'put_object')")
 
-    if full_url:
-        key = url.replace(settings.S3_BASE_URL, '')
-
-    expiration_time = 43200 if method in ['get_object'] else 500
-
-    presigned_url = boto3.client(
-        's3',
-        region_name=settings.S3_REGION_NAME,
-        aws_access_key_id=settings.AWS_ACCESS_KEY,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-    ).generate_presigned_url(
-        ClientMethod=method,
-        Params={
-            'Bucket': settings.S3_BUCKET_NAME,
-            'Key': key,
-        },
-        ExpiresIn=expiration_time
-    )
+    storage = get_storage()
+    full_urls = {url: url if full_url else storage.get_url(url) for url in urls if url is not None}
+    presigned_urls = storage.presign(list(full_urls.values()), method)
+
+    return {url: presigned_urls[full_url] for url, full_url in full_urls.items()}
+
+
+def delete_media(urls):
+    """
+    Deletes the media objects once the current transaction commits.
+    A failure only leaves an orphaned object behind, so it is logged instead of failing the request.
+    """
+    urls = [url for url in urls if url is not None]
+    if not urls:
+        return
+
+    def delete():
+        try:
+            get_storage().delete(urls)
+        except Exception:
+            logger.exception("Failed to delete media objects: %s", urls)
+
+    transaction.on_commit(delete)
+
 
-    return presigned_url
+def clear_missing_media(instance, field_names):
+    """
+    Sets the media fields whose objects were never uploaded to None, and returns their names.
+    """
+    storage = get_storage()
+    cleared = [
+        field_name for field_name in field_names
+        if getattr(instance, field_name) is not None and storage.head(getattr(instance, field_name)) is None
+    ]
+    for field_name in cleared:
+        setattr(instance, field_name, None)
+
+    return cleared
 
 
 def assign_object_perms(user, instance):
@@ -82,11 +114,105 @@ class ConflictError(APIException):
     default_code = 'conflict'
 
 
+class BinaryRenderer(renderers.BaseRenderer):
+    """
+    Renders bytes as they are, selected with 'Accept: application/octet-stream' or '?format=binary'.
+    """
+
+    media_type = 'application/octet-stream'
+    format = 'binary'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or isinstance(data, bytes):
+            return data or b''
+
+        # error details
+        return json.dumps(data).encode()
+
+
+class PresignedUrlListSerializer(serializers.ListSerializer):
+    """
+    Signs the media URLs of every item on the page in one pass before serializing them.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.prepare_presigned_urls(items)
+
+        return super().to_representation(items)
+
+
+class PresignedUrlMixin:
+    """
+    Must be used with 'rest_framework.serializers.ModelSerializer'.
+    Set 'Meta.presigned_fields' to the URL fields to be signed, and 'Meta.list_serializer_class' to
+    'PresignedUrlListSerializer' so that the whole page is signed at once.
+    Image fields are served as the derivative named by the 'size' query parameter if given, otherwise by
+    'Meta.image_sizes' (e.g. {'image': 'small'}), otherwise as the original.
+    """
+
+    def to_representation(self, instance):
+        if self.parent is None:
+            self.prepare_presigned_urls([instance])
+
+        return super().to_representation(instance)
+
+    def get_image_size(self, field_name):
+        request = self.context.get('request')
+        size = request.query_params.get('size') if request is not None and hasattr(request, 'query_params') else None
+        if size == 'original' or size in settings.IMAGE_DERIVATIVE_SIZES:
+            return size
+
+        return getattr(self.Meta, 'image_sizes', {}).get(field_name, 'original')
+
+    def get_media_url(self, instance, field_name):
+        url = getattr(instance, field_name, None)
+        size = self.get_image_size(field_name)
+        if url is None or size == 'original' or not getattr(instance, f'{field_name}_derivatives', False):
+            return url
+
+        return get_derivative_url(url, size)
+
+    def get_media_urls(self, instance):
+        urls = [self.get_media_url(instance, field_name) for field_name in getattr(self.Meta, 'presigned_fields', ())]
+
+        # nested serializers like 'artist' or 'creator'
+        for field in self.fields.values():
+            if isinstance(field, PresignedUrlMixin) and not field.write_only:
+                nested_instance = field.get_attribute(instance)
+                if nested_instance is not None:
+                    urls += field.get_media_urls(nested_instance)
+
+        return [url for url in urls if url is not None]
+
+    def prepare_presigned_urls(self, instances):
+        presigned_urls = self.context.setdefault('presigned_urls', {})
+        urls = [url for instance in instances for url in self.get_media_urls(instance) if url not in presigned_urls]
+        presigned_urls.update(get_presigned_urls(urls, 'get_object'))
+
+    def get_presigned_url(self, url):
+        if url is None:
+            return None
+
+        try:
+            return self.context['presigned_urls'][url]
+        except KeyError:
+            return get_presigned_url(url, 'get_object')
+
+    def get_presigned_image_url(self, instance, field_name):
+        return self.get_presigned_url(self.get_media_url(instance, field_name))
+
+
 class MediaUploadMixin:
     """
     Must be used with 'rest_framework.serializers.ModelSerializer'.
     """
 
+    # how many times to re-allocate media urls when a concurrent upload took the same one
+    media_url_retries = 3
+
     def _get_unique_url(self, filename, model_name, field_name, queryset=None):
         if filename is None:
             return None
@@ -96,10 +222,18 @@ class MediaUploadMixin:
         except KeyError:
             raise ValueError(f"model_name choices: {MODEL_NAMES}, field_name choices: {FIELD_NAMES}")
 
-        queryset = queryset or self.Meta.model.objects.exclude(id=getattr(self.instance, 'id', None))
+        if queryset is None:
+            queryset = self.Meta.model._base_manager.exclude(id=getattr(self.instance, 'id', None))
         name, ext = os.path.splitext(url)
 
-        while queryset.filter(**{field_name: url}).exists():
+        # fetch every url that may collide ('name.ext', 'name-1.ext', 'name-2.ext', ...) in a single query
+        stem = re.sub(r'\-\d+$', '', name)
+        taken = set(queryset.filter(**{
+            f'{field_name}__startswith': stem,
+            f'{field_name}__endswith': ext,
+        }).values_list(field_name, flat=True))
+
+        while url in taken:
             if re.search(r'\-\d+$', name):
                 num = re.search(r'\d+$', name).group(0)
                 name = re.sub(r'\d+$', str(int(num)+1), name)
@@ -109,6 +243,41 @@ class MediaUploadMixin:
         
         return url
 
+    def _save_with_unique_urls(self, save, validated_data):
+        """
+        Another upload may take the same url between allocation and saving, which violates the unique constraint.
+        In that case, allocate the next free urls and try again.
+        """
+        allocated = getattr(self, '_allocated_filenames', {})
+        model_name = self.Meta.model._meta.model_name
+
+        for attempt in range(self.media_url_retries + 1):
+            try:
+                with transaction.atomic():
+                    instance = save(dict(validated_data))
+                break
+            except IntegrityError:
+                queryset = self.Meta.model._base_manager.exclude(id=getattr(self.instance, 'id', None))
+                conflicts = [
+                    field_name for field_name in allocated
+                    if queryset.filter(**{field_name: validated_data.get(field_name)}).exists()
+                ]
+                if not conflicts or attempt == self.media_url_retries:
+                    raise
+                for field_name in conflicts:
+                    validated_data[field_name] = self._get_unique_url(allocated[field_name], model_name, field_name)
+
+        # the objects of replaced media are not referenced anymore
+        delete_media(getattr(self, '_replaced_urls', []))
+
+        return instance
+
+    def create(self, validated_data):
+        return self._save_with_unique_urls(super().create, validated_data)
+
+    def update(self, instance, validated_data):
+        return self._save_with_unique_urls(functools.partial(super().update, instance), validated_data)
+
     def _get_presigned_url(self, instance, field_name):
         if self.context['request'].data.get(field_name+'_extension') is None:
             return None
@@ -129,6 +298,8 @@ class MediaUploadMixin:
             raise ValidationError("permalink is required.")
 
         new_data = data.copy()
+        self._allocated_filenames = {}
+        self._replaced_urls = []
 
         for key, extension in data.items():
             if not key.endswith('_extension'):
@@ -139,7 +310,13 @@ class MediaUploadMixin:
             if isinstance(old_url, str) and old_url.endswith('.'+extension):
                 url = old_url
             else:
-                url = self._get_unique_url(permalink + '.' + extension, self.Meta.model._meta.model_name, field_name)
+                filename = permalink + '.' + extension
+                url = self._get_unique_url(filename, self.Meta.model._meta.model_name, field_name)
+                self._allocated_filenames[field_name] = filename
+                if old_url is not None:
+                    self._replaced_urls.append(old_url)
+                if hasattr(self.Meta.model, f'{field_name}_derivatives'):
+                    new_data[f'{field_name}_derivatives'] = False
 
             new_data.pop(key)
             if url is not None:
@@ -181,6 +358,93 @@ class MediaUploadMixin:
         return extension in valid_extensions
 
 
+class FileRange:
+    """
+    File-like view of 'length' bytes of an open file, starting at 'start'.
+    WSGI servers with sendfile support (e.g. gunicorn) send it straight from the file descriptor, bounded by
+    the Content-Length header; others read it block by block.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range_header(header, size):
+    """
+    Returns (start, end) of a single 'bytes=' range, None to serve the whole file, or False if unsatisfiable.
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if start == '':
+        # suffix range: the last N bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+
+    if start > end or start >= size:
+        return False
+
+    return start, end
+
+
+def ranged_file_response(request, path, content_type=None):
+    """
+    Serves a file without reading it into Python, honouring a single byte range with '206 Partial Content'.
+    If 'MEDIA_ACCEL_REDIRECT_PREFIX' is set, nginx serves the file (and the range) instead.
+    """
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + os.path.relpath(path, settings.MEDIA_ROOT)
+        return response
+
+    file = open(path, 'rb')
+    size = os.fstat(file.fileno()).st_size
+    byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        file.close()
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    response = FileResponse(
+        FileRange(file, start, end - start + 1),
+        content_type=content_type,
+        status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+    )
+    response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    return response
+
+
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
 
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'soundcloud.settings.prod')
 
 application = get_wsgi_application()
+
+# parse the IP range database before the first request instead of during it
+from soundcloud.geoip import get_ip_table
+get_ip_table()
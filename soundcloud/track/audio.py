@@ -0,0 +1,413 @@
+"""
+Decoding and analysis of uploaded track audio.
+
+Uncompressed PCM WAV is read with the standard library. Everything else goes through ffmpeg ('FFMPEG_BINARY' and
+'FFPROBE_BINARY'), which must be installed wherever 'run_tasks' runs.
+"""
+from collections import namedtuple
+from django.conf import settings
+import numpy as np
+import json, os, struct, subprocess, tempfile, wave
+
+CHUNK_FRAMES = 2 ** 18     # frames decoded at a time, ~6 s at 44.1 kHz
+PEAK_BLOCK_COUNT = 2 ** 16  # minimums and maximums kept while decoding, dozens per bucket
+
+# 'chunks' iterates over float32 arrays of shape (frames, channels) in [-1, 1], of up to 'CHUNK_FRAMES' frames each
+DecodedAudio = namedtuple('DecodedAudio', ['chunks', 'sample_rate', 'channels'])
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+def decode(path):
+    """
+    Returns the audio at 'path' to be read one chunk at a time, so that analyses never hold all of it.
+    Errors in the middle of the audio raise 'AudioDecodeError' while iterating.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(12)
+
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        try:
+            return decode_wav(path)
+        except (wave.Error, EOFError):
+            pass    # e.g. float or WAVE_FORMAT_EXTENSIBLE files, which ffmpeg can read
+
+    return decode_with_ffmpeg(path)
+
+
+def decode_wav(path):
+    w = wave.open(path, 'rb')
+    channels, width, sample_rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+    if width not in (1, 2, 3, 4):
+        w.close()
+        raise AudioDecodeError(f"Unsupported sample width: {width}")
+
+    return DecodedAudio(read_wav_chunks(w, channels, width), sample_rate, channels)
+
+
+def read_wav_chunks(w, channels, width):
+    with w:
+        while True:
+            data = w.readframes(CHUNK_FRAMES)
+            data = data[:len(data) - len(data) % (channels * width)]
+            if not data:
+                return
+            yield convert_pcm(data, width).reshape(-1, channels)
+
+
+def convert_pcm(data, width):
+    if width == 1:
+        return (np.frombuffer(data, np.uint8).astype(np.float32) - 128) / 128
+    if width == 2:
+        return np.frombuffer(data, '<i2').astype(np.float32) / 2**15
+    if width == 3:
+        # little-endian 24-bit: assemble into the top of an int32 so the sign carries over
+        raw = np.frombuffer(data, np.uint8).reshape(-1, 3).astype(np.int32)
+        return ((raw[:, 0] << 8) | (raw[:, 1] << 16) | (raw[:, 2] << 24)).astype(np.float32) / 2**31
+
+    return np.frombuffer(data, '<i4').astype(np.float32) / 2**31
+
+
+def probe(path):
+    try:
+        result = subprocess.run(
+            [
+                settings.FFPROBE_BINARY, '-v', 'error', '-select_streams', 'a:0',
+                '-show_entries', 'stream=channels,sample_rate', '-of', 'json', path,
+            ],
+            capture_output=True, check=True,
+        )
+        stream = json.loads(result.stdout)['streams'][0]
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError, IndexError) as e:
+        raise AudioDecodeError(f"Failed to probe {path}: {e}")
+
+    return int(stream['channels']), int(stream['sample_rate'])
+
+
+def decode_with_ffmpeg(path):
+    channels, sample_rate = probe(path)
+
+    return DecodedAudio(read_ffmpeg_chunks(path, channels), sample_rate, channels)
+
+
+def read_ffmpeg_chunks(path, channels):
+    frame_size = 4 * channels
+    # ffmpeg logs to a file rather than a pipe, which would block it once full while its output is being read
+    with tempfile.TemporaryFile() as log:
+        try:
+            process = subprocess.Popen(
+                [settings.FFMPEG_BINARY, '-v', 'error', '-i', path, '-f', 'f32le', '-acodec', 'pcm_f32le', 'pipe:1'],
+                stdout=subprocess.PIPE, stderr=log,
+            )
+        except OSError as e:
+            raise AudioDecodeError(f"Failed to decode {path}: {e}")
+
+        try:
+            while True:
+                data = process.stdout.read(CHUNK_FRAMES * frame_size)
+                data = data[:len(data) - len(data) % frame_size]
+                if not data:
+                    break
+                yield np.frombuffer(data, '<f4').reshape(-1, channels)
+        except GeneratorExit:
+            process.kill()      # the rest of the audio isn't needed
+            raise
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+
+        if returncode != 0:
+            log.seek(0)
+            raise AudioDecodeError(f"Failed to decode {path}: {log.read().decode(errors='replace').strip()}")
+
+
+class PeakMeter:
+    """
+    Keeps the minimum and maximum of the mono mix over blocks of samples, as the audio is decoded. The blocks double
+    in size whenever there are more than 'PEAK_BLOCK_COUNT' of them, so they stay much shorter than a bucket whatever
+    the length of the audio. Chunks are a whole number of blocks, except the last one.
+    """
+
+    def __init__(self):
+        self.block_size = 1
+        self.blocks = []
+        self.count = 0
+
+    def update(self, samples):
+        mono = samples.mean(axis=1)
+        starts = np.arange(0, len(mono), self.block_size)
+        peaks = np.stack([np.minimum.reduceat(mono, starts), np.maximum.reduceat(mono, starts)], axis=1)
+        self.blocks.append(np.clip(np.round(peaks * 127), -127, 127).astype(np.int8))
+        self.count += len(peaks)
+
+        while self.count > PEAK_BLOCK_COUNT:
+            blocks, pairs = np.concatenate(self.blocks), np.arange(0, self.count, 2)
+            blocks = np.stack([np.minimum.reduceat(blocks[:, 0], pairs), np.maximum.reduceat(blocks[:, 1], pairs)], axis=1)
+            self.blocks = [blocks]
+            self.count = len(blocks)
+            self.block_size *= 2
+
+    def get_peaks(self, bucket_count):
+        """
+        Returns the minimum and maximum in each of 'bucket_count' equal spans, as an int8 array of shape
+        (bucket_count, 2).
+        """
+        if not self.blocks:
+            return np.zeros((bucket_count, 2), np.int8)
+
+        return downsample_peaks(np.concatenate(self.blocks), bucket_count)
+
+
+def downsample_peaks(peaks, bucket_count):
+    """
+    Merges peaks into 'bucket_count' buckets. Buckets shorter than a peak repeat the peak at their start.
+    """
+    starts = np.linspace(0, len(peaks), bucket_count, endpoint=False).astype(np.int64)
+
+    return np.stack([np.minimum.reduceat(peaks[:, 0], starts), np.maximum.reduceat(peaks[:, 1], starts)], axis=1)
+
+
+def read_info(path):
+    """
+    Returns the 'duration' (ms), 'sample_rate', 'channels' and 'bitrate' (bps) of an audio file from its headers,
+    without decoding it. WAV, FLAC and MP3 are parsed directly, anything else with ffprobe.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(4)
+        f.seek(0)
+        size = os.fstat(f.fileno()).st_size
+        try:
+            if header == b'RIFF':
+                return read_wav_info(f)
+            if header == b'fLaC':
+                return read_flac_info(f, size)
+            if header[:3] == b'ID3' or header[:2] in MP3_SYNC_WORDS:
+                return read_mp3_info(f, size)
+        except (struct.error, ValueError, KeyError, IndexError, StopIteration, ZeroDivisionError):
+            pass
+
+    return read_info_with_ffprobe(path)
+
+
+def read_wav_info(f):
+    riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+    if riff != b'RIFF' or wave_id != b'WAVE':
+        raise ValueError("Not a WAV file")
+
+    fmt = None
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError("No data chunk")
+        chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack('<HHIIHH', f.read(16))
+            f.seek(chunk_size - 16 + chunk_size % 2, os.SEEK_CUR)
+        elif chunk_id == b'data' and fmt is not None:
+            _, channels, sample_rate, byte_rate, _, _ = fmt
+            return {
+                'duration': chunk_size * 1000 // byte_rate,
+                'sample_rate': sample_rate,
+                'channels': channels,
+                'bitrate': byte_rate * 8,
+            }
+        else:
+            f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+def read_flac_info(f, size):
+    # 'fLaC', then the STREAMINFO metadata block which always comes first
+    f.seek(8)
+    streaminfo = f.read(34)
+    bits = int.from_bytes(streaminfo[10:18], 'big')
+    sample_rate = bits >> 44
+    channels = ((bits >> 41) & 0x7) + 1
+    total_samples = bits & 0xFFFFFFFFF
+    duration = total_samples * 1000 // sample_rate
+
+    return {
+        'duration': duration,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'bitrate': size * 8000 // duration,
+    }
+
+
+MP3_SYNC_WORDS = (b'\xff\xfb', b'\xff\xfa', b'\xff\xf3', b'\xff\xf2', b'\xff\xe3', b'\xff\xe2')
+MP3_BITRATES = {
+    # kbps by bitrate index, for MPEG-1 and MPEG-2/2.5 Layer III
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000),
+}
+
+
+def read_mp3_info(f, size):
+    start = 0
+    id3 = f.read(10)
+    if id3[:3] == b'ID3':
+        # the tag size is a 28-bit 'syncsafe' integer, plus a footer if flagged
+        start = 10 + (id3[6] << 21 | id3[7] << 14 | id3[8] << 7 | id3[9]) + (10 if id3[5] & 0x10 else 0)
+
+    # the first frame header: 11 sync bits, version, layer, bitrate, sample rate, channel mode
+    f.seek(start)
+    data = f.read(4096)
+    offset = next(i for i in range(len(data) - 3) if data[i] == 0xFF and data[i + 1] & 0xE0 == 0xE0)
+    header = int.from_bytes(data[offset:offset + 4], 'big')
+    version = {3: 1, 2: 2, 0: 2.5}[(header >> 19) & 0x3]
+    if (header >> 17) & 0x3 != 1:
+        raise ValueError("Not Layer III")
+    bitrate = MP3_BITRATES[1 if version == 1 else 2][(header >> 12) & 0xF] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][(header >> 10) & 0x3]
+    channels = 1 if (header >> 6) & 0x3 == 3 else 2
+    samples_per_frame = 1152 if version == 1 else 576
+
+    # VBR files carry the frame count in a Xing/Info or VBRI header inside the first frame
+    side_info = (32 if channels == 2 else 17) if version == 1 else (17 if channels == 2 else 9)
+    xing = offset + 4 + side_info
+    frames = None
+    if data[xing:xing + 4] in (b'Xing', b'Info') and int.from_bytes(data[xing + 4:xing + 8], 'big') & 0x1:
+        frames = int.from_bytes(data[xing + 8:xing + 12], 'big')
+    elif data[offset + 36:offset + 40] == b'VBRI':
+        frames = int.from_bytes(data[offset + 50:offset + 54], 'big')
+
+    audio_size = size - start - offset
+    if frames:
+        duration = frames * samples_per_frame * 1000 // sample_rate
+        bitrate = audio_size * 8000 // duration
+    else:
+        duration = audio_size * 8000 // bitrate
+
+    return {
+        'duration': duration,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'bitrate': bitrate,
+    }
+
+
+def read_info_with_ffprobe(path):
+    try:
+        result = subprocess.run(
+            [
+                settings.FFPROBE_BINARY, '-v', 'error', '-select_streams', 'a:0',
+                '-show_entries', 'stream=channels,sample_rate:format=duration,bit_rate', '-of', 'json', path,
+            ],
+            capture_output=True, check=True,
+        )
+        info = json.loads(result.stdout)
+        stream, format = info['streams'][0], info['format']
+        return {
+            'duration': int(float(format['duration']) * 1000),
+            'sample_rate': int(stream['sample_rate']),
+            'channels': int(stream['channels']),
+            'bitrate': int(format['bit_rate']) if format.get('bit_rate', 'N/A') != 'N/A' else None,
+        }
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError, IndexError) as e:
+        raise AudioDecodeError(f"Failed to probe {path}: {e}")
+
+
+def get_k_weighting(frequencies, sample_rate):
+    """
+    Returns the power response of the ITU-R BS.1770 K-weighting filter (a high shelf and a high pass,
+    designed for 'sample_rate') at 'frequencies'.
+    """
+    def biquad_power(b, a):
+        z = np.exp(-2j * np.pi * frequencies / sample_rate)
+        return np.abs(np.polyval(b[::-1], z) / np.polyval(a[::-1], z)) ** 2
+
+    # high shelf: +4 dB above ~1.5 kHz
+    A, w0 = 10 ** (4.0 / 40), 2 * np.pi * 1500.0 / sample_rate
+    alpha = np.sin(w0) / (2 / np.sqrt(2))
+    shelf = biquad_power(
+        [
+            A * ((A + 1) + (A - 1) * np.cos(w0) + 2 * np.sqrt(A) * alpha),
+            -2 * A * ((A - 1) + (A + 1) * np.cos(w0)),
+            A * ((A + 1) + (A - 1) * np.cos(w0) - 2 * np.sqrt(A) * alpha),
+        ],
+        [
+            (A + 1) - (A - 1) * np.cos(w0) + 2 * np.sqrt(A) * alpha,
+            2 * ((A - 1) - (A + 1) * np.cos(w0)),
+            (A + 1) - (A - 1) * np.cos(w0) - 2 * np.sqrt(A) * alpha,
+        ],
+    )
+
+    # high pass at 38 Hz
+    w0 = 2 * np.pi * 38.0 / sample_rate
+    alpha = np.sin(w0) / (2 * 0.5)
+    high_pass = biquad_power(
+        [(1 + np.cos(w0)) / 2, -(1 + np.cos(w0)), (1 + np.cos(w0)) / 2],
+        [1 + alpha, -2 * np.cos(w0), 1 - alpha],
+    )
+
+    return shelf * high_pass
+
+
+class LoudnessMeter:
+    """
+    Measures the integrated loudness per ITU-R BS.1770-4 and the sample peak, as the audio is decoded.
+    The K-weighting is applied to the spectrum of each 100 ms step instead of as an IIR filter in time, so
+    the whole computation stays vectorized; 400 ms gating blocks are the mean of 4 consecutive steps.
+    """
+
+    def __init__(self, sample_rate, channels):
+        self.step = sample_rate // 10
+        # channel weights: 1.41 for the surrounds of 5.1, and the LFE is left out
+        self.weights = np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41]) if channels == 6 else np.ones(channels)
+        self.weighting = get_k_weighting(np.fft.rfftfreq(self.step, 1 / sample_rate), sample_rate)
+        self.energies = []
+        self.rest = np.zeros((0, channels), np.float32)     # the samples after the last whole step
+        self.peak = 0.0
+
+    def update(self, samples):
+        self.peak = max(self.peak, float(np.abs(samples).max()))
+        samples = np.concatenate([self.rest, samples])
+        steps = len(samples) // self.step
+        self.rest = samples[steps * self.step:].copy()
+
+        frames = samples[:steps * self.step].reshape(steps, self.step, samples.shape[1]).transpose(0, 2, 1)
+        power = np.abs(np.fft.rfft(frames, axis=2)) ** 2 * self.weighting
+        # Parseval: mean square in time from the one-sided spectrum
+        power[:, :, 1:] *= 2
+        if self.step % 2 == 0:
+            power[:, :, -1] /= 2
+        self.energies.append((power.sum(axis=2) / self.step ** 2) @ self.weights)
+
+    def get_loudness(self):
+        """
+        Returns the integrated loudness (LUFS), or None for silence.
+        """
+        energies = np.concatenate(self.energies) if self.energies else np.zeros(0)
+        if len(energies) < 4:
+            return None
+
+        blocks = np.convolve(energies, np.ones(4) / 4, mode='valid')
+        with np.errstate(divide='ignore'):
+            loudness = -0.691 + 10 * np.log10(blocks)
+
+        gated = blocks[loudness > -70]
+        if len(gated) == 0:
+            return None
+        relative_gate = -0.691 + 10 * np.log10(gated.mean()) - 10
+        gated = blocks[(loudness > -70) & (loudness > relative_gate)]
+
+        return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def compute_gain(peak, loudness):
+    """
+    Returns the gain (dB) bringing the track to 'LOUDNESS_TARGET', limited so that its sample peak 'peak' stays under
+    'LOUDNESS_MAX_PEAK'.
+    """
+    if loudness is None:
+        return 0.0
+
+    headroom = settings.LOUDNESS_MAX_PEAK - 20 * np.log10(peak) if peak > 0 else float('inf')
+
+    return float(min(settings.LOUDNESS_TARGET - loudness, headroom))
@@ -0,0 +1,131 @@
+"""
+Charts of tracks, globally and per genre, kept in Redis sorted sets (see soundcloud/redis.py).
+
+Plays, likes, reposts and comments add 'CHART_WEIGHTS[event]' to the score of their track in two charts:
+- 'top' keeps the plain sum.
+- 'trending' decays it: an event's weight halves every 'CHART_HALF_LIFE' seconds. Decaying every score would touch
+  every member, so instead new events weigh more. They count 2 ** ((time - epoch) / CHART_HALF_LIFE), which ranks the
+  tracks as if the older events had decayed. These weights grow without bound, so every 'CHART_REBASE_INTERVAL' the
+  scores are scaled down into sets for a new epoch (see 'rebase').
+
+Removals (unlike, deleted comment) only lower 'top': they would otherwise take off more than the decayed weight.
+'python manage.py rebuild_charts' recomputes every score from the database.
+"""
+from django.conf import settings
+from soundcloud.redis import get_redis
+import time
+
+KINDS = ('trending', 'top')
+
+
+def get_chart_key(kind, genre_id=None, epoch=None):
+    genre = genre_id or 'all'
+
+    return f'{settings.CHART_KEY}:trending:{epoch}:{genre}' if kind == 'trending' else f'{settings.CHART_KEY}:top:{genre}'
+
+
+def get_epoch(redis):
+    epoch = redis.get(f'{settings.CHART_KEY}:epoch')
+    if epoch is None:
+        redis.set(f'{settings.CHART_KEY}:epoch', int(time.time()), nx=True)
+        epoch = redis.get(f'{settings.CHART_KEY}:epoch')
+
+    return int(epoch)
+
+
+def get_decay_weight(timestamp, epoch):
+    return 2 ** ((timestamp - epoch) / settings.CHART_HALF_LIFE)
+
+
+def record_events(events):
+    """
+    Takes [(track id, genre id, event, count, timestamp)], with event one of 'CHART_WEIGHTS' and a negative count for
+    removals.
+    """
+    if not events:
+        return
+
+    redis = get_redis()
+    epoch = get_epoch(redis)
+    pipeline = redis.pipeline(transaction=False)
+    for track_id, genre_id, event, count, timestamp in events:
+        score = settings.CHART_WEIGHTS[event] * count
+        for genre in {None, genre_id}:
+            pipeline.zincrby(get_chart_key('top', genre), score, track_id)
+            if count > 0:
+                weight = get_decay_weight(timestamp, epoch)
+                pipeline.zincrby(get_chart_key('trending', genre, epoch), score * weight, track_id)
+    pipeline.execute()
+
+    if time.time() - epoch > settings.CHART_REBASE_INTERVAL \
+            and redis.set(f'{settings.CHART_KEY}:rebase-queued', 1, nx=True, ex=settings.CHART_REBASE_INTERVAL):
+        from track.tasks import rebase_charts
+        rebase_charts.delay()
+
+
+def rebase():
+    """
+    Moves the trending scores to an epoch of now, so that new weights start again from 1. The sets of the old epoch
+    linger for a minute for the writers which read it just before, whose events are lost.
+    """
+    redis = get_redis()
+    old_epoch, epoch = get_epoch(redis), int(time.time())
+    if epoch <= old_epoch:
+        return
+    factor = get_decay_weight(old_epoch, epoch)
+    prefix = f'{settings.CHART_KEY}:trending:{old_epoch}:'
+
+    pipeline = redis.pipeline(transaction=True)
+    for key in redis.scan_iter(match=f'{prefix}*'):
+        key = key.decode()
+        new_key = get_chart_key('trending', key[len(prefix):], epoch)
+        pipeline.zunionstore(new_key, {key: factor})
+        # tracks weighing less than a play did at 'CHART_MIN_AGE' are dropped
+        pipeline.zremrangebyscore(new_key, '-inf', get_decay_weight(epoch - settings.CHART_MIN_AGE, epoch))
+        pipeline.expire(key, 60)
+    pipeline.set(f'{settings.CHART_KEY}:epoch', epoch)
+    pipeline.delete(f'{settings.CHART_KEY}:rebase-queued')
+    pipeline.execute()
+
+
+def remove_track(track_id, genre_id):
+    redis = get_redis()
+    epoch = get_epoch(redis)
+    pipeline = redis.pipeline(transaction=False)
+    for genre in {None, genre_id}:
+        for kind in KINDS:
+            pipeline.zrem(get_chart_key(kind, genre, epoch), track_id)
+    pipeline.execute()
+
+
+def move_track(track_id, old_genre_id, new_genre_id):
+    """
+    Moves a track whose genre changed to the charts of its new genre, with its scores in the global charts.
+    """
+    redis = get_redis()
+    epoch = get_epoch(redis)
+
+    pipeline = redis.pipeline(transaction=False)
+    for kind in KINDS:
+        pipeline.zscore(get_chart_key(kind, None, epoch), track_id)
+    scores = pipeline.execute()
+
+    pipeline = redis.pipeline(transaction=True)
+    for kind, score in zip(KINDS, scores):
+        if old_genre_id is not None:
+            pipeline.zrem(get_chart_key(kind, old_genre_id, epoch), track_id)
+        if new_genre_id is not None and score is not None:
+            pipeline.zadd(get_chart_key(kind, new_genre_id, epoch), {track_id: score})
+    pipeline.execute()
+
+
+def get_chart(kind, genre_id=None, count=50):
+    """
+    Returns the ids of the 'count' best tracks of a chart, best first.
+    """
+    # ZREVRANGE 0 -1 would return the whole chart
+    count = max(count, 1)
+    redis = get_redis()
+    epoch = get_epoch(redis) if kind == 'trending' else None
+
+    return [int(track_id) for track_id in redis.zrevrange(get_chart_key(kind, genre_id, epoch), 0, count - 1)]
@@ -0,0 +1,144 @@
+"""
+Deduplication of repeated plays with per-track Bloom filters in Redis, instead of one expiring key per listener.
+
+Time is cut into buckets of 'PLAY_DEDUPE_SECONDS'. Each track has one filter per bucket. A play is a repeat when
+its listener is in the filter of the current or the previous bucket. So a listener is counted at most once per
+'PLAY_DEDUPE_SECONDS', and again after twice that at the latest. Filters expire with the bucket after next.
+
+A filter is a stack of bitmaps ('layers'). Layer i holds 'PLAY_DEDUPE_INITIAL_CAPACITY * 2**i' listeners, and the
+error rates of the layers form a geometric series. A track with a few listeners takes a few dozen bytes, and a viral
+one still stays within the error budget. The error budget 'PLAY_DEDUPE_ERROR_RATE' is the chance that a new listener's play
+is taken for a repeat and not counted. Repeats are never counted twice, except for concurrent requests from the
+same listener.
+"""
+from django.conf import settings
+from soundcloud.redis import get_redis
+import hashlib, math, time
+
+GROWTH = 2      # capacity ratio of consecutive layers
+TIGHTENING = 0.8    # error rate ratio of consecutive layers
+
+
+def get_layer_size(layer):
+    """
+    Returns the (bits, hashes) of a layer.
+    """
+    capacity = settings.PLAY_DEDUPE_INITIAL_CAPACITY * GROWTH ** layer
+    # the budget is shared by the two filters checked and, as a geometric series, by the layers of each filter
+    error_rate = settings.PLAY_DEDUPE_ERROR_RATE / 2 * (1 - TIGHTENING) * TIGHTENING ** layer
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+def get_layer(index):
+    """
+    Returns the layer holding the listener inserted at 'index' in a filter.
+    """
+    layer, capacity = 0, settings.PLAY_DEDUPE_INITIAL_CAPACITY
+    while index >= capacity:
+        index -= capacity
+        layer, capacity = layer + 1, capacity * GROWTH
+
+    return layer
+
+
+def get_positions(member, layer):
+    bits, hashes = get_layer_size(layer)
+    digest = hashlib.blake2b(member.encode(), digest_size=16).digest()
+    # enhanced double hashing: k positions from two 64-bit hashes, which don't cycle when 'h2' shares a factor with 'bits'
+    h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+    return [(h1 + i * h2 + (i ** 3 - i) // 6) % bits for i in range(hashes)]
+
+
+def get_bucket(now=None):
+    """
+    Returns the index of the 'PLAY_DEDUPE_SECONDS' bucket of a timestamp, by default now.
+    """
+    return int((time.time() if now is None else now) // settings.PLAY_DEDUPE_SECONDS)
+
+
+def get_filter_key(track_id, bucket):
+    return f'{settings.PLAY_DEDUPE_KEY}:{track_id}:{bucket}'
+
+
+def dedupe_plays(plays):
+    """
+    Takes [(track id, listener)] and returns [whether the play counts], using three round-trips for the batch.
+    The listener is any string identifying it, e.g. its IP address and user id.
+    """
+    redis = get_redis()
+    bucket = get_bucket()
+    filters = list({get_filter_key(track_id, b) for track_id, _ in plays for b in (bucket, bucket - 1)})
+
+    # 1. the number of listeners in each filter, which tells its layers
+    pipeline = redis.pipeline(transaction=False)
+    for key in filters:
+        pipeline.get(f'{key}:count')
+    sizes = {key: int(size or 0) for key, size in zip(filters, pipeline.execute())}
+
+    # 2. the bits of each listener in every layer, with one BITFIELD per layer for the whole batch
+    reads, lookups = {}, []
+    for track_id, member in plays:
+        lookup = []
+        for key in (get_filter_key(track_id, bucket), get_filter_key(track_id, bucket - 1)):
+            layers = get_layer(sizes[key] - 1) + 1 if sizes[key] else 0
+            for layer in range(layers):
+                positions = reads.setdefault(f'{key}:{layer}', [])
+                start = len(positions)
+                positions += get_positions(member, layer)
+                lookup.append((f'{key}:{layer}', start, len(positions)))
+        lookups.append(lookup)
+    pipeline = redis.pipeline(transaction=False)
+    for name, positions in reads.items():
+        operation = pipeline.bitfield(name)
+        for position in positions:
+            operation.get('u1', position)
+        operation.execute()
+    bits = dict(zip(reads, pipeline.execute()))
+
+    # 3. the new listeners are added to the current filters
+    counted, added, additions, writes = [], set(), {}, {}
+    for (track_id, member), lookup in zip(plays, lookups):
+        key = get_filter_key(track_id, bucket)
+        # in a layer, the listener is (probably) there if all its bits are set
+        seen = any([all(bits[name][start:end]) for name, start, end in lookup])
+        # a listener may also appear twice in the batch
+        seen |= (track_id, member) in added
+        counted.append(not seen)
+        if seen:
+            continue
+
+        added.add((track_id, member))
+        additions[key] = additions.get(key, 0) + 1
+        layer = get_layer(sizes[key])
+        sizes[key] += 1
+        writes.setdefault(f'{key}:{layer}', []).extend(get_positions(member, layer))
+
+    pipeline = redis.pipeline(transaction=False)
+    for name, positions in writes.items():
+        operation = pipeline.bitfield(name)
+        for position in positions:
+            operation.set('u1', position, 1)
+        operation.execute()
+
+    expiry = (bucket + 2) * settings.PLAY_DEDUPE_SECONDS
+    for key, count in additions.items():
+        pipeline.incr(f'{key}:count', count)
+        for layer in range(get_layer(sizes[key] - 1) + 1):
+            pipeline.expireat(f'{key}:{layer}', expiry)
+        pipeline.expireat(f'{key}:count', expiry)
+    pipeline.execute()
+
+    return counted
+
+
+def get_filter_keys(track_id, bucket):
+    """
+    Returns the keys of a filter: its counter and its layers.
+    """
+    key = get_filter_key(track_id, bucket)
+    size = int(get_redis().get(f'{key}:count') or 0)
+
+    return [f'{key}:count'] + [f'{key}:{layer}' for layer in range(get_layer(size - 1) + 1 if size else 0)]
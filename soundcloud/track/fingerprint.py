@@ -0,0 +1,153 @@
+"""
+Acoustic fingerprints of track audio, to find re-uploads of the same recording.
+
+The mono mix is resampled to 'FINGERPRINT_SAMPLE_RATE' and its spectrogram reduced to a constellation of local
+peaks. Each peak is paired with the next few peaks after it, and every pair hashes its two frequencies and the time
+between them into an integer. A re-upload shares most of these hashes at the same relative offsets, whatever its
+gain, encoding or leading silence, so matching is a handful of index lookups on 'TrackFingerprint.hash' followed by
+a histogram of offset differences.
+"""
+from django.conf import settings
+from numpy.lib.stride_tricks import sliding_window_view
+import numpy as np
+
+FRAME_SIZE = 1024
+HOP_SIZE = 512
+FRAME_BATCH = 64            # frames transformed at a time
+PEAK_FREQUENCY_SPAN = 15    # half-sizes of the neighbourhood a peak is the maximum of, in bins and frames
+PEAK_TIME_SPAN = 8
+FAN_OUT = 5                 # peaks paired with each anchor
+MAX_DELTA = 63              # frames between the peaks of a pair, to fit in 6 bits
+
+
+def get_spectrogram(mono):
+    """
+    Returns the log magnitude spectrogram, of shape (frames, FRAME_SIZE // 2 + 1), as float32.
+    The frames are windowed and transformed 'FRAME_BATCH' at a time, straight into the result.
+    """
+    frames = sliding_window_view(mono, FRAME_SIZE)[::HOP_SIZE]
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    spectrogram = np.empty((len(frames), FRAME_SIZE // 2 + 1), np.float32)
+    for start in range(0, len(frames), FRAME_BATCH):
+        # float32 frames transform to complex64 rather than complex128
+        spectrum = np.fft.rfft(frames[start:start + FRAME_BATCH] * window, axis=1)
+        np.abs(spectrum, out=spectrogram[start:start + FRAME_BATCH])
+
+    spectrogram += 1e-6
+
+    return np.log(spectrogram, out=spectrogram)
+
+
+def find_peaks(spectrogram):
+    """
+    Returns the (frame, bin) of the points that are the maximum of their neighbourhood and stand above
+    the average level, sorted by frame then bin.
+    """
+    # separable maximum filter: over the bins of each frame, then over the frames
+    padded = np.pad(spectrogram, ((0, 0), (PEAK_FREQUENCY_SPAN, PEAK_FREQUENCY_SPAN)), constant_values=-np.inf)
+    maximum = sliding_window_view(padded, 2 * PEAK_FREQUENCY_SPAN + 1, axis=1).max(axis=2)
+    padded = np.pad(maximum, ((PEAK_TIME_SPAN, PEAK_TIME_SPAN), (0, 0)), constant_values=-np.inf)
+    maximum = sliding_window_view(padded, 2 * PEAK_TIME_SPAN + 1, axis=0).max(axis=2)
+
+    frames, bins = np.nonzero((spectrogram == maximum) & (spectrogram > spectrogram.mean() + 1))
+
+    return frames, bins
+
+
+class Fingerprinter:
+    """
+    Computes the fingerprint of an audio as it is decoded: every chunk is mixed down, resampled to
+    'FINGERPRINT_SAMPLE_RATE' and added to the spectrogram, the only part kept whole. Averaging blocks of samples
+    before interpolating keeps most of the aliasing out.
+    """
+
+    def __init__(self, sample_rate):
+        self.factor = max(sample_rate // settings.FINGERPRINT_SAMPLE_RATE, 1)
+        self.ratio = sample_rate / self.factor / settings.FINGERPRINT_SAMPLE_RATE    # averaged samples per output one
+        self.unaveraged = np.zeros(0, np.float32)   # the samples after the last whole block
+        self.averaged = 0
+        self.last = np.zeros(0, np.float32)         # the last averaged sample, to interpolate up to the next chunk
+        self.resampled = 0
+        self.unframed = np.zeros(0, np.float32)     # the resampled samples from the start of the next frame
+        self.spectrogram = []
+
+    def update(self, samples):
+        mono = np.concatenate([self.unaveraged, samples.mean(axis=1)])
+        whole = len(mono) - len(mono) % self.factor
+        self.unaveraged = mono[whole:].copy()
+        mono = mono[:whole].reshape(-1, self.factor).mean(axis=1)
+        if len(mono) == 0:
+            return
+
+        # every output sample up to the last averaged one
+        points = np.concatenate([self.last, mono])
+        start = self.averaged - len(self.last)
+        self.averaged += len(mono)
+        self.last = mono[-1:]
+        end = int((self.averaged - 1) / self.ratio) + 1
+        positions = np.arange(self.resampled, end) * self.ratio
+        self.resampled = end
+        mono = np.interp(positions, np.arange(start, self.averaged), points).astype(np.float32)
+
+        mono = np.concatenate([self.unframed, mono])
+        count = (len(mono) - FRAME_SIZE) // HOP_SIZE + 1 if len(mono) >= FRAME_SIZE else 0
+        if count:
+            self.spectrogram.append(get_spectrogram(mono[:(count - 1) * HOP_SIZE + FRAME_SIZE]))
+        self.unframed = mono[count * HOP_SIZE:].copy()
+
+    def get_fingerprint(self):
+        """
+        Returns the hashes of the audio and the frame each one starts at, as two int32 arrays.
+        A hash packs the bin of the anchor (10 bits), the bin of the paired peak (10 bits) and the frames
+        between them (6 bits).
+        """
+        if not self.spectrogram:
+            return np.zeros(0, np.int32), np.zeros(0, np.int32)
+
+        frames, bins = find_peaks(np.concatenate(self.spectrogram))
+        hashes, offsets = [], []
+        for distance in range(1, FAN_OUT + 1):
+            delta = frames[distance:] - frames[:-distance]
+            paired = (delta > 0) & (delta <= MAX_DELTA)
+            anchors = np.nonzero(paired)[0]
+            hashes.append((bins[anchors] << 16) | (bins[anchors + distance] << 6) | delta[paired])
+            offsets.append(frames[anchors])
+
+        hashes, offsets = np.concatenate(hashes).astype(np.int32), np.concatenate(offsets).astype(np.int32)
+        unique = np.unique(np.stack([hashes, offsets], axis=1), axis=0)
+
+        return unique[:, 0], unique[:, 1]
+
+
+def get_query(hashes, offsets):
+    """
+    Returns the hashes and offsets within 'FINGERPRINT_QUERY_SECONDS' around the middle of the audio,
+    which a re-upload contains even when it was trimmed or padded.
+    """
+    if len(offsets) == 0:
+        return hashes, offsets
+
+    frames_per_second = settings.FINGERPRINT_SAMPLE_RATE / HOP_SIZE
+    middle = (offsets.min() + offsets.max()) / 2
+    span = settings.FINGERPRINT_QUERY_SECONDS * frames_per_second / 2
+    selected = np.abs(offsets - middle) <= span
+
+    return hashes[selected], offsets[selected]
+
+
+def score_matches(query_offsets, matches):
+    """
+    'matches' are the (track id, offset) found for each of the query hashes, in the order of 'query_offsets'.
+    Returns {track id: the number of hashes that agree on the most common offset difference}.
+    """
+    histogram = {}
+    for query_offset, found in zip(query_offsets, matches):
+        for track_id, offset in found:
+            key = (track_id, offset - query_offset)
+            histogram[key] = histogram.get(key, 0) + 1
+
+    scores = {}
+    for (track_id, _), count in histogram.items():
+        scores[track_id] = max(scores.get(track_id, 0), count)
+
+    return scores
@@ -0,0 +1,58 @@
+"""
+HyperLogLog sketches counting the unique listeners of a track per day (see 'TrackListenerSketch').
+
+A sketch is 2**PRECISION one-byte registers (4 KiB), whatever the number of listeners. Sketches of several days merge
+into the sketch of the whole period by taking the register-wise maximum, so the unique listeners of a week are
+counted once even if they played the track every day.
+
+The estimates have a relative standard error of 1.04 / sqrt(2**PRECISION), about 1.6%: two thirds of them are within
+1.6% of the exact count and 95% within 3.3%.
+"""
+import hashlib, math
+import numpy as np
+
+PRECISION = 12
+REGISTER_COUNT = 2 ** PRECISION
+STANDARD_ERROR = 1.04 / math.sqrt(REGISTER_COUNT)
+
+
+def get_register(listener):
+    """
+    Returns the (register index, rank) a listener sets: the first bits of its hash pick the register, and the rank is
+    the position of the first 1 in the other bits.
+    """
+    hash = int.from_bytes(hashlib.blake2b(listener.encode(), digest_size=8).digest(), 'little')
+    rest = hash & ((1 << (64 - PRECISION)) - 1)
+
+    return hash >> (64 - PRECISION), 64 - PRECISION - rest.bit_length() + 1
+
+
+def empty_sketch():
+    return np.zeros(REGISTER_COUNT, np.uint8)
+
+
+def add(sketch, indexes, ranks):
+    np.maximum.at(sketch, np.asarray(indexes, np.intp), np.asarray(ranks, np.uint8))
+
+    return sketch
+
+
+def merge(sketches):
+    """
+    Returns the sketch of the union of the sketches' listeners.
+    """
+    return np.maximum.reduce([np.frombuffer(sketch, np.uint8) for sketch in sketches], initial=0) \
+        if sketches else empty_sketch()
+
+
+def estimate(sketch):
+    registers = np.frombuffer(sketch, np.uint8)
+    alpha = 0.7213 / (1 + 1.079 / REGISTER_COUNT)
+    count = alpha * REGISTER_COUNT ** 2 / np.sum(np.exp2(-registers.astype(np.float64)))
+
+    # linear counting is more accurate while many registers are still empty
+    zeros = REGISTER_COUNT - np.count_nonzero(registers)
+    if count <= 2.5 * REGISTER_COUNT and zeros:
+        count = REGISTER_COUNT * math.log(REGISTER_COUNT / zeros)
+
+    return round(count)
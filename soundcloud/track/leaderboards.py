@@ -0,0 +1,49 @@
+"""
+Leaderboards of the users who played a track, or the tracks of an artist, most. They are kept in Redis sorted sets
+(see soundcloud/redis.py), so reading one is a ZREVRANGE rather than an ORDER BY over TrackHit.
+
+The flusher (track/plays.py) adds the counted plays of signed-in users to the boards of the track and of its artist,
+in one pipeline per flush. Artists are left out of their own boards. A board keeps its 'LEADERBOARD_MAX_MEMBERS'
+best listeners; the others are dropped and start again from zero.
+'python manage.py rebuild_leaderboards' recomputes every board from TrackHit.
+"""
+from django.conf import settings
+from soundcloud.redis import get_redis
+
+KINDS = ('track', 'artist')
+
+
+def get_board_key(kind, id):
+    return f'{settings.LEADERBOARD_KEY}:{kind}:{id}'
+
+
+def record_plays(plays):
+    """
+    Takes [(track id, artist id, user id, count)], with a negative count to take plays off.
+    """
+    plays = [play for play in plays if play[1] != play[2]]
+    if not plays:
+        return
+
+    pipeline = get_redis().pipeline(transaction=False)
+    for track_id, artist_id, user_id, count in plays:
+        for key in (get_board_key('track', track_id), get_board_key('artist', artist_id)):
+            pipeline.zincrby(key, count, user_id)
+    for key in {get_board_key(kind, id) for track_id, artist_id, _, _ in plays
+                for kind, id in (('track', track_id), ('artist', artist_id))}:
+        pipeline.zremrangebyscore(key, '-inf', 0)
+        pipeline.zremrangebyrank(key, 0, -settings.LEADERBOARD_MAX_MEMBERS - 1)
+    pipeline.execute()
+
+
+def remove_track(track_id):
+    get_redis().delete(get_board_key('track', track_id))
+
+
+def get_board(kind, id, count=20):
+    """
+    Returns the [(user id, plays)] of the 'count' best listeners of a board, best first.
+    """
+    members = get_redis().zrevrange(get_board_key(kind, id), 0, count - 1, withscores=True)
+
+    return [(int(user_id), int(score)) for user_id, score in members]
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from soundcloud.redis import get_redis
+from track.dedupe import dedupe_plays, get_bucket, get_filter_keys
+import numpy as np
+import pickle, time, uuid
+
+# approximate bytes Redis spends per key besides its name and value (dict entries, object header, expiry)
+KEY_OVERHEAD = 72
+
+
+class Command(BaseCommand):
+    help = "Measures the memory and error rate of the play deduplication filters against one key per listener."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plays', type=int, default=200000, help="Number of plays within one bucket.")
+        parser.add_argument('--tracks', type=int, default=5000, help="Number of tracks, with Zipf-distributed plays.")
+        parser.add_argument('--listeners', type=int, default=100000, help="Number of listeners.")
+        parser.add_argument('--error-rate', type=float, help="Overrides PLAY_DEDUPE_ERROR_RATE.")
+        parser.add_argument('--batch', type=int, default=1000, help="Plays per call of 'dedupe_plays'.")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        count = options['plays']
+        tracks = (rng.zipf(1.2, count) - 1) % options['tracks']
+        # a few listeners replay a lot, so that there are repeats to catch
+        listeners = np.where(rng.random(count) < 0.3, rng.integers(0, 100, count),
+                             rng.integers(0, options['listeners'], count))
+        plays = [(int(track), f'10.0.{listener // 256}.{listener % 256}_user_None')
+                 for track, listener in zip(tracks, listeners)]
+
+        overrides = {'PLAY_DEDUPE_KEY': f'bench-dedupe:{uuid.uuid4().hex}'}
+        if options['error_rate'] is not None:
+            overrides['PLAY_DEDUPE_ERROR_RATE'] = options['error_rate']
+
+        redis = get_redis()
+        with override_settings(**overrides):
+            first_bucket, started = get_bucket(), time.perf_counter()
+            counted = []
+            for i in range(0, count, options['batch']):
+                counted += dedupe_plays(plays[i:i + options['batch']])
+            elapsed = time.perf_counter() - started
+
+            # the run may straddle buckets
+            buckets = range(first_bucket, get_bucket() + 1)
+            keys = [key for track in set(tracks.tolist()) for bucket in buckets for key in get_filter_keys(track, bucket)]
+            pipeline = redis.pipeline(transaction=False)
+            for key in keys:
+                pipeline.strlen(key)
+            lengths = [length for length in pipeline.execute() if length]
+            filter_bytes = sum(lengths) + sum(len(key) for key in keys) + len(lengths) * KEY_OVERHEAD
+            redis.delete(*keys)
+
+        first, wrong, repeats = set(), 0, 0
+        for play, is_counted in zip(plays, counted):
+            if play not in first:
+                first.add(play)
+                wrong += not is_counted
+            else:
+                repeats += is_counted
+
+        # the previous scheme: one '{ip}_user_{id}_track_{id}' cache key per first play, holding a pickled True
+        key_bytes = sum(len(f'{listener}_track_{track}') + len(pickle.dumps(True)) + KEY_OVERHEAD
+                        for track, listener in first)
+
+        per_million = 1e6 / count
+        self.stdout.write(f"{count} plays, {len(first)} first plays, {len(set(tracks.tolist()))} tracks")
+        self.stdout.write(f"{'one key per listener':<22}{key_bytes * per_million / 2 ** 20:>9.1f} MiB per million plays")
+        self.stdout.write(
+            f"{'Bloom filters':<22}{filter_bytes * per_million / 2 ** 20:>9.1f} MiB per million plays  "
+            f"first plays taken for repeats: {wrong / len(first):.4%}  repeats counted: {repeats}"
+        )
+        self.stdout.write(f"{count / elapsed:,.0f} plays/s deduplicated")
@@ -0,0 +1,83 @@
+import http.client, os, random, statistics, tempfile, threading, time
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management.base import BaseCommand
+from soundcloud.utils import ranged_file_response
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Measures seek latency and throughput of byte-range streaming under concurrent listeners."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=32, help="Size of the audio file in MiB.")
+        parser.add_argument('--listeners', type=int, default=8, help="Number of concurrent listeners.")
+        parser.add_argument('--seeks', type=int, default=20, help="Number of seeks per listener.")
+        parser.add_argument('--chunk', type=int, default=256, help="Bytes fetched after each seek, in KiB.")
+
+    def handle(self, *args, **options):
+        size = options['size'] * 1024 * 1024
+        chunk = options['chunk'] * 1024
+
+        with tempfile.NamedTemporaryFile(suffix='.mp3') as file:
+            file.write(os.urandom(size))
+            file.flush()
+
+            def app(environ, start_response):
+                response = ranged_file_response(WSGIRequest(environ), file.name)
+                start_response(f'{response.status_code} {response.reason_phrase}', list(response.items()))
+                return environ['wsgi.file_wrapper'](response.file_to_stream) \
+                    if response.streaming else [response.content]
+
+            server = make_server('127.0.0.1', 0, app, ThreadingWSGIServer, QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+            for name, use_range in (('whole file per seek', False), ('byte range per seek', True)):
+                latencies, received = self.run(server.server_port, size, chunk, use_range, options)
+                elapsed = sum(latencies)
+                self.stdout.write(
+                    f"{name:<22}"
+                    f"p50 {statistics.median(latencies) * 1e3:>9.1f} ms  "
+                    f"p95 {statistics.quantiles(latencies, n=20)[-1] * 1e3:>9.1f} ms  "
+                    f"{received / 1024 / 1024 / (elapsed / options['listeners']):>9.1f} MiB/s of audio"
+                )
+
+            server.shutdown()
+
+    def run(self, port, size, chunk, use_range, options):
+        latencies, received, lock = [], 0, threading.Lock()
+
+        def listen():
+            nonlocal received
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            for _ in range(options['seeks']):
+                start = random.randrange(0, size - chunk)
+                headers = {'Range': f'bytes={start}-{start + chunk - 1}'} if use_range else {}
+                began = time.perf_counter()
+                conn.request('GET', '/', headers=headers)
+                body = conn.getresponse().read()
+                if not use_range:
+                    # without ranges, the player downloads the whole file to seek
+                    body = body[start:start + chunk]
+                elapsed = time.perf_counter() - began
+                with lock:
+                    latencies.append(elapsed)
+                    received += len(body)
+            conn.close()
+
+        threads = [threading.Thread(target=listen) for _ in range(options['listeners'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return latencies, received
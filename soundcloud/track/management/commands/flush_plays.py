@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from track.plays import flush_plays
+import logging, time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Writes the plays buffered by the hit endpoint to the database every PLAY_FLUSH_INTERVAL seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Flush once and exit.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            try:
+                flushed = flush_plays()
+                if options['once']:
+                    self.stdout.write(f"{flushed} (track, user) pairs flushed")
+                    return
+            except Exception:
+                if options['once']:
+                    raise
+                # the buffers are kept aside and retried by the next flush
+                logger.exception("Flushing the plays failed.")
+            time.sleep(max(0, settings.PLAY_FLUSH_INTERVAL - (time.monotonic() - started)))
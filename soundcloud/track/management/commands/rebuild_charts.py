@@ -0,0 +1,97 @@
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from comment.models import Comment
+from reaction.models import Like, Repost
+from soundcloud.redis import get_redis
+from track import charts
+from track.models import Track, TrackPlayRollup
+import numpy as np
+
+
+class Command(BaseCommand):
+    help = "Recomputes the chart scores from the database (see track/charts.py), e.g. after Redis lost them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebase', action='store_true', help="Only move the trending scores to a new epoch.")
+
+    def handle(self, *args, **options):
+        if options['rebase']:
+            charts.rebase()
+            return
+
+        now = timezone.now()
+        epoch = int(now.timestamp())
+        weights = settings.CHART_WEIGHTS
+
+        tracks = Track._base_manager.exclude(status=Track.PENDING) \
+            .values_list('id', 'genre_id', 'play_count', 'like_count', 'repost_count', 'comment_count') \
+            .order_by('id')
+        tracks = np.array([[value or 0 for value in track] for track in tracks], np.int64).reshape(-1, 6)
+        ids, genres = tracks[:, 0], tracks[:, 1]
+        top = tracks[:, 2:] @ np.array([weights[event] for event in ('play', 'like', 'repost', 'comment')], np.float64)
+
+        # the events older than 'CHART_MIN_AGE' weigh too little to matter
+        since = now - timedelta(seconds=settings.CHART_MIN_AGE)
+        content_type = ContentType.objects.get_for_model(Track)
+        events = [
+            (weights['play'], TrackPlayRollup.objects
+                .filter(granularity=TrackPlayRollup.HOUR, start__gte=since).values_list('track_id', 'start', 'count')),
+            (weights['like'], Like.objects
+                .filter(content_type=content_type, created_at__gte=since).values_list('object_id', 'created_at')),
+            (weights['repost'], Repost.objects
+                .filter(content_type=content_type, created_at__gte=since).values_list('object_id', 'created_at')),
+            (weights['comment'], Comment.objects.filter(created_at__gte=since).values_list('track_id', 'created_at')),
+        ]
+        trending = np.zeros(len(ids))
+        for weight, rows in events:
+            rows = list(rows.iterator())
+            if not rows:
+                continue
+            track_ids = np.array([row[0] for row in rows], np.int64)
+            timestamps = np.array([row[1].timestamp() for row in rows])
+            counts = np.array([row[2] if len(row) > 2 else 1 for row in rows], np.float64)
+
+            # the events of deleted or pending tracks are dropped
+            index = np.minimum(np.searchsorted(ids, track_ids), max(len(ids) - 1, 0))
+            found = (ids[index] == track_ids) if len(ids) else np.zeros(len(rows), bool)
+            scores = weight * counts * np.exp2((timestamps - epoch) / settings.CHART_HALF_LIFE)
+            trending += np.bincount(index[found], weights=scores[found], minlength=len(ids))
+
+        self.save(epoch, ids, genres, top, trending)
+
+    def save(self, epoch, ids, genres, top, trending):
+        redis = get_redis()
+        charted = {}
+        for genre_id in [None] + np.unique(genres[genres > 0]).tolist():
+            selected = np.ones(len(ids), bool) if genre_id is None else genres == genre_id
+            for kind, scores in (('top', top), ('trending', trending)):
+                selected_scores = selected & (scores > 0)
+                key = charts.get_chart_key(kind, genre_id, epoch)
+                charted[key] = dict(zip(ids[selected_scores].tolist(), scores[selected_scores].tolist()))
+
+        # the new sets are filled aside, then swapped in at once
+        pipeline = redis.pipeline(transaction=False)
+        for key, members in charted.items():
+            pipeline.delete(f'{key}:rebuilding')
+            items = list(members.items())
+            for i in range(0, len(items), 10000):
+                pipeline.zadd(f'{key}:rebuilding', dict(items[i:i + 10000]))
+        pipeline.execute()
+
+        stale = [key.decode() for key in redis.scan_iter(match=f'{settings.CHART_KEY}:t*')]
+        pipeline = redis.pipeline(transaction=True)
+        for key in stale:
+            if key not in charted and not key.endswith(':rebuilding'):
+                pipeline.delete(key)
+        for key, members in charted.items():
+            if members:
+                pipeline.rename(f'{key}:rebuilding', key)
+            else:
+                pipeline.delete(key)
+        pipeline.set(f'{settings.CHART_KEY}:epoch', epoch)
+        pipeline.execute()
+
+        self.stdout.write(f"{len(charted)} charts of {len(ids)} tracks rebuilt")
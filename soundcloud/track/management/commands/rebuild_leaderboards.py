@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from soundcloud.redis import get_redis
+from track import leaderboards
+from track.models import TrackHit
+import heapq
+
+
+class Command(BaseCommand):
+    help = "Recomputes the leaderboards from TrackHit (see track/leaderboards.py), e.g. after Redis lost them."
+
+    def handle(self, *args, **options):
+        hits = TrackHit.objects.filter(count__gt=0).exclude(user_id=F('track__artist_id')) \
+            .values_list('track_id', 'track__artist_id', 'user_id', 'count')
+
+        boards = {}
+        for track_id, artist_id, user_id, count in hits.iterator():
+            boards.setdefault(leaderboards.get_board_key('track', track_id), {})[user_id] = count
+            board = boards.setdefault(leaderboards.get_board_key('artist', artist_id), {})
+            board[user_id] = board.get(user_id, 0) + count
+
+        self.save(boards)
+
+    def save(self, boards):
+        redis = get_redis()
+
+        # the new boards are filled aside, then swapped in at once
+        pipeline = redis.pipeline(transaction=False)
+        for key, members in boards.items():
+            members = heapq.nlargest(settings.LEADERBOARD_MAX_MEMBERS, members.items(), key=lambda item: item[1])
+            pipeline.delete(f'{key}:rebuilding')
+            pipeline.zadd(f'{key}:rebuilding', dict(members))
+        pipeline.execute()
+
+        stale = [key.decode() for key in redis.scan_iter(match=f'{settings.LEADERBOARD_KEY}:*')]
+        pipeline = redis.pipeline(transaction=True)
+        for key in stale:
+            if key not in boards and not key.endswith(':rebuilding'):
+                pipeline.delete(key)
+        for key in boards:
+            pipeline.rename(f'{key}:rebuilding', key)
+        pipeline.execute()
+
+        self.stdout.write(f"{len(boards)} leaderboards rebuilt")
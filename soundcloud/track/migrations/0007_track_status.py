@@ -0,0 +1,39 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('track', '0006_auto_20220122_1003'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='audio_content_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='audio_etag',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='audio_size',
+            field=models.BigIntegerField(null=True),
+        ),
+        # existing tracks were uploaded before finalization existed, so they are added as 'ready'
+        migrations.AddField(
+            model_name='track',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('ready', 'ready')], db_index=True, default='ready', max_length=15),
+        ),
+        migrations.AlterField(
+            model_name='track',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('ready', 'ready')], db_index=True, default='pending', max_length=15),
+        ),
+    ]
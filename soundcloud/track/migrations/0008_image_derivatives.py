@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('track', '0007_track_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='image_derivatives',
+            field=models.BooleanField(default=False),
+        ),
+    ]
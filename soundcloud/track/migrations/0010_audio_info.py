@@ -0,0 +1,43 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('track', '0009_track_waveform'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='bitrate',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='channels',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='duration',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='loudness',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='loudness_gain',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='sample_rate',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
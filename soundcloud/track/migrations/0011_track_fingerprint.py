@@ -0,0 +1,28 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('track', '0010_audio_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='duplicate_of',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='track.track'),
+        ),
+        migrations.CreateModel(
+            name='TrackFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.IntegerField(db_index=True)),
+                ('offset', models.IntegerField()),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='track.track')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('track', '0011_track_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='segment_count',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def total(queryset, group_by, aggregate):
+    # a correlated subquery per counter, so that every track is filled by a single UPDATE
+    return Coalesce(Subquery(queryset.order_by().values(group_by).annotate(total=aggregate).values('total')), 0)
+
+
+def fill_counts(apps, schema_editor):
+    Track = apps.get_model('track', 'Track')
+    TrackHit = apps.get_model('track', 'TrackHit')
+    Comment = apps.get_model('comment', 'Comment')
+    Like = apps.get_model('reaction', 'Like')
+    Repost = apps.get_model('reaction', 'Repost')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    counts = {
+        'play_count': total(TrackHit.objects.filter(track=OuterRef('pk')), 'track', Sum('count')),
+        'comment_count': total(Comment.objects.filter(track=OuterRef('pk')), 'track', Count('id')),
+    }
+    # reactions can only exist once the content type does
+    content_type = ContentType.objects.filter(app_label='track', model='track').first()
+    if content_type is not None:
+        reactions = {'like_count': Like, 'repost_count': Repost}
+        for name, model in reactions.items():
+            queryset = model.objects.filter(content_type=content_type, object_id=OuterRef('pk'))
+            counts[name] = total(queryset, 'object_id', Count('id'))
+
+    Track.objects.update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('comment', '0006_auto_20220106_0846'),
+        ('reaction', '0003_auto_20211226_1111'),
+        ('track', '0012_track_segment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='comment_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='play_count',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='repost_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:20
+
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def move_anonymous_hits(apps, schema_editor):
+    TrackHit = apps.get_model('track', 'TrackHit')
+    TrackPlayShard = apps.get_model('track', 'TrackPlayShard')
+
+    # the unique constraint doesn't apply to NULL users, so a track may have several anonymous rows
+    hits = TrackHit.objects.filter(user__isnull=True).order_by().values('track').annotate(total=Sum('count'))
+    TrackPlayShard.objects.bulk_create([
+        TrackPlayShard(track_id=hit['track'], shard=0, count=hit['total']) for hit in hits.iterator()
+    ], batch_size=1000)
+    TrackHit.objects.filter(user__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0009_user_stats'),
+        ('track', '0013_track_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackPlayShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='play_shards', to='track.track')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='trackplayshard',
+            constraint=models.UniqueConstraint(fields=('track', 'shard'), name='track_play_shard_unique'),
+        ),
+        migrations.RunPython(move_anonymous_hits, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='trackhit',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='user.user'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('track', '0014_track_play_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackListenerSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('registers', models.BinaryField()),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listener_sketches', to='track.track')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tracklistenersketch',
+            constraint=models.UniqueConstraint(fields=('track', 'date'), name='track_listener_sketch_unique'),
+        ),
+    ]
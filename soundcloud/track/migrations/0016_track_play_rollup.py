@@ -0,0 +1,28 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('track', '0015_track_listener_sketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackPlayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'hour'), ('day', 'day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='play_rollups', to='track.track')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='trackplayrollup',
+            constraint=models.UniqueConstraint(fields=('track', 'granularity', 'start'), name='track_play_rollup_unique'),
+        ),
+    ]
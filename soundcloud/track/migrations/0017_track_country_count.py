@@ -0,0 +1,28 @@
+# Generated by Django 3.2.6 on 2026-10-18 09:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('track', '0016_track_play_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackCountryCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('country', models.CharField(max_length=2)),
+                ('count', models.BigIntegerField(default=0)),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='country_counts', to='track.track')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='trackcountrycount',
+            constraint=models.UniqueConstraint(fields=('track', 'date', 'country'), name='track_country_count_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('track', '0017_track_country_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trackhit',
+            name='last_hit',
+            field=models.DateTimeField(),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('track', '0018_alter_trackhit_last_hit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayFlush',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
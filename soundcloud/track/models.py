@@ -1,37 +1,61 @@
-from django.db import models
-from django.db.models import Sum, Count
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
 from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericRelation
 from reaction.models import Like, Repost
 from soundcloud.utils import assign_object_perms
 from tag.models import Tag
+from user.models import UserStats
+
+
+def total_count(model, aggregate):
+    rows = model.objects.filter(track=OuterRef('pk')).order_by().values('track')
+
+    return Coalesce(Subquery(rows.annotate(total=aggregate).values('total')), 0)
 
 
 class CustomTrackManager(models.Manager):
 
+    @transaction.atomic
     def create(self, **kwargs):
         instance = super().create(**kwargs)
         assign_object_perms(instance.artist, instance)
+        UserStats.update_counts(instance.artist_id, track_count=1)
 
         return instance
 
     def get_queryset(self):
 
-        return super().get_queryset().select_related('artist', 'genre').prefetch_related('tags').annotate(
-                play_count=Coalesce(Sum('trackhit__count', distinct=True), 0),                              #  https://stackoverflow.com/a/35413920/14971231
-                like_count=Count('likes', distinct=True),
-                repost_count=Count('reposts', distinct=True),
-                comment_count=Count('comments', distinct=True),
+        return super().get_queryset().select_related('artist__stats', 'genre').prefetch_related('tags')
+
+    def with_counts(self):
+        """
+        Annotates the counts computed from the related rows, to check the stored counters against.
+        """
+        return self.get_queryset().annotate(
+                # subqueries, as a SUM over the joins would repeat or (with DISTINCT) drop the equal counts
+                live_play_count=total_count(TrackHit, Sum('count')) + total_count(TrackPlayShard, Sum('count')),
+                live_like_count=Count('likes', distinct=True),
+                live_repost_count=Count('reposts', distinct=True),
+                live_comment_count=Count('comments', distinct=True),
         )
 
 
 class Track(models.Model):
+    PENDING = 'pending'
+    READY = 'ready'
+    STATUS_CHOICES = [
+        (PENDING, PENDING),
+        (READY, READY),
+    ]
+
     title = models.CharField(max_length=100)
     artist = models.ForeignKey(get_user_model(), related_name="owned_tracks", on_delete=models.CASCADE)
     permalink = models.SlugField(max_length=255)
     audio = models.URLField(unique=True)
     image = models.URLField(null=True, unique=True)
+    image_derivatives = models.BooleanField(default=False)     # whether the resized copies of the image exist
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     genre = models.ForeignKey(Tag, related_name="genre_tracks", null=True, on_delete=models.SET_NULL)
@@ -40,9 +64,29 @@ class Track(models.Model):
     players = models.ManyToManyField(get_user_model(), related_name="played_tracks", through='TrackHit')
     likes = GenericRelation(Like, related_query_name="track")
     reposts = GenericRelation(Repost, related_query_name="track")
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, default=PENDING, db_index=True)    # 'ready' once the audio upload is finalized
+    audio_size = models.BigIntegerField(null=True)
+    audio_etag = models.CharField(max_length=100, blank=True)
+    audio_content_type = models.CharField(max_length=100, blank=True)
+    waveform_preview = models.BinaryField(null=True)    # low-resolution 'TrackWaveform.peaks'
+    duration = models.PositiveIntegerField(null=True)   # in milliseconds
+    sample_rate = models.PositiveIntegerField(null=True)
+    channels = models.PositiveSmallIntegerField(null=True)
+    bitrate = models.PositiveIntegerField(null=True)    # in bits per second
+    loudness = models.FloatField(null=True)     # integrated loudness in LUFS
+    loudness_gain = models.FloatField(null=True)    # in dB, to play the track at 'LOUDNESS_TARGET'
+    segment_count = models.PositiveIntegerField(null=True)     # of the HLS package, see track/packaging.py
+    duplicate_of = models.ForeignKey('self', related_name="duplicates", null=True, on_delete=models.SET_NULL)   # an earlier upload of the same audio
+    play_count = models.BigIntegerField(default=0)
+    like_count = models.IntegerField(default=0)
+    repost_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
 
     objects = CustomTrackManager()
 
+    # maintained with F() updates by the write paths, see 'save'
+    COUNT_FIELDS = ('play_count', 'like_count', 'repost_count', 'comment_count')
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -51,12 +95,37 @@ class Track(models.Model):
             ),
         ]
 
+    def save(self, *args, **kwargs):
+        # saving an instance loaded before a concurrent increment must not write the stale counters back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNT_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class TrackWaveform(models.Model):
+    track = models.OneToOneField(Track, related_name="waveform", on_delete=models.CASCADE, primary_key=True)
+    peaks = models.BinaryField()    # int8 (min, max) pairs, one per bucket
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def bucket_count(self):
+        return len(self.peaks) // 2
+
+
+class TrackFingerprint(models.Model):
+    hash = models.IntegerField(db_index=True)   # see track/fingerprint.py
+    track = models.ForeignKey(Track, related_name="fingerprints", on_delete=models.CASCADE)
+    offset = models.IntegerField()  # in spectrogram frames
+
 
 class TrackHit(models.Model):
-    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, null=True)
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     track = models.ForeignKey(Track, on_delete=models.CASCADE)
     count = models.BigIntegerField(default=0)
-    last_hit = models.DateTimeField(auto_now=True)
+    last_hit = models.DateTimeField()
 
     class Meta:
         ordering = ('-last_hit', )
@@ -66,3 +135,89 @@ class TrackHit(models.Model):
                 name='track_hit_unique',
             ),
         ]
+
+
+class TrackPlayShard(models.Model):
+    """
+    Anonymous plays of a track, striped over 'PLAY_COUNTER_SHARDS' rows so that concurrent writers rarely wait on the
+    same row lock. The anonymous play count is the sum of the shards.
+    """
+    track = models.ForeignKey(Track, related_name="play_shards", on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['track', 'shard'],
+                name='track_play_shard_unique',
+            ),
+        ]
+
+
+class TrackListenerSketch(models.Model):
+    """
+    The unique listeners of a track on a day (UTC), as a HyperLogLog sketch (see track/hll.py).
+    """
+    track = models.ForeignKey(Track, related_name="listener_sketches", on_delete=models.CASCADE)
+    date = models.DateField()
+    registers = models.BinaryField()    # uint8, one per register
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['track', 'date'],
+                name='track_listener_sketch_unique',
+            ),
+        ]
+
+
+class TrackPlayRollup(models.Model):
+    """
+    The counted plays of a track per hour and per day (UTC), so that stats over any period read a bounded number of rows.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITY_CHOICES = [
+        (HOUR, HOUR),
+        (DAY, DAY),
+    ]
+
+    track = models.ForeignKey(Track, related_name="play_rollups", on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    start = models.DateTimeField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['track', 'granularity', 'start'],
+                name='track_play_rollup_unique',
+            ),
+        ]
+
+
+class PlayFlush(models.Model):
+    """
+    A batch of buffered plays applied by 'flush_plays' (see track/plays.py), so that it is never applied twice.
+    """
+    id = models.CharField(max_length=32, primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class TrackCountryCount(models.Model):
+    """
+    The counted plays of a track per country and day (UTC), the country being looked up from the listener's IP address.
+    """
+    track = models.ForeignKey(Track, related_name="country_counts", on_delete=models.CASCADE)
+    date = models.DateField()
+    country = models.CharField(max_length=2)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['track', 'date', 'country'],
+                name='track_country_count_unique',
+            ),
+        ]
@@ -0,0 +1,99 @@
+"""
+HLS packaging of track audio. ffmpeg encodes the upload to AAC ('HLS_AUDIO_BITRATE') in MPEG-TS segments of
+'HLS_SEGMENT_SECONDS', which every HLS player (AVPlayer, ExoPlayer, hls.js) can play. They are stored next to it as
+'<audio url>.hls/<index>.ts', with a VOD playlist '<audio url>.hls/index.m3u8' referencing them by relative name.
+The API serves the playlist with every segment url signed ('TrackViewSet.manifest'), so that players fetch only
+the segments they play and seeking starts at the nearest segment.
+"""
+from django.conf import settings
+from soundcloud.storage import get_storage
+from soundcloud.utils import get_presigned_urls
+from track.audio import AudioDecodeError
+import io, math, os, re, subprocess, tempfile
+
+PACKAGE_PATTERN = re.compile(r'^(?P<url>.+)\.hls/(index\.m3u8|\d+\.ts)$')
+
+
+def get_playlist_url(url):
+    return f'{url}.hls/index.m3u8'
+
+
+def get_segment_url(url, index):
+    return f'{url}.hls/{index:05d}.ts'
+
+
+def get_package_urls(url, segment_count):
+    return [get_playlist_url(url)] + [get_segment_url(url, index) for index in range(segment_count or 0)]
+
+
+def get_source_url(url):
+    """
+    Returns the url of the packaged audio if 'url' is a segment or a playlist, otherwise 'url' itself.
+    """
+    match = PACKAGE_PATTERN.match(url)
+
+    return url if match is None else match.group('url')
+
+
+def build_playlist(durations):
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+        f'#EXT-X-TARGETDURATION:{math.ceil(max(durations, default=0))}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+    ]
+    for index, duration in enumerate(durations):
+        lines += [f'#EXTINF:{duration:.3f},', f'{index:05d}.ts']
+    lines.append('#EXT-X-ENDLIST')
+
+    return '\n'.join(lines) + '\n'
+
+
+def package_audio(url, path):
+    """
+    Encodes the audio file at 'path' into segments, saves them and their playlist to the storage, and returns the
+    number of segments.
+    """
+    storage = get_storage()
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            subprocess.run(
+                [
+                    settings.FFMPEG_BINARY, '-v', 'error', '-i', path, '-vn',
+                    '-c:a', 'aac', '-b:a', settings.HLS_AUDIO_BITRATE,
+                    '-f', 'hls', '-hls_time', str(settings.HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+                    '-hls_segment_type', 'mpegts', '-hls_segment_filename', os.path.join(directory, '%05d.ts'),
+                    os.path.join(directory, 'index.m3u8'),
+                ],
+                capture_output=True, check=True,
+            )
+            with open(os.path.join(directory, 'index.m3u8')) as f:
+                lines = f.read().splitlines()
+        except subprocess.CalledProcessError as e:
+            raise AudioDecodeError(f"Failed to package {path}: {e.stderr.decode(errors='replace').strip()}")
+        except OSError as e:
+            raise AudioDecodeError(f"Failed to package {path}: {e}")
+
+        # the durations of the AAC segments are whole frames, so they are taken from ffmpeg's own playlist
+        durations = [float(line[len('#EXTINF:'):].split(',')[0]) for line in lines if line.startswith('#EXTINF:')]
+        names = [line for line in lines if line and not line.startswith('#')]
+        for index, name in enumerate(names):
+            with open(os.path.join(directory, name), 'rb') as segment:
+                storage.save(get_segment_url(url, index), segment)
+
+    storage.save(get_playlist_url(url), io.BytesIO(build_playlist(durations).encode()))
+
+    return len(durations)
+
+
+def sign_playlist(url, playlist):
+    """
+    Replaces the relative segment names of a stored playlist with urls presigned in one batch.
+    """
+    lines = playlist.splitlines()
+    segment_urls = [f'{url}.hls/{line}' for line in lines if line and not line.startswith('#')]
+    presigned_urls = get_presigned_urls(segment_urls, 'get_object')
+    lines = [presigned_urls[f'{url}.hls/{line}'] if line and not line.startswith('#') else line for line in lines]
+
+    return '\n'.join(lines) + '\n'
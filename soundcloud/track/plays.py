@@ -0,0 +1,352 @@
+"""
+Write-behind play counting: the hit endpoint only increments hashes in Redis (see soundcloud/redis.py), and
+'flush_plays' (run every few seconds by 'python manage.py flush_plays') applies the aggregated deltas to the database
+in a few bulk statements.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import DateTimeField, F, Q, Value
+from django.db.models.functions import Greatest
+from set.models import Set, SetHit
+from soundcloud.redis import get_redis
+from track import charts, hll, leaderboards
+from track.models import PlayFlush, Track, TrackCountryCount, TrackHit, TrackListenerSketch, TrackPlayRollup, TrackPlayShard
+import numpy as np
+import random, uuid
+
+# 'listener' identifies a unique listener, e.g. 'user:{id}' or 'ip:{address}'
+# 'counted' is False for a play deduplicated by the hit endpoint: it only updates 'last_hit'
+# 'country' is the code of the listener's country, see soundcloud/geoip.py
+Play = namedtuple('Play', ['track_id', 'user_id', 'listener', 'set_id', 'played_at', 'counted', 'country'])
+
+# hashes: 'anonymous-counts' fields are '{track id}:{shard}', 'hourly-counts' fields '{track id}:{hour timestamp}',
+# 'country-counts' fields '{track id}:{date}:{country}', the others '{track or set id}:{user id or empty}'
+BUFFERS = ('track-counts', 'track-last', 'set-last', 'anonymous-counts', 'hourly-counts', 'country-counts')
+# sets: 'listeners' members are '{track id}:{date}:{register index}:{rank}', see track/hll.py
+SET_BUFFERS = ('listeners', )
+# the ids of the applied batches are kept this long, much longer than a failed batch waits for its retry
+FLUSH_RETENTION = timedelta(days=7)
+
+
+def get_buffer_key(name, flush_id=None):
+    key = f'{settings.PLAY_BUFFER_KEY}:{name}'
+
+    return f'{key}:flushing:{flush_id}' if flush_id else key
+
+
+def get_field(id, user_id):
+    return f"{id}:{user_id or ''}"
+
+
+def parse_field(field):
+    id, user_id = field.decode().split(':')
+
+    return int(id), int(user_id) if user_id else None
+
+
+def parse_time(value):
+    return datetime.fromtimestamp(float(value), tz=timezone.utc)
+
+
+def record_plays(plays):
+    """
+    Buffers the plays with one round-trip; nothing is written to the database here.
+    """
+    pipeline = get_redis().pipeline(transaction=False)
+    # in time order, so that the last play of the batch sets 'last_hit'
+    for play in sorted(plays, key=lambda play: play.played_at):
+        field = get_field(play.track_id, play.user_id)
+        played_at = play.played_at.timestamp()
+        if play.user_id is None:
+            if play.counted:
+                shard = random.randrange(settings.PLAY_COUNTER_SHARDS)
+                pipeline.hincrby(get_buffer_key('anonymous-counts'), f'{play.track_id}:{shard}', 1)
+        else:
+            if play.counted:
+                pipeline.hincrby(get_buffer_key('track-counts'), field, 1)
+            pipeline.hset(get_buffer_key('track-last'), field, played_at)
+        if play.set_id is not None:
+            pipeline.hset(get_buffer_key('set-last'), get_field(play.set_id, play.user_id), played_at)
+        if play.counted:
+            hour = int(played_at) // 3600 * 3600
+            pipeline.hincrby(get_buffer_key('hourly-counts'), f'{play.track_id}:{hour}', 1)
+            pipeline.hincrby(get_buffer_key('country-counts'), f'{play.track_id}:{play.played_at.date()}:{play.country}', 1)
+        index, rank = hll.get_register(play.listener)
+        pipeline.sadd(get_buffer_key('listeners'), f'{play.track_id}:{play.played_at.date()}:{index}:{rank}')
+    pipeline.execute()
+
+    if settings.TASK_QUEUE_EAGER:
+        flush_plays()
+
+
+def set_buffers_aside(redis):
+    """
+    Moves the buffers to the keys of a new batch, so that new plays go to fresh ones while these are applied, and
+    returns the ids of the batches to apply: the new one and any left by a failed flush.
+    """
+    pending = get_buffer_key('pending')
+    if redis.exists(*[get_buffer_key(name) for name in BUFFERS + SET_BUFFERS]):
+        flush_id = uuid.uuid4().hex
+        pipeline = redis.pipeline(transaction=True)
+        for name in BUFFERS + SET_BUFFERS:
+            pipeline.rename(get_buffer_key(name), get_buffer_key(name, flush_id))
+        pipeline.sadd(pending, flush_id)
+        # 'no such key' errors only mean that there was no play of that kind
+        pipeline.execute(raise_on_error=False)
+
+    return sorted(flush_id.decode() for flush_id in redis.smembers(pending))
+
+
+def read_buffers(redis, flush_id):
+    pipeline = redis.pipeline(transaction=False)
+    for name in BUFFERS:
+        pipeline.hgetall(get_buffer_key(name, flush_id))
+    for name in SET_BUFFERS:
+        pipeline.smembers(get_buffer_key(name, flush_id))
+
+    return dict(zip(BUFFERS + SET_BUFFERS, pipeline.execute()))
+
+
+def flush_plays():
+    """
+    Applies the buffered plays to TrackHit, TrackPlayShard, SetHit, TrackListenerSketch, TrackPlayRollup,
+    TrackCountryCount, Track.play_count, the charts and the leaderboards. Returns the number of buffered counters.
+
+    Each batch of buffers is applied at most once: its id is recorded as a PlayFlush in the same transaction, so a
+    batch retried after a crash, or taken by a second flush once the lock expired, is only deleted. The lock only
+    saves the duplicate work.
+    """
+    redis = get_redis()
+    lock = get_buffer_key('flush-lock')
+    if not redis.set(lock, 1, nx=True, ex=60):
+        return 0
+
+    flushed = 0
+    try:
+        for flush_id in set_buffers_aside(redis):
+            flushed += flush_batch(redis, flush_id)
+    finally:
+        redis.delete(lock)
+
+    return flushed
+
+
+def flush_batch(redis, flush_id):
+    buffers = read_buffers(redis, flush_id)
+    counts = {parse_field(field): int(count) for field, count in buffers['track-counts'].items()}
+    track_last = {parse_field(field): parse_time(value) for field, value in buffers['track-last'].items()}
+    set_last = {parse_field(field): parse_time(value) for field, value in buffers['set-last'].items()}
+    shard_counts = {parse_field(field): int(count) for field, count in buffers['anonymous-counts'].items()}
+    registers = parse_registers(buffers['listeners'])
+    rollup_counts = parse_rollup_counts(buffers['hourly-counts'])
+    country_counts = parse_country_counts(buffers['country-counts'])
+
+    tracks = save_plays(flush_id, counts, track_last, set_last, shard_counts, registers, rollup_counts, country_counts)
+
+    pipeline = redis.pipeline(transaction=True)
+    pipeline.delete(*[get_buffer_key(name, flush_id) for name in BUFFERS + SET_BUFFERS])
+    pipeline.srem(get_buffer_key('pending'), flush_id)
+    pipeline.execute()
+    if tracks is None:
+        return 0
+
+    # charts are scored from the hour of the plays, once they can't be flushed again
+    charts.record_events([
+        (track_id, tracks[track_id][0], 'play', count, start.timestamp())
+        for (track_id, granularity, start), count in rollup_counts.items()
+        if granularity == TrackPlayRollup.HOUR and track_id in tracks
+    ])
+    leaderboards.record_plays([
+        (track_id, tracks[track_id][1], user_id, count)
+        for (track_id, user_id), count in counts.items() if track_id in tracks
+    ])
+
+    return len(track_last) + len(shard_counts)
+
+
+def parse_registers(members):
+    """
+    Returns {(track id, date): (register indexes, ranks)}.
+    """
+    registers = {}
+    for member in members:
+        track_id, date, index, rank = member.decode().split(':')
+        indexes, ranks = registers.setdefault((int(track_id), datetime.strptime(date, '%Y-%m-%d').date()), ([], []))
+        indexes.append(int(index))
+        ranks.append(int(rank))
+
+    return registers
+
+
+def parse_rollup_counts(hourly_counts):
+    """
+    Returns {(track id, granularity, start): count} for the hours and days of the plays.
+    """
+    rollup_counts = {}
+    for field, count in hourly_counts.items():
+        track_id, hour = parse_field(field)
+        hour = parse_time(hour)
+        for granularity, start in ((TrackPlayRollup.HOUR, hour), (TrackPlayRollup.DAY, hour.replace(hour=0))):
+            key = (track_id, granularity, start)
+            rollup_counts[key] = rollup_counts.get(key, 0) + int(count)
+
+    return rollup_counts
+
+
+def parse_country_counts(country_counts):
+    """
+    Returns {(track id, date, country): count}.
+    """
+    parsed = {}
+    for field, count in country_counts.items():
+        track_id, date, country = field.decode().split(':')
+        parsed[(int(track_id), datetime.strptime(date, '%Y-%m-%d').date(), country)] = int(count)
+
+    return parsed
+
+
+def filter_existing(hits, model):
+    """
+    Drops the {(id, user id): value} entries whose object or user was deleted since the play.
+    """
+    ids = set(model._base_manager.filter(id__in={id for id, _ in hits}).values_list('id', flat=True))
+    user_ids = {user_id for _, user_id in hits if user_id is not None}
+    user_ids = set(get_user_model()._base_manager.filter(id__in=user_ids).values_list('id', flat=True))
+
+    return {
+        (id, user_id): value for (id, user_id), value in hits.items()
+        if id in ids and (user_id is None or user_id in user_ids)
+    }
+
+
+def upsert_hits(model, target, hits, counts=None):
+    """
+    Updates 'last_hit' (and 'count' if counts are given) of the existing {model} rows, and creates the missing ones.
+    """
+    if not hits:
+        return
+
+    user_ids = {user_id for _, user_id in hits}
+    # bounded by the listeners of the batch, not by every listener of the tracks or sets
+    users = Q(user_id__in=user_ids - {None})
+    if None in user_ids:
+        users |= Q(user__isnull=True)
+    existing = model.objects.filter(users, **{f'{target}_id__in': {id for id, _ in hits}})
+    rows = {}
+    for row in existing.only('id', f'{target}_id', 'user_id'):
+        key = (getattr(row, f'{target}_id'), row.user_id)
+        if key in hits:
+            rows[key] = row
+
+    fields = ['last_hit', 'count'] if counts is not None else ['last_hit']
+    new_rows = []
+    for key, last_hit in hits.items():
+        row = rows.get(key)
+        if row is None:
+            row = model(**{f'{target}_id': key[0], 'user_id': key[1]})
+            new_rows.append(row)
+            if counts is not None:
+                row.count = counts.get(key, 0)
+            row.last_hit = last_hit
+        else:
+            if counts is not None:
+                row.count = F('count') + counts.get(key, 0)
+            # plays sent late (see 'PlayBatchService') don't move 'last_hit' back
+            row.last_hit = Greatest('last_hit', Value(last_hit, output_field=DateTimeField()))
+
+    model.objects.bulk_update(rows.values(), fields, batch_size=1000)
+    model.objects.bulk_create(new_rows, batch_size=1000)
+
+
+def add_counts(model, fields, counts):
+    """
+    Adds the {(values of the unique 'fields'): count} deltas to the {model} rows, creating the missing ones.
+    """
+    if not counts:
+        return
+
+    # the unique constraints cover non-NULL columns only, so concurrent inserts can't duplicate a row
+    model.objects.bulk_create([model(**dict(zip(fields, key))) for key in counts], batch_size=1000, ignore_conflicts=True)
+
+    rows = model.objects.filter(**{f'{field}__in': {key[i] for key in counts} for i, field in enumerate(fields)})
+    rows = {tuple(getattr(row, field) for field in fields): row for row in rows.only('id', *fields)}
+    rows = [row for key, row in rows.items() if key in counts]
+    for row in rows:
+        row.count = F('count') + counts[tuple(getattr(row, field) for field in fields)]
+    model.objects.bulk_update(rows, ['count'], batch_size=1000)
+
+
+def add_listeners(registers):
+    """
+    Merges the {(track id, date): (register indexes, ranks)} into the daily sketches, creating the missing ones.
+    """
+    if not registers:
+        return
+
+    sketches = TrackListenerSketch.objects \
+        .filter(track_id__in={track_id for track_id, _ in registers}, date__in={date for _, date in registers})
+    sketches = {(sketch.track_id, sketch.date): sketch for sketch in sketches}
+
+    new_sketches = []
+    for key, (indexes, ranks) in registers.items():
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = TrackListenerSketch(track_id=key[0], date=key[1], registers=hll.empty_sketch())
+            new_sketches.append(sketch)
+        else:
+            sketch.registers = np.frombuffer(sketch.registers, np.uint8).copy()
+        sketch.registers = hll.add(sketch.registers, indexes, ranks).tobytes()
+
+    TrackListenerSketch.objects.bulk_update(
+        [sketch for key, sketch in sketches.items() if key in registers], ['registers'], batch_size=1000,
+    )
+    TrackListenerSketch.objects.bulk_create(new_sketches, batch_size=1000)
+
+
+@transaction.atomic
+def save_plays(flush_id, counts, track_last, set_last, shard_counts, registers, rollup_counts, country_counts):
+    """
+    Returns {track id: (genre id, artist id)} of the tracks which still exist, or None if the batch was already applied.
+    """
+    # a concurrent flush of the same batch waits here for this one to commit, then fails
+    try:
+        with transaction.atomic():
+            PlayFlush.objects.create(id=flush_id)
+    except IntegrityError:
+        return None
+    PlayFlush.objects.filter(created_at__lt=datetime.now(timezone.utc) - FLUSH_RETENTION).delete()
+
+    track_last = filter_existing(track_last, Track)
+    set_last = filter_existing(set_last, Set)
+    counts = {key: count for key, count in counts.items() if key in track_last}
+    track_ids = {key[0] for key in list(shard_counts) + list(registers) + list(rollup_counts) + list(country_counts)}
+    tracks = {
+        id: (genre_id, artist_id)
+        for id, genre_id, artist_id in Track._base_manager.filter(id__in=track_ids).values_list('id', 'genre_id', 'artist_id')
+    }
+    track_ids = set(tracks)
+    shard_counts = {key: count for key, count in shard_counts.items() if key[0] in track_ids}
+    registers = {key: value for key, value in registers.items() if key[0] in track_ids}
+    rollup_counts = {key: count for key, count in rollup_counts.items() if key[0] in track_ids}
+    country_counts = {key: count for key, count in country_counts.items() if key[0] in track_ids}
+
+    upsert_hits(TrackHit, 'track', track_last, counts)
+    upsert_hits(SetHit, 'set', set_last)
+    add_counts(TrackPlayShard, ('track_id', 'shard'), shard_counts)
+    add_counts(TrackPlayRollup, ('track_id', 'granularity', 'start'), rollup_counts)
+    add_counts(TrackCountryCount, ('track_id', 'date', 'country'), country_counts)
+    add_listeners(registers)
+
+    # one delta per track, all applied by a single UPDATE
+    deltas = {}
+    for (track_id, _), count in list(counts.items()) + list(shard_counts.items()):
+        deltas[track_id] = deltas.get(track_id, 0) + count
+    Track._base_manager.bulk_update(
+        [Track(id=track_id, play_count=F('play_count') + delta) for track_id, delta in deltas.items()],
+        ['play_count'], batch_size=1000,
+    )
+
+    return tracks
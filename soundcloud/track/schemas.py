@@ -1,6 +1,7 @@
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, OpenApiExample, extend_schema, extend_schema_view
-from track.serializers import SimpleTrackSerializer, TrackSerializer, TrackMediaUploadSerializer
+from track.serializers import PlayEventSerializer, SimpleTrackSerializer, TrackSerializer, TrackMediaUploadSerializer, TrackMultipartUploadService, \
+    TrackWaveformSerializer
 from user.serializers import SimpleUserSerializer
 
 
@@ -15,6 +16,10 @@ tracks_viewset_schema = extend_schema_view(
     ),
     retrieve=extend_schema(
         summary="Retrieve Track",
+        parameters=[
+            OpenApiParameter("size", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Image size: 'small', 'medium', 'large' or 'original'."),
+            OpenApiParameter("audio", OpenApiTypes.STR, OpenApiParameter.QUERY, description="'hls' for the URL of the segmented playlist, once the audio is packaged."),
+        ],
         responses={
             '200': OpenApiResponse(response=TrackSerializer, description='OK'),
             '404': OpenApiResponse(description='Not Found')
@@ -51,6 +56,9 @@ tracks_viewset_schema = extend_schema_view(
     ),
     list=extend_schema(
         summary="List Tracks",
+        parameters=[
+            OpenApiParameter("size", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Image size: 'small', 'medium', 'large' or 'original'."),
+        ],
         responses={
             '200': OpenApiResponse(response=SimpleTrackSerializer, description='OK'),
         }
@@ -66,6 +74,19 @@ tracks_viewset_schema = extend_schema_view(
             '404': OpenApiResponse(description='Not Found'),
         }
     ),
+    top_listeners=extend_schema(
+        summary="Get Track's Top Listeners",
+        description="The users who played the track most, best first, each with its 'play_count' (counted plays of "
+                    "the track). The artist is not among them.",
+        parameters=[
+            OpenApiParameter("limit", OpenApiTypes.INT, OpenApiParameter.QUERY, description='Number of listeners to return, at most 100. Defaults to 20.'),
+        ],
+        responses={
+            '200': OpenApiResponse(response=SimpleUserSerializer(many=True), description='OK'),
+            '400': OpenApiResponse(description='Bad Request'),
+            '404': OpenApiResponse(description='Not Found'),
+        }
+    ),
     reposters=extend_schema(
         summary="Get Track's Reposters",
         parameters=[
@@ -85,7 +106,114 @@ tracks_viewset_schema = extend_schema_view(
         responses={
             '200': OpenApiResponse(description='OK'),
         }
-    )
+    ),
+    stats=extend_schema(
+        summary="Get Track Stats",
+        description="Plays per hour or day (UTC) from pre-aggregated buckets, plays per country (ISO 3166 code, 'ZZ' "
+                    "if unknown) on the days from 'from' to 'to', and unique listeners today and in the last 7 and 30 "
+                    "days. The unique listeners are HyperLogLog estimates: 'unique_listeners_error' is their "
+                    "relative standard error (95% of them are within twice that).",
+        parameters=[
+            OpenApiParameter("from", OpenApiTypes.DATETIME, OpenApiParameter.QUERY, description="ISO 8601 datetime or date. Defaults to a day (hourly) or 30 days (daily) before 'to'."),
+            OpenApiParameter("to", OpenApiTypes.DATETIME, OpenApiParameter.QUERY, description='ISO 8601 datetime or date. Defaults to now.'),
+            OpenApiParameter("granularity", OpenApiTypes.STR, OpenApiParameter.QUERY, enum=['hour', 'day'], description="Defaults to 'day'. At most 744 hourly or 366 daily buckets."),
+        ],
+        responses={
+            '200': OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                description='OK',
+                examples=[
+                    OpenApiExample(
+                        'Example',
+                        value={
+                            'from': '2022-01-01T00:00:00Z',
+                            'to': '2022-01-02T00:00:00Z',
+                            'granularity': 'day',
+                            'play_count': 42,
+                            'plays': [
+                                {'start': '2022-01-01T00:00:00Z', 'count': 30},
+                                {'start': '2022-01-02T00:00:00Z', 'count': 12},
+                            ],
+                            'countries': [{'country': 'KR', 'count': 35}, {'country': 'US', 'count': 7}],
+                            'unique_listeners': {'today': 12, 'last_7_days': 80, 'last_30_days': 315},
+                            'unique_listeners_error': 0.0163,
+                        },
+                    ),
+                ],
+            ),
+            '400': OpenApiResponse(description='Bad Request'),
+            '404': OpenApiResponse(description='Not Found'),
+        }
+    ),
+    finalize=extend_schema(
+        summary="Finalize Track Upload",
+        description="Call after uploading the audio (and image) to the presigned URLs. The track is listed once it is finalized.",
+        request=None,
+        responses={
+            '200': OpenApiResponse(response=TrackSerializer, description='OK'),
+            '401': OpenApiResponse(description='Unauthorized'),
+            '403': OpenApiResponse(description='Permission Denied'),
+            '404': OpenApiResponse(description='Not Found'),
+            '409': OpenApiResponse(description='Audio Not Uploaded'),
+        }
+    ),
+    waveform=extend_schema(
+        summary="Get Track Waveform",
+        description="(min, max) peak pairs of int8, one per bucket. Send 'Accept: application/octet-stream' or '?format=binary' for the raw bytes.",
+        responses={
+            '200': OpenApiResponse(response=TrackWaveformSerializer, description='OK'),
+            '304': OpenApiResponse(description='Not Modified'),
+            '404': OpenApiResponse(description='Not Found'),
+        }
+    ),
+    stream=extend_schema(
+        summary="Stream Track Audio",
+        description="Honours a single 'Range: bytes=...' header. Redirects to the presigned URL when the media is not on local disk.",
+        parameters=[
+            OpenApiParameter("Range", OpenApiTypes.STR, OpenApiParameter.HEADER, description='e.g. bytes=1048576-'),
+        ],
+        responses={
+            '200': OpenApiResponse(description='OK'),
+            '206': OpenApiResponse(description='Partial Content'),
+            '302': OpenApiResponse(description='Found'),
+            '404': OpenApiResponse(description='Not Found'),
+            '416': OpenApiResponse(description='Requested Range Not Satisfiable'),
+        }
+    ),
+    manifest=extend_schema(
+        summary="Get Track HLS Playlist",
+        description="The HLS playlist of the audio, with presigned segment URLs. Only WAV uploads are packaged.",
+        responses={
+            (200, 'application/vnd.apple.mpegurl'): OpenApiResponse(response=OpenApiTypes.STR, description='OK'),
+            '404': OpenApiResponse(description='Not Found'),
+        }
+    ),
+    multipart=extend_schema(
+        summary="Start(POST)/Resume(PUT)/Abort(DELETE) Multipart Upload of Track Audio",
+        description="POST requires part_count, PUT requires upload_id and part_count, DELETE requires upload_id. "
+                    "Every part except the last one must be at least 5MB.",
+        request=TrackMultipartUploadService,
+        responses={
+            '200': OpenApiResponse(description='OK'),
+            '201': OpenApiResponse(description='Created'),
+            '204': OpenApiResponse(description='No Content'),
+            '400': OpenApiResponse(description='Bad Request'),
+            '401': OpenApiResponse(description='Unauthorized'),
+            '403': OpenApiResponse(description='Permission Denied'),
+            '404': OpenApiResponse(description='Not Found'),
+        }
+    ),
+    multipart_complete=extend_schema(
+        summary="Complete Multipart Upload of Track Audio",
+        request=TrackMultipartUploadService,
+        responses={
+            '200': OpenApiResponse(description='OK'),
+            '400': OpenApiResponse(description='Bad Request'),
+            '401': OpenApiResponse(description='Unauthorized'),
+            '403': OpenApiResponse(description='Permission Denied'),
+            '404': OpenApiResponse(description='Not Found'),
+        }
+    ),
 )
 
 track_search_schema=extend_schema_view(
@@ -126,4 +254,42 @@ track_search_schema=extend_schema_view(
             '404': OpenApiResponse(description='Not Found'),
         }
     ),
-)
\ No newline at end of file
+)
+charts_schema = extend_schema_view(
+    get=extend_schema(
+        summary="Get Charts",
+        description="'trending' ranks the tracks by their plays, likes, reposts and comments, each weighing half as "
+                    "much every two days. 'top' ranks them by all of them, whenever they happened.",
+        parameters=[
+            OpenApiParameter("kind", OpenApiTypes.STR, OpenApiParameter.QUERY, enum=['trending', 'top'], description="Defaults to 'trending'."),
+            OpenApiParameter("genre", OpenApiTypes.STR, OpenApiParameter.QUERY, description='A genre name. All genres if omitted.'),
+            OpenApiParameter("limit", OpenApiTypes.INT, OpenApiParameter.QUERY, description='Number of tracks, at most 100. Defaults to 50.'),
+        ],
+        responses={
+            '200': OpenApiResponse(response=SimpleTrackSerializer(many=True), description='OK'),
+            '400': OpenApiResponse(description='Bad Request'),
+        }
+    ),
+)
+
+plays_schema = extend_schema_view(
+    post=extend_schema(
+        summary="Send Plays",
+        description="Plays sent at once, e.g. after playing offline or through a set. 'played_at' must be within the "
+                    "last 7 days, and 'duration' is the time listened in milliseconds: a play counts from 30 seconds, "
+                    "or the whole track if shorter, and at most once per listener and track every 5 minutes, like "
+                    "those of the hit endpoint. Plays of tracks or sets which can't be seen (or don't contain the "
+                    "track) are skipped: 'skipped' holds their indexes. At most 100 plays per request.",
+        request=PlayEventSerializer(many=True),
+        responses={
+            '200': OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                description='OK',
+                examples=[
+                    OpenApiExample('Example', value={'accepted': 3, 'counted': 2, 'skipped': [3]}),
+                ],
+            ),
+            '400': OpenApiResponse(description='Bad Request'),
+        }
+    ),
+)
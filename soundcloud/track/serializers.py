@@ -1,26 +1,41 @@
-from django.core.cache import cache
+from django.conf import settings
 from django.db import transaction
-from django.db.models import F
+from django.db.models import Q, Sum
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
 from drf_haystack.serializers import HaystackSerializer, HaystackSerializerMixin
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers, status
+from rest_framework.exceptions import NotFound
 from rest_framework.validators import UniqueTogetherValidator
 from rest_framework.serializers import ValidationError
-from set.models import SetHit
-from soundcloud.utils import get_presigned_url, MediaUploadMixin
+from set.models import SetTrack
+from soundcloud.geoip import get_country
+from soundcloud.storage import MultipartUploadError, get_storage
+from soundcloud.utils import ConflictError, MediaUploadMixin, PresignedUrlListSerializer, PresignedUrlMixin, \
+    clear_missing_media
 from tag.models import Tag
 from tag.serializers import TagSerializer
-from track.models import Track, TrackHit
+from track.dedupe import dedupe_plays
+from track import charts, hll
+from track.models import Track, TrackCountryCount, TrackListenerSketch, TrackPlayRollup, TrackWaveform
+from track.plays import Play, record_plays
 from track.search_indexes import TrackIndex
+from track.tasks import process_track
+from utility.tasks import queue_image_derivatives
 from user.models import Follow
 from user.serializers import UserSerializer, SimpleUserSerializer
 from reaction.models import Like, Repost
-from soundcloud.utils import get_presigned_url, MediaUploadMixin
+from datetime import timedelta
+import numpy as np
+import functools, logging
 
+logger = logging.getLogger(__name__)
 
-class TrackSerializer(serializers.ModelSerializer):
+
+class TrackSerializer(PresignedUrlMixin, serializers.ModelSerializer):
 
     artist = UserSerializer(default=serializers.CurrentUserDefault(), read_only=True)
     audio = serializers.SerializerMethodField()
@@ -60,7 +75,16 @@ class TrackSerializer(serializers.ModelSerializer):
             'is_liked',
             'is_reposted',
             'is_followed',
+            'duration',
+            'sample_rate',
+            'channels',
+            'bitrate',
+            'loudness',
+            'loudness_gain',
+            'duplicate_of',
         )
+        presigned_fields = ('audio', 'image', )
+        list_serializer_class = PresignedUrlListSerializer
         extra_kwargs = {
             'permalink': {
                 'max_length': 255,
@@ -69,6 +93,13 @@ class TrackSerializer(serializers.ModelSerializer):
         }
         read_only_fields = (
             'created_at',
+            'duration',
+            'sample_rate',
+            'channels',
+            'bitrate',
+            'loudness',
+            'loudness_gain',
+            'duplicate_of',
         )
 
         # Since 'artist' is read-only field, ModelSerializer wouldn't generate UniqueTogetherValidator automatically.
@@ -81,10 +112,15 @@ class TrackSerializer(serializers.ModelSerializer):
         ]
 
     def get_audio(self, track):
-        return get_presigned_url(track.audio, 'get_object')
+        '''the url of the HLS playlist instead of the file with '?audio=hls', once the audio is packaged'''
+        request = self.context.get('request')
+        if track.segment_count and request is not None and request.query_params.get('audio') == 'hls':
+            return request.build_absolute_uri(reverse('tracks-manifest', kwargs={'track_id': track.id}))
+
+        return self.get_presigned_url(track.audio)
 
     def get_image(self, track):
-        return get_presigned_url(track.image, 'get_object')
+        return self.get_presigned_image_url(track, 'image')
     
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_is_liked(self, track):
@@ -150,25 +186,84 @@ class TrackMediaUploadSerializer(MediaUploadMixin, TrackSerializer):
 
     audio_extension = serializers.CharField(write_only=True)
     image_extension = serializers.CharField(write_only=True, required=False)
+    audio_part_count = serializers.IntegerField(write_only=True, required=False, min_value=1, max_value=10000)
     audio_presigned_url = serializers.SerializerMethodField()
     image_presigned_url = serializers.SerializerMethodField()
+    audio_multipart_upload = serializers.SerializerMethodField()
 
     class Meta(TrackSerializer.Meta):
         fields = TrackSerializer.Meta.fields + (
             'audio_extension',
             'image_extension',
+            'audio_part_count',
             'audio_presigned_url',
             'image_presigned_url',
+            'audio_multipart_upload',
         )
 
+    def get_audio_presigned_url(self, track):
+        if getattr(self, '_audio_part_count', None) is not None:
+            return None
+
+        return super().get_audio_presigned_url(track)
+
+    @extend_schema_field(OpenApiTypes.OBJECT)
+    def get_audio_multipart_upload(self, track):
+        '''the multipart upload started by 'save', if any'''
+        return getattr(self, '_audio_multipart_upload', None)
+
+    def create(self, validated_data):
+        return self._save_with_multipart_upload(super().create, validated_data)
+
+    def update(self, instance, validated_data):
+        return self._save_with_multipart_upload(functools.partial(super().update, instance), validated_data)
+
+    def _save_with_multipart_upload(self, save, validated_data):
+        '''
+        Saves the track and starts its multipart upload together. The track is rolled back if the upload can't be
+        started, so that its permalink stays free for a retry, and the upload is aborted if the track isn't saved.
+        '''
+        try:
+            with transaction.atomic():
+                track = save(validated_data)
+                self.start_multipart_upload(track, validated_data)
+        except Exception:
+            upload_id = getattr(self, '_audio_upload_id', None)
+            if upload_id is not None:
+                try:
+                    get_storage().abort_multipart_upload(track.audio, upload_id)
+                except Exception:
+                    logger.exception("Failed to abort the multipart upload %s of %s.", upload_id, track.audio)
+            raise
+
+        return track
+
+    def start_multipart_upload(self, track, validated_data):
+        '''starts a multipart upload instead of a single PUT when 'audio_part_count' is given with the audio'''
+        part_count = getattr(self, '_audio_part_count', None)
+        if part_count is None or 'audio' not in validated_data:
+            return
+
+        upload_id = self._audio_upload_id = get_storage().create_multipart_upload(track.audio)
+        self._audio_multipart_upload = {
+            'upload_id': upload_id,
+            'part_urls': get_part_urls(track.audio, upload_id, range(1, part_count+1)),
+        }
+
     def validate(self, data):
+        self._audio_part_count = data.pop('audio_part_count', None)
         data = super().validate(data)
         data = self.extensions_to_urls(data)
 
+        # a new audio file has to be finalized again
+        if 'audio' in data and data['audio'] != getattr(self.instance, 'audio', None):
+            data['status'] = Track.PENDING
+            data['segment_count'] = None
+
         return data
 
 
-class SimpleTrackSerializer(serializers.ModelSerializer):
+class SimpleTrackSerializer(PresignedUrlMixin, serializers.ModelSerializer):
     
     artist = SimpleUserSerializer(read_only=True)
     audio = serializers.SerializerMethodField()
@@ -182,6 +277,7 @@ class SimpleTrackSerializer(serializers.ModelSerializer):
     is_liked = serializers.SerializerMethodField(read_only=True)
     is_reposted = serializers.SerializerMethodField(read_only=True)
     is_followed = serializers.SerializerMethodField(read_only=True)
+    waveform_preview = serializers.SerializerMethodField()
 
     class Meta:
         model = Track
@@ -202,13 +298,17 @@ class SimpleTrackSerializer(serializers.ModelSerializer):
             'is_liked',
             'is_reposted',
             'is_followed',
+            'waveform_preview',
         )
+        presigned_fields = ('audio', 'image', )
+        image_sizes = {'image': 'medium'}
+        list_serializer_class = PresignedUrlListSerializer
 
     def get_audio(self, track):
-        return get_presigned_url(track.audio, 'get_object')
+        return self.get_presigned_url(track.audio)
 
     def get_image(self, track):
-        return get_presigned_url(track.image, 'get_object')
+        return self.get_presigned_image_url(track, 'image')
   
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_is_liked(self, track):
@@ -221,6 +321,14 @@ class SimpleTrackSerializer(serializers.ModelSerializer):
         else: 
             return False
 
+    @extend_schema_field({'type': 'array', 'items': {'type': 'integer'}, 'nullable': True})
+    def get_waveform_preview(self, track):
+        '''(min, max) pairs flattened, or null until the audio is processed'''
+        if track.waveform_preview is None:
+            return None
+
+        return np.frombuffer(track.waveform_preview, np.int8).tolist()
+
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_is_reposted(self, track):
         if self.context['request'].user.is_authenticated:
@@ -246,7 +354,7 @@ class SimpleTrackSerializer(serializers.ModelSerializer):
             return False
           
 
-class UserTrackSerializer(serializers.ModelSerializer):
+class UserTrackSerializer(PresignedUrlMixin, serializers.ModelSerializer):
 
     audio = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
@@ -273,12 +381,15 @@ class UserTrackSerializer(serializers.ModelSerializer):
             'tags',
             'is_private',
         )
+        presigned_fields = ('audio', 'image', )
+        image_sizes = {'image': 'medium'}
+        list_serializer_class = PresignedUrlListSerializer
 
     def get_audio(self, track):
-        return get_presigned_url(track.audio, 'get_object')
+        return self.get_presigned_url(track.audio)
 
     def get_image(self, track):
-        return get_presigned_url(track.image, 'get_object')
+        return self.get_presigned_image_url(track, 'image')
 
 
 class CommentTrackSerializer(serializers.ModelSerializer):
@@ -293,7 +404,7 @@ class CommentTrackSerializer(serializers.ModelSerializer):
         )
 
 
-class TrackInSetSerializer(serializers.ModelSerializer):
+class TrackInSetSerializer(PresignedUrlMixin, serializers.ModelSerializer):
     audio = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
     artist_permalink = serializers.CharField(source='artist.permalink')
@@ -317,13 +428,19 @@ class TrackInSetSerializer(serializers.ModelSerializer):
             'is_liked',
             'is_reposted',
             'play_count',
+            'duration',
+            'loudness',
+            'loudness_gain',
         )
+        presigned_fields = ('audio', 'image', )
+        image_sizes = {'image': 'small'}
+        list_serializer_class = PresignedUrlListSerializer
 
     def get_audio(self, track):
-        return get_presigned_url(track.audio, 'get_object')
+        return self.get_presigned_url(track.audio)
 
     def get_image(self, track):
-        return get_presigned_url(track.image, 'get_object')
+        return self.get_presigned_image_url(track, 'image')
 
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_is_liked(self, track):
@@ -348,44 +465,407 @@ class TrackInSetSerializer(serializers.ModelSerializer):
             return False 
 
 
-class TrackHitService(serializers.Serializer):
+class ClientIpMixin:
 
     def get_client_ip(self):
         '''get client's ip address from X_FORWARDED_FOR header'''
         xff = self.context.get('request').META.get('HTTP_X_FORWARDED_FOR')
-        ip = xff.split(',')[0] if xff else self.context.get('request').META.get('REMOTE_ADDR')
+        ip = xff.split(',')[0].strip() if xff else self.context.get('request').META.get('REMOTE_ADDR')
 
         return ip, bool(xff)
 
-    @transaction.atomic
+
+class TrackHitService(ClientIpMixin, serializers.Serializer):
     def execute(self):
         request_user = self.context.get('request').user
         user = request_user if request_user.is_authenticated else None
         track = self.instance
-        track_hit, _ = TrackHit.objects.get_or_create(user=user, track=track)
 
-        # cache key consists of (1) client's ip address (2) user id (3) track id
+        # the listener is identified by (1) client's ip address (2) user id
         client_ip, xff = self.get_client_ip()
-        key = f"{client_ip}_user_{getattr(user, 'id', None)}_track_{track.id}"
-
-        # update the track hit count only when the user didn't hit the track for last {timeout} seconds
-        if not cache.get(key):
-            track_hit.count = F('count') + 1
-            cache.set(key, True, timeout=300)
-        track_hit.save()
+        listener = f"{client_ip}_user_{getattr(user, 'id', None)}"
 
         # update the set hit if specified
         set_id = self.context.get('request').query_params.get('set_id')
         if set_id is not None:
-            set = get_object_or_404(track.sets, pk=set_id)
-            set_hit, _ = SetHit.objects.get_or_create(user=user, set=set)
-            set_hit.save()
+            set_id = get_object_or_404(track.sets.select_related(None).only('id'), pk=set_id).id
+
+        # count the play only when the listener didn't hit the track for last {PLAY_DEDUPE_SECONDS} seconds.
+        # this takes the listener's slot, so it comes after every check that can fail
+        counted, = dedupe_plays([(track.id, listener)])
+
+        # the plays are buffered and written to the database in bulk by 'flush_plays'
+        listener = f'user:{user.id}' if user is not None else f'ip:{client_ip}'
+        country = get_country(client_ip)
+        record_plays([Play(track.id, getattr(user, 'id', None), listener, set_id, timezone.now(), counted, country)])
 
         return status.HTTP_200_OK, { 'client_ip': client_ip, 'xff': xff }
 
 
+class PlayBatchService(ClientIpMixin, serializers.ListSerializer):
+    '''
+    Plays sent in bulk, e.g. by clients which played offline or through a set: the tracks and sets are checked in two
+    queries, and the plays deduplicated and buffered like those of the hit endpoint, in one batch.
+    Plays of tracks (or sets) which aren't visible or don't exist anymore are skipped, and their indexes returned in
+    'skipped' so that the client drops them instead of sending them again.
+    '''
+
+    def validate(self, data):
+        if not data:
+            raise ValidationError("At least one play is required.")
+        if len(data) > settings.PLAY_BATCH_SIZE:
+            raise ValidationError(f"At most {settings.PLAY_BATCH_SIZE} plays are accepted at once.")
+
+        return data
+
+    def get_visible_tracks(self, user):
+        track_ids = {play['track_id'] for play in self.validated_data}
+
+        return dict(
+            Track._base_manager
+            .exclude(~Q(artist=user) & (Q(is_private=True) | Q(status=Track.PENDING)))
+            .filter(id__in=track_ids)
+            .values_list('id', 'duration')
+        )
+
+    def get_visible_set_tracks(self, user):
+        plays = [play for play in self.validated_data if play['set_id'] is not None]
+        if not plays:
+            return set()
+
+        return set(
+            SetTrack.objects
+            .exclude(~Q(set__creator=user) & Q(set__is_private=True))
+            .filter(set_id__in={play['set_id'] for play in plays}, track_id__in={play['track_id'] for play in plays})
+            .values_list('set_id', 'track_id')
+        )
+
+    def is_listened(self, play, track_duration):
+        # a play counts once listened for 'PLAY_MIN_DURATION', or to the end of a shorter track
+        return play['duration'] >= min(settings.PLAY_MIN_DURATION, track_duration or settings.PLAY_MIN_DURATION)
+
+    def dedupe(self, plays, listener):
+        '''
+        Returns [whether the play counts]. Like for the hit endpoint, a listener counts once per track every
+        'PLAY_DEDUPE_SECONDS': within the batch by the time of the plays, and the recent ones against the plays
+        received lately (see track/dedupe.py).
+        '''
+        window = timedelta(seconds=settings.PLAY_DEDUPE_SECONDS)
+        counted, last_counted = [False] * len(plays), {}
+        for i in sorted(range(len(plays)), key=lambda i: plays[i]['played_at']):
+            last = last_counted.get(plays[i]['track_id'])
+            if last is None or plays[i]['played_at'] - last >= window:
+                counted[i] = True
+                last_counted[plays[i]['track_id']] = plays[i]['played_at']
+
+        since = timezone.now() - window
+        recent = [i for i, play in enumerate(plays) if counted[i] and play['played_at'] >= since]
+        if recent:
+            for i, is_counted in zip(recent, dedupe_plays([(plays[i]['track_id'], listener) for i in recent])):
+                counted[i] = is_counted
+
+        return counted
+
+    def execute(self):
+        request_user = self.context.get('request').user
+        user = request_user if request_user.is_authenticated else None
+        tracks = self.get_visible_tracks(user)
+        set_tracks = self.get_visible_set_tracks(user)
+
+        accepted, skipped = [], []
+        for index, play in enumerate(self.validated_data):
+            if play['track_id'] in tracks \
+                    and (play['set_id'] is None or (play['set_id'], play['track_id']) in set_tracks):
+                accepted.append(play)
+            else:
+                skipped.append(index)
+
+        # the same listener as for the hit endpoint, so that a play sent both ways is counted once
+        client_ip, _ = self.get_client_ip()
+        listener = f"{client_ip}_user_{getattr(user, 'id', None)}"
+        listened = [i for i, play in enumerate(accepted) if self.is_listened(play, tracks[play['track_id']])]
+        counted = self.dedupe([accepted[i] for i in listened], listener)
+        counted = {i for i, is_counted in zip(listened, counted) if is_counted}
+
+        listener = f'user:{user.id}' if user is not None else f'ip:{client_ip}'
+        country = get_country(client_ip)
+        record_plays([
+            Play(
+                play['track_id'], getattr(user, 'id', None), listener, play['set_id'], play['played_at'],
+                i in counted, country,
+            )
+            for i, play in enumerate(accepted)
+        ])
+
+        return status.HTTP_200_OK, {'accepted': len(accepted), 'counted': len(counted), 'skipped': skipped}
+
+
+class PlayEventSerializer(serializers.Serializer):
+
+    track_id = serializers.IntegerField()
+    set_id = serializers.IntegerField(required=False, allow_null=True, default=None)
+    played_at = serializers.DateTimeField()
+    duration = serializers.IntegerField(min_value=0)     # listened, in milliseconds
+
+    def validate_played_at(self, value):
+        now = timezone.now()
+        # a minute of clock skew is allowed
+        if value > now + timedelta(minutes=1):
+            raise ValidationError("Must not be in the future.")
+        if value < now - timedelta(seconds=settings.PLAY_BATCH_MAX_AGE):
+            raise ValidationError(f"Must be within the last {settings.PLAY_BATCH_MAX_AGE // 86400} days.")
+
+        return min(value, now)
+
+    class Meta:
+        list_serializer_class = PlayBatchService
+
+
+class ChartService(serializers.Serializer):
+    '''
+    The best tracks of a chart (see track/charts.py), globally or for a genre given by name.
+    '''
+
+    kind = serializers.ChoiceField(choices=charts.KINDS, default='trending')
+    genre = serializers.CharField(required=False, allow_blank=True)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.CHART_SIZE, default=50)
+
+    def execute(self):
+        count = self.validated_data['limit']
+        genre_id = None
+        if self.validated_data.get('genre'):
+            genre_id = Tag.objects.filter(name=self.validated_data['genre']).values_list('id', flat=True).first()
+            if genre_id is None:
+                return status.HTTP_200_OK, []
+
+        # a few more than needed, for the tracks which became private since they were charted
+        ids = charts.get_chart(self.validated_data['kind'], genre_id, count * 2)
+        tracks = Track.objects.filter(id__in=ids, is_private=False, status=Track.READY).in_bulk()
+        tracks = [tracks[id] for id in ids if id in tracks][:count]
+
+        return status.HTTP_200_OK, SimpleTrackSerializer(tracks, many=True, context=self.context).data
+
+
+class TrackStatsService(serializers.Serializer):
+    '''
+    Plays of the track per hour or day between 'from' and 'to', read from its rollups, its plays per country on the
+    days (UTC) from 'from' to 'to', and its unique listeners today and in the last 7 and 30 days, estimated from its
+    daily sketches.
+    '''
+
+    WINDOWS = {'today': 1, 'last_7_days': 7, 'last_30_days': 30}
+    STEPS = {TrackPlayRollup.HOUR: timedelta(hours=1), TrackPlayRollup.DAY: timedelta(days=1)}
+    DEFAULT_PERIODS = {TrackPlayRollup.HOUR: timedelta(days=1), TrackPlayRollup.DAY: timedelta(days=30)}
+    MAX_BUCKETS = {TrackPlayRollup.HOUR: 24 * 31, TrackPlayRollup.DAY: 366}
+
+    from_ = serializers.DateTimeField(required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+    to = serializers.DateTimeField(required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+    granularity = serializers.ChoiceField(choices=TrackPlayRollup.GRANULARITY_CHOICES, default=TrackPlayRollup.DAY)
+
+    def get_fields(self):
+        # 'from' is a keyword
+        fields = super().get_fields()
+        fields['from'] = fields.pop('from_')
+
+        return fields
+
+    def get_bucket(self, time, granularity):
+        time = time.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+        return time.replace(hour=0) if granularity == TrackPlayRollup.DAY else time
+
+    def validate(self, data):
+        granularity = data['granularity']
+        data['to'] = data.get('to') or timezone.now()
+        data['from'] = data.get('from') or data['to'] - self.DEFAULT_PERIODS[granularity]
+        if data['from'] > data['to']:
+            raise ValidationError("'from' must not be after 'to'.")
+
+        start = self.get_bucket(data['from'], granularity)
+        if (data['to'] - start) / self.STEPS[granularity] >= self.MAX_BUCKETS[granularity]:
+            raise ValidationError(f"At most {self.MAX_BUCKETS[granularity]} buckets of one {granularity} are returned.")
+
+        return data
+
+    def get_plays(self):
+        granularity = self.validated_data['granularity']
+        start, end = self.get_bucket(self.validated_data['from'], granularity), self.validated_data['to']
+        counts = dict(
+            TrackPlayRollup.objects
+            .filter(track=self.instance, granularity=granularity, start__gte=start, start__lte=end)
+            .values_list('start', 'count')
+        )
+
+        plays = []
+        step = self.STEPS[granularity]
+        while start <= end:
+            plays.append({'start': start, 'count': counts.get(start, 0)})
+            start += step
+
+        return plays
+
+    def get_countries(self):
+        start, end = self.validated_data['from'], self.validated_data['to']
+        countries = TrackCountryCount.objects \
+            .filter(track=self.instance, date__gte=start.astimezone(timezone.utc).date(),
+                    date__lte=end.astimezone(timezone.utc).date()) \
+            .values('country').annotate(total=Sum('count')).order_by('-total', 'country')
+
+        return [{'country': country['country'], 'count': country['total']} for country in countries]
+
+    def get_unique_listeners(self):
+        today = timezone.now().date()
+        days = max(self.WINDOWS.values())
+        sketches = TrackListenerSketch.objects \
+            .filter(track=self.instance, date__gt=today - timedelta(days=days)) \
+            .values_list('date', 'registers')
+        sketches = [(date, bytes(registers)) for date, registers in sketches]
+
+        unique_listeners = {}
+        for name, window in self.WINDOWS.items():
+            start = today - timedelta(days=window)
+            unique_listeners[name] = hll.estimate(hll.merge([registers for date, registers in sketches if date > start]))
+
+        return unique_listeners
+
+    def execute(self):
+        plays = self.get_plays()
+
+        return status.HTTP_200_OK, {
+            'from': self.validated_data['from'],
+            'to': self.validated_data['to'],
+            'granularity': self.validated_data['granularity'],
+            'play_count': sum(bucket['count'] for bucket in plays),
+            'plays': plays,
+            'countries': self.get_countries(),
+            'unique_listeners': self.get_unique_listeners(),
+            'unique_listeners_error': round(hll.STANDARD_ERROR, 4),
+        }
+
+
+class TrackFinalizeService(serializers.Serializer):
+    '''
+    Called after the audio is uploaded to its presigned URL: records the object and queues the processing.
+    '''
+
+    @transaction.atomic
+    def execute(self):
+        track = self.instance
+        head = get_storage().head(track.audio)
+        if head is None or head['size'] == 0:
+            raise ConflictError("Audio has not been uploaded yet.")
+
+        track.status = Track.READY
+        track.audio_size = head['size']
+        track.audio_etag = head['etag']
+        track.audio_content_type = head['content_type']
+        cleared = clear_missing_media(track, ['image'])
+        track.save(update_fields=['status', 'audio_size', 'audio_etag', 'audio_content_type'] + cleared)
+        process_track.delay(track.id)
+        queue_image_derivatives(track, ['image'])
+
+        return status.HTTP_200_OK, TrackSerializer(track, context=self.context).data
+
+
+class TrackWaveformSerializer(serializers.ModelSerializer):
+    bucket_count = serializers.IntegerField(read_only=True)
+    peaks = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TrackWaveform
+        fields = (
+            'bucket_count',
+            'peaks',
+        )
+
+    @extend_schema_field({'type': 'array', 'items': {'type': 'integer'}})
+    def get_peaks(self, waveform):
+        '''(min, max) pairs of int8 flattened'''
+        return np.frombuffer(waveform.peaks, np.int8).tolist()
+
+
+def get_part_urls(url, upload_id, part_numbers):
+    presigned_urls = get_storage().presign_parts(url, upload_id, part_numbers)
+
+    return [{'part_number': part_number, 'url': url} for part_number, url in presigned_urls.items()]
+
+
+class MultipartPartSerializer(serializers.Serializer):
+
+    part_number = serializers.IntegerField(min_value=1, max_value=10000)
+    etag = serializers.CharField()
+
+
+class TrackMultipartUploadService(serializers.Serializer):
+    '''
+    Uploads the track audio in parts, which can be sent in parallel and resumed after a failure.
+    Every part except the last one must be at least 5MB.
+    '''
+
+    part_count = serializers.IntegerField(min_value=1, max_value=10000, required=False)
+    upload_id = serializers.CharField(required=False)
+    parts = MultipartPartSerializer(many=True, required=False)
+
+    def _require(self, *field_names):
+        missing = [field_name for field_name in field_names if field_name not in self.validated_data]
+        if missing:
+            raise ValidationError({field_name: "This field is required." for field_name in missing})
+
+    def _call_storage(self, func, *args):
+        try:
+            return func(*args)
+        except MultipartUploadError as e:
+            if e.code == 'NoSuchUpload':
+                raise NotFound("Multipart upload does not exist.")
+            if e.code in ['InvalidPart', 'InvalidPartOrder', 'EntityTooSmall']:
+                raise ValidationError(f"Invalid parts: {e.code}")
+            raise
+
+    def create(self):
+        self._require('part_count')
+        track = self.instance
+        upload_id = self._call_storage(get_storage().create_multipart_upload, track.audio)
+
+        return status.HTTP_201_CREATED, {
+            'upload_id': upload_id,
+            'part_urls': get_part_urls(track.audio, upload_id, range(1, self.validated_data['part_count']+1)),
+        }
+
+    def resume(self):
+        '''re-signs the parts which have not been uploaded yet'''
+        self._require('upload_id', 'part_count')
+        track = self.instance
+        upload_id = self.validated_data['upload_id']
+        uploaded_parts = self._call_storage(get_storage().list_parts, track.audio, upload_id)
+        uploaded = {part['part_number'] for part in uploaded_parts}
+        remaining = [n for n in range(1, self.validated_data['part_count']+1) if n not in uploaded]
+
+        return status.HTTP_200_OK, {
+            'upload_id': upload_id,
+            'uploaded_parts': uploaded_parts,
+            'part_urls': get_part_urls(track.audio, upload_id, remaining),
+        }
+
+    def complete(self):
+        self._require('upload_id', 'parts')
+        track = self.instance
+        self._call_storage(get_storage().complete_multipart_upload, track.audio, self.validated_data['upload_id'], self.validated_data['parts'])
+
+        return status.HTTP_200_OK, "Multipart upload completed."
+
+    def delete(self):
+        self._require('upload_id')
+        track = self.instance
+        self._call_storage(get_storage().abort_multipart_upload, track.audio, self.validated_data['upload_id'])
+
+        return status.HTTP_204_NO_CONTENT, None
+
+
 class TrackSearchSerializer(HaystackSerializerMixin, TrackSerializer):
 
     class Meta(TrackSerializer.Meta):
         index_classes = [TrackIndex]
         search_fields = ('text', )
+
+    def prepare_presigned_urls(self, instances):
+        super().prepare_presigned_urls([getattr(result, 'object', result) for result in instances])
@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from set.models import Set
+from soundcloud.storage import get_storage
+from soundcloud.tasks import task
+from track import charts
+from track.audio import AudioDecodeError, LoudnessMeter, PeakMeter, compute_gain, decode, downsample_peaks, read_info
+from track.fingerprint import Fingerprinter, get_query, score_matches
+from track.models import Track, TrackFingerprint, TrackWaveform
+from track.packaging import package_audio
+from track.search_indexes import TrackIndex
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def analyze(path):
+    """
+    Decodes an audio a chunk at a time, feeding every chunk to each analysis.
+    """
+    audio = decode(path)
+    peak_meter, loudness_meter = PeakMeter(), LoudnessMeter(audio.sample_rate, audio.channels)
+    fingerprinter = Fingerprinter(audio.sample_rate)
+    for samples in audio.chunks:
+        peak_meter.update(samples)
+        loudness_meter.update(samples)
+        fingerprinter.update(samples)
+
+    return peak_meter, loudness_meter, fingerprinter
+
+
+def save_waveform(track, peak_meter):
+    peaks = peak_meter.get_peaks(settings.WAVEFORM_BUCKET_COUNT)
+    preview = downsample_peaks(peaks, settings.WAVEFORM_PREVIEW_BUCKET_COUNT)
+    TrackWaveform.objects.update_or_create(track=track, defaults={'peaks': peaks.tobytes()})
+    Track._base_manager.filter(id=track.id).update(waveform_preview=preview.tobytes())
+
+
+@transaction.atomic
+def save_audio_info(track, info, loudness_meter):
+    loudness = loudness_meter.get_loudness()
+    old_duration = Track._base_manager.select_for_update().values_list('duration', flat=True).get(id=track.id)
+    Track._base_manager.filter(id=track.id).update(
+        loudness=loudness,
+        loudness_gain=compute_gain(loudness_meter.peak, loudness),
+        **info,
+    )
+
+    # keep the total duration of the sets containing the track
+    delta = info['duration'] - (old_duration or 0)
+    if delta:
+        Set._base_manager.filter(tracks=track).update(duration=F('duration') + delta)
+
+
+def find_duplicate(track, hashes, offsets):
+    """
+    Returns the earliest ready track, visible to the artist of 'track', sharing enough aligned hashes with it.
+    """
+    query_hashes, query_offsets = get_query(hashes, offsets)
+    postings = {}
+    chunk = 500     # hashes per query, under the parameter limit of every backend
+    for start in range(0, len(query_hashes), chunk):
+        rows = TrackFingerprint.objects.filter(hash__in=query_hashes[start:start + chunk].tolist()) \
+            .exclude(track=track).values_list('hash', 'track_id', 'offset')
+        for hash, track_id, offset in rows:
+            postings.setdefault(hash, []).append((track_id, offset))
+
+    scores = score_matches(query_offsets.tolist(), [postings.get(hash, []) for hash in query_hashes.tolist()])
+    candidates = [track_id for track_id, score in scores.items() if score >= settings.FINGERPRINT_MIN_MATCHES]
+    if not candidates:
+        return None
+
+    return Track._base_manager.filter(id__in=candidates, status=Track.READY) \
+        .filter(Q(artist=track.artist_id) | Q(is_private=False)).order_by('id').first()
+
+
+@transaction.atomic
+def save_fingerprint(track, fingerprinter):
+    hashes, offsets = fingerprinter.get_fingerprint()
+    duplicate = find_duplicate(track, hashes, offsets)
+    Track._base_manager.filter(id=track.id).update(duplicate_of=duplicate)
+
+    TrackFingerprint.objects.filter(track=track).delete()
+    TrackFingerprint.objects.bulk_create(
+        [TrackFingerprint(hash=hash, track=track, offset=offset) for hash, offset in zip(hashes.tolist(), offsets.tolist())],
+        batch_size=1000,
+    )
+
+
+def save_package(track, path):
+    try:
+        segment_count = package_audio(track.audio, path)
+    except AudioDecodeError:
+        logger.warning("Failed to package the audio of track %s.", track.id, exc_info=True)
+        segment_count = None    # streamed whole
+
+    Track._base_manager.filter(id=track.id).update(segment_count=segment_count)
+
+
+@task
+def process_track(track_id):
+    """
+    Processes a track once its audio upload is finalized. The audio is decoded once, a chunk at a time, for every
+    analysis.
+    """
+    track = Track._base_manager.filter(id=track_id, status=Track.READY).first()
+    if track is None:
+        return
+
+    TrackIndex().update_object(track)
+
+    try:
+        with get_storage().local_copy(track.audio) as path:
+            info = read_info(path)
+            peak_meter, loudness_meter, fingerprinter = analyze(path)
+            save_package(track, path)
+    except AudioDecodeError:
+        logger.warning("Failed to decode the audio of track %s.", track.id, exc_info=True)
+        return
+
+    save_audio_info(track, info, loudness_meter)
+    save_waveform(track, peak_meter)
+    save_fingerprint(track, fingerprinter)
+
+
+@task
+def rebase_charts():
+    charts.rebase()
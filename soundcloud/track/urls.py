@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
-from track.views import TrackViewSet, TrackSearchAPIView
+from track.views import ChartAPIView, PlayAPIView, TrackViewSet, TrackSearchAPIView
 
 router = SimpleRouter(trailing_slash=False)
 router.register('tracks', TrackViewSet, basename='tracks')
@@ -8,4 +8,6 @@ router.register('tracks', TrackViewSet, basename='tracks')
 urlpatterns = [
     path('', include(router.urls)),
     path('search/tracks', TrackSearchAPIView.as_view(), name='search-tracks'),
+    path('charts', ChartAPIView.as_view(), name='charts'),
+    path('plays', PlayAPIView.as_view(), name='plays'),
 ]
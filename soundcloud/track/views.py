@@ -1,20 +1,35 @@
-from django.db.models import Q
+from contextlib import closing
+from django.core.cache import cache
+from django.db import transaction
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.http import HttpResponse, HttpResponseRedirect
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, extend_schema, extend_schema_view
 from drf_haystack.viewsets import HaystackGenericAPIView, HaystackViewSet
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.filters import OrderingFilter
-from rest_framework.generics import get_object_or_404
+from rest_framework.generics import GenericAPIView, get_object_or_404
 from rest_framework.response import Response
-from soundcloud.utils import CustomObjectPermissions
-from track.models import Track
-from track.serializers import SimpleTrackSerializer, TrackHitService, TrackSerializer, TrackMediaUploadSerializer, TrackSearchSerializer
-from track.schemas import tracks_viewset_schema, track_search_schema
-from user.models import User
-from user.serializers import SimpleUserSerializer
+from soundcloud.storage import get_storage
+from rest_framework.renderers import JSONRenderer
+from soundcloud.utils import BinaryRenderer, CustomObjectPermissions, delete_media, get_presigned_url, \
+    ranged_file_response
+from set.models import Set
+from track import charts, leaderboards
+from track.models import Track, TrackHit, TrackWaveform
+from track.packaging import get_package_urls, get_playlist_url, sign_playlist
+from track.serializers import ChartService, PlayEventSerializer, SimpleTrackSerializer, TrackFinalizeService, TrackHitService, TrackMultipartUploadService, \
+    TrackSerializer, TrackMediaUploadSerializer, TrackSearchSerializer, TrackStatsService, TrackWaveformSerializer
+from track.schemas import charts_schema, plays_schema, tracks_viewset_schema, track_search_schema
+from comment.models import Comment
+from user.models import User, UserStats
+from user.serializers import SimpleUserSerializer, TopListenersService
 from datetime import datetime
+import hashlib
 
 
 @tracks_viewset_schema
@@ -35,16 +50,32 @@ class TrackViewSet(viewsets.ModelViewSet):
             return SimpleUserSerializer
         if self.action in ['hit']:
             return TrackHitService
+        if self.action in ['finalize']:
+            return TrackFinalizeService
+        if self.action in ['stats']:
+            return TrackStatsService
+        if self.action in ['top_listeners']:
+            return TopListenersService
+        if self.action in ['waveform']:
+            return TrackWaveformSerializer
+        if self.action in ['multipart', 'multipart_complete']:
+            return TrackMultipartUploadService
 
         return TrackSerializer
 
     def get_queryset(self):
 
-        # hide private tracks in the queryset
+        # hide private tracks and unfinished uploads in the queryset
         user = self.request.user if self.request.user.is_authenticated else None
+
+        if self.action in ['stream', 'waveform', 'manifest', 'hit', 'stats', 'top_listeners']:
+            # every seek is a new request, so skip the annotations and prefetches
+            return Track._base_manager \
+                .exclude(~Q(artist=user) & (Q(is_private=True) | Q(status=Track.PENDING))) \
+                .only('id', 'artist', 'audio', 'is_private', 'status', 'audio_etag', 'segment_count')
+
         queryset = Track.objects \
-            .exclude(~Q(artist=user) & Q(is_private=True)) \
-            .prefetch_related('artist__followers', 'artist__owned_tracks')
+            .exclude(~Q(artist=user) & (Q(is_private=True) | Q(status=Track.PENDING)))
 
         if self.action in ['likers', 'reposters']:
             self.track = getattr(self, 'track', None) or get_object_or_404(queryset, pk=self.kwargs[self.lookup_url_kwarg])
@@ -56,6 +87,41 @@ class TrackViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        Set._base_manager.filter(tracks=instance).update(
+            track_count=F('track_count') - 1,
+            duration=F('duration') - (instance.duration or 0),
+        )
+
+        # the likes and comments of other users go with the track
+        UserStats.update_counts(instance.artist_id, track_count=-1)
+        content_type = ContentType.objects.get_for_model(Track)
+        UserStats.objects.filter(user__likes__content_type=content_type, user__likes__object_id=instance.id) \
+            .update(like_track_count=F('like_track_count') - 1)
+        comments = Comment.objects.filter(track=instance, writer=OuterRef('pk')).order_by().values('writer') \
+            .annotate(count=Count('id')).values('count')
+        UserStats.objects.filter(user__comments__track=instance) \
+            .update(comment_count=F('comment_count') - Subquery(comments))
+        # the plays of the track are taken off its artist's leaderboard
+        plays = [
+            (instance.id, instance.artist_id, user_id, -count)
+            for user_id, count in TrackHit.objects.filter(track=instance, count__gt=0).values_list('user_id', 'count')
+        ]
+        # the deleted instance loses its id
+        track_id, genre_id = instance.id, instance.genre_id
+        super().perform_destroy(instance)
+        delete_media([instance.audio, instance.image] + get_package_urls(instance.audio, instance.segment_count))
+        transaction.on_commit(lambda: charts.remove_track(track_id, genre_id))
+        transaction.on_commit(lambda: leaderboards.record_plays(plays))
+        transaction.on_commit(lambda: leaderboards.remove_track(track_id))
+
+    def perform_update(self, serializer):
+        genre_id = serializer.instance.genre_id
+        track = serializer.save()
+        if track.genre_id != genre_id:
+            charts.move_track(track.id, genre_id, track.genre_id)
+
     @action(detail=True)
     def likers(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
@@ -72,6 +138,108 @@ class TrackViewSet(viewsets.ModelViewSet):
 
         return Response(status=status, data=data)
 
+    @action(detail=True)
+    def stats(self, request, *args, **kwargs):
+        service = self.get_serializer(self.get_object(), data=request.query_params)
+        service.is_valid(raise_exception=True)
+        status, data = service.execute()
+
+        return Response(status=status, data=data)
+
+    @action(detail=True, url_path='top-listeners')
+    def top_listeners(self, request, *args, **kwargs):
+        service = self.get_serializer(self.get_object(), data=request.query_params)
+        service.is_valid(raise_exception=True)
+        status, data = service.execute()
+
+        return Response(status=status, data=data)
+
+    @action(detail=True, methods=['POST'])
+    def finalize(self, request, *args, **kwargs):
+        service = self.get_serializer(self.get_object())
+        status, data = service.execute()
+
+        return Response(status=status, data=data)
+
+    @action(detail=True)
+    def stream(self, request, *args, **kwargs):
+        track = self.get_object()
+        path = get_storage().get_local_path(track.audio)
+
+        # remote storages serve byte ranges by themselves
+        if path is None:
+            return HttpResponseRedirect(get_presigned_url(track.audio, 'get_object'))
+
+        try:
+            return ranged_file_response(request, path)
+        except FileNotFoundError:
+            raise NotFound("Audio file does not exist.")
+
+    @action(detail=True)
+    def manifest(self, request, *args, **kwargs):
+        track = self.get_object()
+        if not track.segment_count:
+            raise NotFound("Audio is not packaged.")
+
+        # the stored playlist only changes with the audio, but its segment urls are signed on every request
+        key = f'track-playlist:{track.id}:{track.audio_etag}'
+        playlist = cache.get(key)
+        if playlist is None:
+            with closing(get_storage().open(get_playlist_url(track.audio))) as f:
+                playlist = f.read().decode()
+            cache.set(key, playlist, 60 * 60 * 24)
+
+        # presigned download urls have at least an hour left
+        return HttpResponse(
+            sign_playlist(track.audio, playlist),
+            content_type='application/vnd.apple.mpegurl',
+            headers={'Cache-Control': 'private, max-age=3600'},
+        )
+
+    @action(detail=True, renderer_classes=(JSONRenderer, BinaryRenderer))
+    def waveform(self, request, *args, **kwargs):
+        track = self.get_object()
+        waveform = TrackWaveform.objects.filter(track=track).first()
+        if waveform is None:
+            raise NotFound("Waveform is not ready yet.")
+
+        # regenerated only when new audio is finalized, so revalidating after a week is plenty
+        peaks = bytes(waveform.peaks)
+        etag = f'"{hashlib.md5(peaks).hexdigest()}"'
+        headers = {
+            'ETag': etag,
+            'Cache-Control': f"{'private' if track.is_private else 'public'}, max-age=604800",
+        }
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=304, headers=headers)
+
+        if request.accepted_renderer.format == 'binary':
+            return Response(peaks, headers=headers)
+
+        return Response(self.get_serializer(waveform).data, headers=headers)
+
+    # POST: start, PUT: resume, DELETE: abort
+    @action(detail=True, methods=['POST', 'PUT', 'DELETE'], url_path='audio/multipart')
+    def multipart(self, request, *args, **kwargs):
+        service = self.get_serializer(self.get_object(), data=request.data)
+        service.is_valid(raise_exception=True)
+        methods = {
+            'POST': service.create,
+            'PUT': service.resume,
+            'DELETE': service.delete,
+        }
+        status, data = methods[request.method]()
+
+        return Response(status=status, data=data)
+
+    @action(detail=True, methods=['POST'], url_path='audio/multipart/complete')
+    def multipart_complete(self, request, *args, **kwargs):
+        service = self.get_serializer(self.get_object(), data=request.data)
+        service.is_valid(raise_exception=True)
+        status, data = service.complete()
+
+        return Response(status=status, data=data)
+
 
 @track_search_schema
 class TrackSearchAPIView(ListModelMixin, HaystackGenericAPIView):
@@ -107,3 +275,29 @@ class TrackSearchAPIView(ListModelMixin, HaystackGenericAPIView):
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
+
+
+@charts_schema
+class ChartAPIView(GenericAPIView):
+    serializer_class = SimpleTrackSerializer
+    permission_classes = (permissions.AllowAny, )
+
+    def get(self, request, *args, **kwargs):
+        service = ChartService(data=request.query_params, context=self.get_serializer_context())
+        service.is_valid(raise_exception=True)
+        status, data = service.execute()
+
+        return Response(status=status, data=data)
+
+
+@plays_schema
+class PlayAPIView(GenericAPIView):
+    serializer_class = PlayEventSerializer
+    permission_classes = (permissions.AllowAny, )
+
+    def post(self, request, *args, **kwargs):
+        service = self.get_serializer(data=request.data, many=True)
+        service.is_valid(raise_exception=True)
+        status, data = service.execute()
+
+        return Response(status=status, data=data)
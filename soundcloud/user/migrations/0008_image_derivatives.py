@@ -0,0 +1,23 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_user_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='image_header_derivatives',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='image_profile_derivatives',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def total(queryset, group_by, aggregate):
+    # a correlated subquery per counter, so that every row is filled by a single UPDATE
+    return Coalesce(Subquery(queryset.order_by().values(group_by).annotate(total=aggregate).values('total')), 0)
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    UserStats = apps.get_model('user', 'UserStats')
+    Follow = apps.get_model('user', 'Follow')
+    Track = apps.get_model('track', 'Track')
+    Comment = apps.get_model('comment', 'Comment')
+    Like = apps.get_model('reaction', 'Like')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    user_ids = User._base_manager.values_list('id', flat=True)
+    UserStats.objects.bulk_create([UserStats(user_id=user_id) for user_id in user_ids.iterator()], batch_size=1000)
+
+    counts = {
+        'follower_count': total(Follow.objects.filter(followee=OuterRef('pk')), 'followee', Count('id')),
+        'following_count': total(Follow.objects.filter(follower=OuterRef('pk')), 'follower', Count('id')),
+        'track_count': total(Track.objects.filter(artist=OuterRef('pk')), 'artist', Count('id')),
+        'comment_count': total(Comment.objects.filter(writer=OuterRef('pk')), 'writer', Count('id')),
+    }
+    # reactions can only exist once the content type does
+    content_type = ContentType.objects.filter(app_label='track', model='track').first()
+    if content_type is not None:
+        likes = Like.objects.filter(content_type=content_type, user=OuterRef('pk'))
+        counts['like_track_count'] = total(likes, 'user', Count('id'))
+
+    UserStats.objects.update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('comment', '0006_auto_20220106_0846'),
+        ('reaction', '0003_auto_20211226_1111'),
+        ('track', '0013_track_counts'),
+        ('user', '0008_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='user.user')),
+                ('follower_count', models.IntegerField(default=0)),
+                ('following_count', models.IntegerField(default=0)),
+                ('track_count', models.IntegerField(default=0)),
+                ('like_track_count', models.IntegerField(default=0)),
+                ('comment_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,5 @@
-from django.db import models
-from django.db.models import Count
+from django.db import models, transaction
+from django.db.models import Count, F
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, PermissionsMixin
 from django.conf import settings
@@ -11,6 +11,7 @@ class CustomUserManager(BaseUserManager):
 
     use_in_migrations = True
 
+    @transaction.atomic
     def _create_user(self, email, password, **extra_fields):
         if not email:
             raise ValueError('이메일을 설정해주세요.')
@@ -23,6 +24,7 @@ class CustomUserManager(BaseUserManager):
         else:
             user.set_password(password)
         user.save(using=self._db)
+        UserStats.objects.using(self._db).create(user=user)
 
         return user
 
@@ -51,7 +53,7 @@ class CustomUserManager(BaseUserManager):
 
     def get_queryset(self):
 
-        return super().get_queryset().prefetch_related('followers', 'followings', 'owned_tracks', 'comments')
+        return super().get_queryset().select_related('stats')
 
 
 class User(AbstractBaseUser, PermissionsMixin):
@@ -61,6 +63,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(max_length=100, unique=True)
     image_profile = models.URLField(null=True, unique=True)
     image_header = models.URLField(null=True, unique=True)
+    image_profile_derivatives = models.BooleanField(default=False)     # whether the resized copies of the images exist
+    image_header_derivatives = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     birthday = models.DateField(null=True)
     is_active = models.BooleanField(default=True)
@@ -84,4 +88,20 @@ class Follow(models.Model):
     follower = models.ForeignKey(get_user_model(), related_name="followings", on_delete=models.CASCADE)
     followee = models.ForeignKey(get_user_model(), related_name="followers", on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
+
+class UserStats(models.Model):
+    """
+    Counts shown with every user, kept up to date by the follow, track, like and comment write paths.
+    """
+
+    user = models.OneToOneField(User, related_name="stats", on_delete=models.CASCADE, primary_key=True)
+    follower_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+    track_count = models.IntegerField(default=0)
+    like_track_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+
+    @classmethod
+    def update_counts(cls, user_id, **deltas):
+        cls.objects.filter(user_id=user_id).update(**{name: F(name) + delta for name, delta in deltas.items()})
@@ -161,6 +161,19 @@ users_viewset_schema = extend_schema_view(
             404: OpenApiResponse(description='Not Found'),
         }
     ),
+    top_fans=extend_schema(
+        summary="Get User's Top Fans",
+        description="The users who played the user's tracks most, best first, each with its 'play_count' (counted plays "
+                    "of the user's tracks). The user is not among its own fans.",
+        parameters=[
+            OpenApiParameter("limit", OpenApiTypes.INT, OpenApiParameter.QUERY, description='Number of fans to return, at most 100. Defaults to 20.'),
+        ],
+        responses={
+            200: OpenApiResponse(response=SimpleUserSerializer(many=True), description='OK'),
+            400: OpenApiResponse(description='Bad Request'),
+            404: OpenApiResponse(description='Not Found'),
+        }
+    ),
 )
 
 users_self_schema = extend_schema_view(
@@ -189,6 +202,18 @@ users_self_schema = extend_schema_view(
     ),
 )
 
+users_self_finalize_schema = extend_schema_view(
+    post=extend_schema(
+        summary="Finalize My Image Uploads",
+        description="Call after uploading the images to the presigned URLs. The images which were not uploaded are removed.",
+        request=None,
+        responses={
+            200: OpenApiResponse(response=UserSerializer, description='OK'),
+            401: OpenApiResponse(description='Unauthorized'),
+        }
+    ),
+)
+
 users_follow_schema = extend_schema_view(
   post=extend_schema(
       summary="Follow User",
@@ -1,17 +1,21 @@
 from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import update_last_login
-from django.contrib.contenttypes.models import ContentType
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema_field
 from drf_haystack.serializers import HaystackSerializerMixin
 from rest_framework import serializers, status
 from rest_framework_jwt.settings import api_settings
-from soundcloud.utils import ConflictError, MediaUploadMixin, get_presigned_url
+from soundcloud.utils import ConflictError, MediaUploadMixin, PresignedUrlListSerializer, PresignedUrlMixin, \
+    clear_missing_media
+from track import leaderboards
 from datetime import date
-from track.models import Track
 from user.search_indexes import UserIndex
-from user.models import Follow
+from user.models import Follow, UserStats
+from utility.tasks import queue_image_derivatives
 
 # 토큰 사용을 위한 기본 세팅
 User = get_user_model()
@@ -118,16 +122,16 @@ class UserLoginSerializer(serializers.Serializer):
         update_last_login(None, self.instance)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(PresignedUrlMixin, serializers.ModelSerializer):
 
     image_profile = serializers.SerializerMethodField()
     image_header = serializers.SerializerMethodField()
     age = serializers.IntegerField(min_value=1, write_only=True, required=False)
-    follower_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
-    track_count = serializers.SerializerMethodField()
-    like_track_count = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
+    follower_count = serializers.IntegerField(source='stats.follower_count', read_only=True)
+    following_count = serializers.IntegerField(source='stats.following_count', read_only=True)
+    track_count = serializers.IntegerField(source='stats.track_count', read_only=True)
+    like_track_count = serializers.IntegerField(source='stats.like_track_count', read_only=True)
+    comment_count = serializers.IntegerField(source='stats.comment_count', read_only=True)
     is_followed = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -159,6 +163,8 @@ class UserSerializer(serializers.ModelSerializer):
             'path', #add
             'is_followed',
         )
+        presigned_fields = ('image_profile', 'image_header', )
+        list_serializer_class = PresignedUrlListSerializer
         extra_kwargs = {
             'permalink': {
                 'max_length': 25,
@@ -178,32 +184,10 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_image_profile(self, user):
-        return get_presigned_url(user.image_profile, 'get_object')
+        return self.get_presigned_image_url(user, 'image_profile')
 
     def get_image_header(self, user):
-        return get_presigned_url(user.image_header, 'get_object')
-
-    @extend_schema_field(OpenApiTypes.INT)
-    def get_follower_count(self, user):
-        return user.followers.count()
-
-    @extend_schema_field(OpenApiTypes.INT)
-    def get_following_count(self, user):
-        return user.followings.count()
-
-    @extend_schema_field(OpenApiTypes.INT)
-    def get_track_count(self, user):
-        return user.owned_tracks.count()
-
-    @extend_schema_field(OpenApiTypes.INT)
-    def get_like_track_count(self, user):
-        content_type = ContentType.objects.get_for_model(Track)
-
-        return user.likes.filter(content_type=content_type).count()
-
-    @extend_schema_field(OpenApiTypes.INT)
-    def get_comment_count(self, user):
-        return user.comments.count()
+        return self.get_presigned_image_url(user, 'image_header')
 
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_is_followed(self, user):
@@ -258,11 +242,11 @@ class UserMediaUploadSerializer(MediaUploadMixin, UserSerializer):
         return data
 
 
-class SimpleUserSerializer(serializers.ModelSerializer):
+class SimpleUserSerializer(PresignedUrlMixin, serializers.ModelSerializer):
 
     image_profile = serializers.SerializerMethodField()
-    follower_count = serializers.SerializerMethodField()
-    track_count = serializers.SerializerMethodField()
+    follower_count = serializers.IntegerField(source='stats.follower_count', read_only=True)
+    track_count = serializers.IntegerField(source='stats.track_count', read_only=True)
     is_followed = serializers.SerializerMethodField(read_only=True)
 
 
@@ -280,12 +264,18 @@ class SimpleUserSerializer(serializers.ModelSerializer):
             'last_name',
             'is_followed',
         )
+        presigned_fields = ('image_profile', )
+        image_sizes = {'image_profile': 'small'}
+        list_serializer_class = PresignedUrlListSerializer
 
     def get_image_profile(self, user):
-        return get_presigned_url(user.image_profile, 'get_object')
+        return self.get_presigned_image_url(user, 'image_profile')
 
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_is_followed(self, user):
+        # annotated when many users are loaded at once, see 'TopListenersService'
+        if hasattr(user, 'followed'):
+            return user.followed
         if self.context['request'].user.is_authenticated:
             follower = self.context['request'].user
             followee = user
@@ -297,17 +287,25 @@ class SimpleUserSerializer(serializers.ModelSerializer):
         else:
             return False
 
-    @extend_schema_field(OpenApiTypes.INT)
-    def get_follower_count(self, user):
-        return user.followers.count()
 
-    @extend_schema_field(OpenApiTypes.INT)
-    def get_track_count(self, user):
-        return user.owned_tracks.count()
+class UserFinalizeService(serializers.Serializer):
+    '''
+    Called after the images are uploaded to their presigned URLs: drops the images which never arrived.
+    '''
+
+    def execute(self):
+        user = self.instance
+        cleared = clear_missing_media(user, ['image_profile', 'image_header'])
+        if cleared:
+            user.save(update_fields=cleared)
+        queue_image_derivatives(user, ['image_profile', 'image_header'])
+
+        return status.HTTP_200_OK, UserSerializer(user, context=self.context).data
+
 
-      
 class UserFollowService(serializers.Serializer):
 
+    @transaction.atomic
     def create(self):
         follower = self.context['request'].user
         followee = self.context['user']
@@ -319,8 +317,11 @@ class UserFollowService(serializers.Serializer):
             raise serializers.ValidationError("Already followed.")
 
         Follow.objects.create(follower=follower, followee=followee)
+        UserStats.update_counts(follower.id, following_count=1)
+        UserStats.update_counts(followee.id, follower_count=1)
         return status.HTTP_201_CREATED, "Successful"
 
+    @transaction.atomic
     def delete(self):
         follower = self.context['request'].user
         followee = self.context['user']
@@ -330,13 +331,46 @@ class UserFollowService(serializers.Serializer):
         except Follow.DoesNotExist:
             raise serializers.ValidationError("Haven't followed yet.")
 
-        follow.delete()
+        deleted, _ = follow.delete()
+        if deleted:
+            UserStats.update_counts(follower.id, following_count=-1)
+            UserStats.update_counts(followee.id, follower_count=-1)
         return status.HTTP_204_NO_CONTENT, "Successful"
 
 
+class TopListenersService(serializers.Serializer):
+    '''
+    The users who played a track, or the tracks of an artist, most, read from its leaderboard (see
+    track/leaderboards.py) and loaded in one query.
+    '''
+
+    limit = serializers.IntegerField(min_value=1, max_value=settings.LEADERBOARD_SIZE, default=20)
+
+    def execute(self):
+        kind = 'artist' if isinstance(self.instance, User) else 'track'
+        board = leaderboards.get_board(kind, self.instance.id, self.validated_data['limit'])
+
+        users = User.objects.filter(id__in=[user_id for user_id, _ in board])
+        request_user = self.context['request'].user
+        if request_user.is_authenticated:
+            users = users.annotate(followed=Exists(Follow.objects.filter(follower=request_user, followee=OuterRef('pk'))))
+        users = users.in_bulk()
+
+        # the users deleted since their plays are skipped
+        board = [(users[user_id], plays) for user_id, plays in board if user_id in users]
+        data = SimpleUserSerializer([user for user, _ in board], many=True, context=self.context).data
+        for row, (_, plays) in zip(data, board):
+            row['play_count'] = plays
+
+        return status.HTTP_200_OK, data
+
+
 class UserSearchSerializer(HaystackSerializerMixin, UserSerializer):
 
     class Meta(UserSerializer.Meta):
         index_classes = [UserIndex]
         search_fields = ('text', )
 
+    def prepare_presigned_urls(self, instances):
+        super().prepare_presigned_urls([getattr(result, 'object', result) for result in instances])
+
@@ -71,20 +71,21 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
             return SimpleSetSerializer
         if self.action in ['comments']:
             return UserCommentSerializer
+        if self.action in ['top_fans']:
+            return TopListenersService
 
         return UserSerializer
 
     def get_queryset(self):
-        if self.action in ['retrieve', 'list']:
+        if self.action in ['retrieve', 'list', 'top_fans']:
             return User.objects.all()
 
         self.user = getattr(self, 'user', None) or get_object_or_404(User, pk=self.kwargs[self.lookup_url_kwarg])
         
-        # hide private tracks in the queryset
+        # hide private tracks and unfinished uploads in the queryset
         request_user = self.request.user if self.request.user.is_authenticated else None
         track_queryset = Track.objects \
-            .exclude(~Q(artist=request_user) & Q(is_private=True)) \
-            .prefetch_related('artist__followers', 'artist__owned_tracks')
+            .exclude(~Q(artist=request_user) & (Q(is_private=True) | Q(status=Track.PENDING)))
 
         # hide private sets in the queryset
         set_queryset = Set.objects \
@@ -157,6 +158,14 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     def comments(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @action(detail=True, url_path='top-fans')
+    def top_fans(self, request, *args, **kwargs):
+        service = self.get_serializer(self.get_object(), data=request.query_params)
+        service.is_valid(raise_exception=True)
+        status, data = service.execute()
+
+        return Response(status=status, data=data)
+
 
 @users_self_schema
 class UserSelfView(RetrieveUpdateAPIView):
@@ -176,6 +185,24 @@ class UserSelfView(RetrieveUpdateAPIView):
         return get_object_or_404(self.get_queryset(), pk=self.request.user.id)
 
 
+@users_self_finalize_schema
+class UserSelfFinalizeView(GenericAPIView):
+
+    serializer_class = UserFinalizeService
+    queryset = User.objects.all()
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def get_object(self):
+
+        return get_object_or_404(self.get_queryset(), pk=self.request.user.id)
+
+    def post(self, request, *args, **kwargs):
+        service = self.get_serializer(self.get_object())
+        status, data = service.execute()
+
+        return Response(status=status, data=data)
+
+
 @users_follow_schema
 class UserFollowView(GenericAPIView):
 
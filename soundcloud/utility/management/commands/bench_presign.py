@@ -0,0 +1,59 @@
+import boto3, time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from soundcloud.storage import S3Storage, get_storage
+from soundcloud.utils import MEDIA_PATHS, get_presigned_url, get_presigned_urls
+
+
+class Command(BaseCommand):
+    help = "Measures the per-URL cost of presigning media URLs (no network access is needed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=400, help="Number of URLs to sign in each run.")
+
+    def handle(self, *args, **options):
+        count = options['count']
+        storage = get_storage()
+        if not isinstance(storage, S3Storage):
+            self.stderr.write("MEDIA_STORAGE_BACKEND must be 'soundcloud.storage.S3Storage'.")
+            return
+
+        urls = [f"{MEDIA_PATHS['track']['audio']}track-{i}.mp3" for i in range(count)]
+
+        def legacy():
+            # a new boto3 client for every URL, as 'get_presigned_url' used to do
+            for url in urls:
+                boto3.client(
+                    's3',
+                    region_name=settings.S3_REGION_NAME,
+                    aws_access_key_id=settings.AWS_ACCESS_KEY,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+                ).generate_presigned_url(
+                    ClientMethod='get_object',
+                    Params={'Bucket': settings.S3_BUCKET_NAME, 'Key': url.replace(settings.S3_BASE_URL, '')},
+                    ExpiresIn=43200
+                )
+
+        def single():
+            storage.cache.clear()
+            for url in urls:
+                get_presigned_url(url, 'get_object')
+
+        def batch():
+            storage.cache.clear()
+            get_presigned_urls(urls, 'get_object')
+
+        def cached():
+            get_presigned_urls(urls, 'get_object')
+
+        get_presigned_url(urls[0], 'get_object')    # warm up the shared signer
+        for name, func in (
+            ('boto3 client per URL', legacy),
+            ('shared signer', single),
+            ('shared signer, batch', batch),
+            ('cached window', cached),
+        ):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{name:<24}{elapsed / count * 1e6:>12.1f} us/URL")
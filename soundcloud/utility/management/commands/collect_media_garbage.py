@@ -0,0 +1,76 @@
+from datetime import timedelta
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from soundcloud.images import get_original_url
+from soundcloud.storage import get_storage
+from soundcloud.utils import MEDIA_PATHS
+from track.packaging import get_source_url
+import itertools
+
+CHUNK_SIZE = 1000
+APP_MODELS = {
+    'track': 'track.Track',
+    'set': 'set.Set',
+    'user': 'user.User',
+}
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes media objects which no row refers to: media of deleted tracks, sets and users, replaced media "
+        "and failed uploads. Run it periodically, e.g. daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report the orphaned objects.")
+        parser.add_argument(
+            '--grace-hours', type=int, default=24,
+            help="Keep objects younger than this, whose rows may not be committed yet.",
+        )
+
+    def handle(self, *args, **options):
+        storage = get_storage()
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        total_count, total_size = 0, 0
+
+        for model_name, fields in MEDIA_PATHS.items():
+            model = apps.get_model(APP_MODELS[model_name])
+            for field_name, prefix in fields.items():
+                scanned, orphans = 0, []
+                for chunk in chunks(storage.list(storage.get_key(prefix)), CHUNK_SIZE):
+                    scanned += len(chunk)
+                    urls = {storage.get_url(item['key']): item for item in chunk if item['last_modified'] < cutoff}
+                    # derivatives and packaged segments live as long as their original
+                    originals = {url: get_source_url(get_original_url(url)) for url in urls}
+                    referenced = set(
+                        model._base_manager
+                        .filter(**{f'{field_name}__in': set(originals.values())})
+                        .values_list(field_name, flat=True)
+                    )
+                    orphaned = [url for url in urls if originals[url] not in referenced]
+                    if not dry_run:
+                        storage.delete(orphaned)
+                    orphans += [urls[url] for url in orphaned]
+
+                size = sum(item['size'] for item in orphans)
+                total_count, total_size = total_count + len(orphans), total_size + size
+                self.stdout.write(
+                    f"{model_name}.{field_name}: {scanned} objects scanned, "
+                    f"{len(orphans)} orphaned ({size / 1024 / 1024:.1f} MiB)"
+                )
+                if options['verbosity'] > 1:
+                    for item in orphans:
+                        self.stdout.write(f"  {item['key']}")
+
+        action = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(f"{action} {total_count} objects ({total_size / 1024 / 1024:.1f} MiB).")
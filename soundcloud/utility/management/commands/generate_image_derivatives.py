@@ -0,0 +1,26 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from utility.tasks import queue_image_derivatives
+
+IMAGE_FIELDS = {
+    'track.Track': ['image'],
+    'set.Set': ['image'],
+    'user.User': ['image_profile', 'image_header'],
+}
+
+
+class Command(BaseCommand):
+    help = "Queues the generation of image derivatives for every image which has none, e.g. images uploaded before derivatives existed."
+
+    def handle(self, *args, **options):
+        for model_label, field_names in IMAGE_FIELDS.items():
+            model = apps.get_model(model_label)
+            for field_name in field_names:
+                queryset = model._base_manager \
+                    .filter(**{f'{field_name}__isnull': False, f'{field_name}_derivatives': False}) \
+                    .only('pk', field_name, f'{field_name}_derivatives')
+                count = 0
+                for instance in queryset.iterator():
+                    queue_image_derivatives(instance, [field_name])
+                    count += 1
+                self.stdout.write(f"{model_label}.{field_name}: {count} images queued")
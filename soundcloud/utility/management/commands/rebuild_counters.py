@@ -0,0 +1,85 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from comment.models import Comment
+from reaction.models import Like, Repost
+from set.models import Set, SetTrack
+from track.models import Track, TrackHit, TrackPlayShard
+from user.models import Follow, User, UserStats
+
+
+def total(queryset, group_by, aggregate):
+    # a correlated subquery per counter, so that a whole batch is rebuilt by a single UPDATE
+    return Coalesce(Subquery(queryset.order_by().values(group_by).annotate(total=aggregate).values('total')), 0)
+
+
+def reaction_total(model, target_model):
+    content_type = ContentType.objects.get_for_model(target_model)
+
+    return total(model.objects.filter(content_type=content_type, object_id=OuterRef('pk')), 'object_id', Count('id'))
+
+
+def get_counts():
+    """
+    Returns {model: {counter field: expression computing it from the related rows}}.
+    """
+    return {
+        Track: {
+            'play_count': total(TrackHit.objects.filter(track=OuterRef('pk')), 'track', Sum('count'))
+                          + total(TrackPlayShard.objects.filter(track=OuterRef('pk')), 'track', Sum('count')),
+            'like_count': reaction_total(Like, Track),
+            'repost_count': reaction_total(Repost, Track),
+            'comment_count': total(Comment.objects.filter(track=OuterRef('pk')), 'track', Count('id')),
+        },
+        Set: {
+            'duration': total(SetTrack.objects.filter(set=OuterRef('pk')), 'set', Sum('track__duration')),
+            'track_count': total(SetTrack.objects.filter(set=OuterRef('pk')), 'set', Count('id')),
+            'like_count': reaction_total(Like, Set),
+            'repost_count': reaction_total(Repost, Set),
+        },
+        UserStats: {
+            'follower_count': total(Follow.objects.filter(followee=OuterRef('pk')), 'followee', Count('id')),
+            'following_count': total(Follow.objects.filter(follower=OuterRef('pk')), 'follower', Count('id')),
+            'track_count': total(Track._base_manager.filter(artist=OuterRef('pk')), 'artist', Count('id')),
+            'like_track_count': total(
+                Like.objects.filter(content_type=ContentType.objects.get_for_model(Track), user=OuterRef('pk')),
+                'user', Count('id'),
+            ),
+            'comment_count': total(Comment.objects.filter(writer=OuterRef('pk')), 'writer', Count('id')),
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "Recomputes the stored counters from the related rows, e.g. after rows were deleted by a cascade."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows updated per statement.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # e.g. users created without 'User.objects.create_user'
+        missing = User._base_manager.filter(stats__isnull=True).values_list('id', flat=True)
+        created = UserStats.objects.bulk_create([UserStats(user_id=user_id) for user_id in missing], batch_size=batch_size)
+        self.stdout.write(f"{UserStats._meta.label}: {len(created)} rows created")
+
+        for model, counts in get_counts().items():
+            queryset = model._base_manager.order_by()
+            # only the rows whose counters drifted are written
+            drifted = Q()
+            for name in counts:
+                drifted |= ~Q(**{name: F(f'rebuilt_{name}')})
+            queryset = queryset.annotate(**{f'rebuilt_{name}': expression for name, expression in counts.items()})
+
+            ids = model._base_manager.order_by('pk').values_list('pk', flat=True)
+            updated, start = 0, 0
+            while True:
+                batch = list(ids.filter(pk__gt=start)[:batch_size])
+                if not batch:
+                    break
+                updated += queryset.filter(pk__gte=batch[0], pk__lte=batch[-1]).filter(drifted).update(**counts)
+                start = batch[-1]
+
+            self.stdout.write(f"{model._meta.label}: {updated} rows updated")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import autodiscover_modules
+from soundcloud import tasks
+
+
+class Command(BaseCommand):
+    help = "Runs the background tasks queued by the API (see soundcloud/tasks.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        self.stdout.write(f"Registered tasks: {', '.join(sorted(tasks.registry))}")
+        tasks.work(burst=options['burst'])
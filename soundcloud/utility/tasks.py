@@ -0,0 +1,22 @@
+from django.apps import apps
+from soundcloud.images import generate_derivatives
+from soundcloud.tasks import task
+
+
+@task
+def generate_image_derivatives(model_label, pk, field_name):
+    model = apps.get_model(model_label)
+    url = model._base_manager.filter(pk=pk).values_list(field_name, flat=True).first()
+    if url is None:
+        return
+
+    generate_derivatives(url)
+
+    # unless the image has been replaced in the meantime
+    model._base_manager.filter(pk=pk, **{field_name: url}).update(**{f'{field_name}_derivatives': True})
+
+
+def queue_image_derivatives(instance, field_names):
+    for field_name in field_names:
+        if getattr(instance, field_name) is not None and not getattr(instance, f'{field_name}_derivatives'):
+            generate_image_derivatives.delay(instance._meta.label, instance.pk, field_name)
@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import path
-from .views import ResolveView
+from urllib.parse import urlparse
+from .views import LocalMediaView, ResolveView
 
 
 urlpatterns = [
     path('resolve', ResolveView.as_view(), name='resolve'),  # /resolve
+    path(urlparse(settings.MEDIA_URL).path.lstrip('/') + '<path:key>', LocalMediaView.as_view(), name='media'),  # /media/{key}
 ]
@@ -1,8 +1,14 @@
 from django.contrib.auth import get_user_model
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from utility.schemas import *
+from soundcloud.storage import LocalStorage, MultipartUploadError, get_storage
+from soundcloud.utils import ranged_file_response
 from utility.serializers import ResolveService
 
 User = get_user_model()
@@ -22,3 +28,49 @@ class ResolveView(APIView):
         service = ResolveService(context={'request': request})
         url = service.execute()
         return Response(status=status.HTTP_302_FOUND, headers={'Location': url})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class LocalMediaView(View):
+    """
+    Serves (GET/HEAD) and receives (PUT) the media of 'LocalStorage' through its signed URLs.
+    """
+
+    http_method_names = ['get', 'head', 'put']
+
+    def dispatch(self, request, key):
+        storage = get_storage()
+        if not isinstance(storage, LocalStorage):
+            raise Http404
+
+        params = {name: request.GET[name] for name in ('partNumber', 'uploadId') if name in request.GET}
+        if not storage.verify(request.method, key, request.GET.get('expires'), request.GET.get('signature'), params):
+            return HttpResponseForbidden()
+
+        try:
+            self.path = storage.get_path(key)
+        except ValueError:
+            raise Http404
+        self.storage, self.url, self.params = storage, storage.get_url(key), params
+
+        return super().dispatch(request, key)
+
+    def get(self, request, key):
+        try:
+            return ranged_file_response(request, self.path)
+        except (FileNotFoundError, IsADirectoryError):
+            raise Http404
+
+    def put(self, request, key):
+        if self.params:
+            try:
+                etag = self.storage.save_part(self.url, self.params.get('uploadId'), self.params.get('partNumber'), request)
+            except MultipartUploadError:
+                raise Http404
+        else:
+            etag = self.storage.save(self.url, request)
+
+        response = HttpResponse()
+        response['ETag'] = etag
+
+        return response